@@ -0,0 +1,309 @@
+import gurobipy as gp
+
+from datetime import date
+import io
+import math
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import contextlib
+import subprocess
+
+import main
+import maxB
+import fixing
+import ordering
+import local_search
+import profiling
+import synthetic
+import separation
+
+# Benchmarks for the pre-solve and separation hot paths, on synthetic instances (see synthetic.py), so that a
+#   change can be timed before and after without running Gurobi on the real instances. Groups:
+#   reachable    fixing.reachable_population (BFS in G[S]) and fixing.reachable_populations (all suffixes at once)
+#   ordering     ordering.find_ordering, for orders decreasing and B_decreasing
+#   fixing       every fixing.do_*Fixing routine, on a freshly built model (the build is not timed)
+#   separation   separation.find_fischetti_separator and separation.find_lcuts (the body of lcut separation),
+#                on synthetic integer solutions: random plans with some vertices moved to other districts
+#   build        main.build_model for each base, contiguity, and builder (no fixing), without solving
+#   Each benchmark runs `repeats` times, and records its times (in seconds), the peak RSS (in MB), and the value
+#   it returns (like the number of fixings), which should not change when only the speed does.
+
+groups = ['reachable', 'ordering', 'fixing', 'separation', 'build']
+
+repeats = 3
+hess_max_nodes = 500 # hess models have n^2 variables (and shir n*|A| more), so larger instances skip them
+num_solutions = 5 # synthetic integer solutions per instance
+scatter_fraction = 0.02 # fraction of vertices moved to other districts in each solution
+
+
+# One instance: graph of the given kind and size, with k and L,U chosen as in main.py (1% deviation)
+def make_instance(kind, size, seed):
+    graph = synthetic.generate(kind, size, seed)
+    population = list(graph.pop)
+    k = max(2, round(graph.n ** 0.5 / 4)) # about 40 (county scale) to 280 (tract scale) vertices per district
+    deviation = 0.01
+    L = math.ceil((1-deviation/2)*sum(population)/k)
+    U = math.floor((1+deviation/2)*sum(population)/k)
+    return { 'name' : kind + '-' + str(size), 'kind' : kind, 'size' : size, 'seed' : seed,
+             'graph' : graph, 'population' : population, 'k' : k, 'L' : L, 'U' : U }
+
+
+def describe(instance):
+    description = { key : instance[key] for key in ['kind', 'size', 'seed', 'k', 'L', 'U'] }
+    description['n'] = instance['graph'].n
+    description['m'] = instance['graph'].m
+    return description
+
+
+# The same position-weighted checksum before and after a change means the same ordering
+def checksum(values):
+    return sum( (p+1) * int(v) for (p,v) in enumerate(values) ) % (2**31-1)
+
+
+# Runs setup() (not timed) and then each step(state) in turn (timed), repeats times. Each step is a pair
+#   (name, step), and its times, peak RSS, and value (from the last repeat) are recorded in results[name]
+def measure(results, instance, steps, setup=lambda: None):
+    records = [ { 'instance' : describe(instance), 'times' : list(), 'rss' : list() } for (name, step) in steps ]
+    for r in range(repeats):
+        state = setup()
+        for ((name, step), record) in zip(steps, records):
+            profiling.reset_peak_rss()
+            start = time.perf_counter()
+            record['value'] = step(state)
+            record['times'].append(time.perf_counter() - start)
+            record['rss'].append(profiling.peak_rss())
+        state = None
+    for ((name, step), record) in zip(steps, records):
+        record['min'] = min(record['times'])
+        record['median'] = statistics.median(record['times'])
+        record['rss'] = None if None in record['rss'] else max(record['rss'])
+        results[name] = record
+        print("{0:66} {1:10.4f} s  {2}".format(name, record['min'], record['value']), flush=True)
+
+
+# the set B of order B_decreasing, as ordering.solve_maxB_problem finds it (without the MIP polish)
+def find_B(instance):
+    bins = maxB.solve(instance['graph'], instance['k'], instance['L']-1)
+    return [ i for i in instance['graph'].nodes if bins[i] >= 0 ]
+
+
+def vertex_ordering(instance):
+    if 'ordering' not in instance:
+        instance['B'] = find_B(instance)
+        instance['ordering'] = ordering.find_ordering('B_decreasing', instance['B'], instance['graph'], instance['population'])
+    return instance['ordering']
+
+
+# the model of main.py for this base, contiguity, and builder, without fixing (and without its printing).
+#   With symmetry orbitope, the orbitope follows the B_decreasing ordering, like the fixing of vertex_ordering
+def build(instance, base, contiguity, builder, symmetry='default'):
+    config = dict(main.default_config)
+    config.update({ 'base' : base, 'contiguity' : contiguity, 'builder' : builder, 'fixing' : False,
+                    'symmetry' : symmetry, 'order' : 'B_decreasing' if symmetry == 'orbitope' else 'none', 'extended' : True })
+    result = { 'run' : 'benchmark' }
+    with contextlib.redirect_stdout(io.StringIO()):
+        (m, B, order) = main.build_model(config, instance['graph'], instance['population'], instance['L'], instance['U'], instance['k'], result)
+    return m
+
+
+def bench_reachable(results, instance):
+    (graph, population) = (instance['graph'], instance['population'])
+    order = vertex_ordering(instance)
+    positions = range(0, graph.n, max(1, graph.n // 20))
+
+    # G[S] for S = { ordering[p], ..., ordering[n-1] }, as in L-fixing
+    def setup():
+        queries = list()
+        for p in positions:
+            S = [ False for i in graph.nodes ]
+            for v in order[p:]:
+                S[v] = True
+            queries.append((S, order[p]))
+        return queries
+
+    prefix = 'reachable/' + instance['name'] + '/'
+    measure(results, instance, [ (prefix + 'reachable_population', lambda queries:
+                                    sum( fixing.reachable_population(graph, population, S, v) for (S, v) in queries )) ], setup)
+    measure(results, instance, [ (prefix + 'reachable_populations', lambda state:
+                                    checksum(fixing.reachable_populations(graph, population, order))) ])
+
+
+def bench_ordering(results, instance):
+    (graph, population) = (instance['graph'], instance['population'])
+    vertex_ordering(instance)
+    prefix = 'ordering/' + instance['name'] + '/'
+    for order in ['decreasing', 'B_decreasing']:
+        B = instance['B'] if order == 'B_decreasing' else list()
+        measure(results, instance, [ (prefix + order, lambda state: checksum(ordering.find_ordering(order, B, graph, population))) ])
+
+
+def bench_fixing(results, instance):
+    (graph, population, L, U, k) = (instance['graph'], instance['population'], instance['L'], instance['U'], instance['k'])
+    order = vertex_ordering(instance)
+    position = ordering.construct_position(order)
+    prefix = 'fixing/' + instance['name'] + '/'
+
+    # in the order of main.py: with contiguity (lcut, which has the R variables of labeling), then without
+    #   (for labeling, main.py only fixes the model with the orbitope)
+    if graph.n <= hess_max_nodes:
+        measure(results, instance, [
+            (prefix + 'do_Hess_DFixing', lambda m: fixing.do_Hess_DFixing(m, graph, position)),
+            (prefix + 'do_Hess_LFixing', lambda m: fixing.do_Hess_LFixing(m, graph, population, L, order)),
+            (prefix + 'do_Hess_UFixing', lambda m: fixing.do_Hess_UFixing(m, graph, population, U, order)),
+            (prefix + 'do_Hess_ZFixing', lambda m: fixing.do_Hess_ZFixing(m, graph)) ],
+            setup=lambda: build(instance, 'hess', 'lcut', 'matrix'))
+        measure(results, instance, [
+            (prefix + 'do_Hess_LFixing_without_Contiguity', lambda m: fixing.do_Hess_LFixing_without_Contiguity(m, graph, population, L, order)),
+            (prefix + 'do_Hess_UFixing_without_Contiguity', lambda m: fixing.do_Hess_UFixing_without_Contiguity(m, graph, population, U)) ],
+            setup=lambda: build(instance, 'hess', 'none', 'matrix'))
+
+    measure(results, instance, [
+        (prefix + 'do_Labeling_DFixing', lambda m: fixing.do_Labeling_DFixing(m, graph, order, k)),
+        (prefix + 'do_Labeling_LFixing', lambda m: fixing.do_Labeling_LFixing(m, graph, population, L, order, k)),
+        (prefix + 'do_Labeling_UFixing', lambda m: list(fixing.do_Labeling_UFixing(m, graph, population, U, order, k))),
+        (prefix + 'do_Labeling_ZFixing', lambda m: fixing.do_Labeling_ZFixing(m, graph, k)) ],
+        setup=lambda: build(instance, 'labeling', 'lcut', 'matrix'))
+    measure(results, instance, [
+        (prefix + 'do_Labeling_LFixing_without_Contiguity', lambda m: fixing.do_Labeling_LFixing_without_Contiguity(m, graph, population, L, order, k)) ],
+        setup=lambda: build(instance, 'labeling', 'none', 'matrix', 'orbitope'))
+
+
+# Synthetic integer solutions, as labels of the vertices: scattered random plans, with disconnected districts
+#   like those lcut separation sees at MIPSOL (they are not incumbents recorded from a solve)
+def synthetic_solutions(instance):
+    if 'solutions' not in instance:
+        rng = random.Random(instance['seed'])
+        (graph, k) = (instance['graph'], instance['k'])
+        instance['solutions'] = [ synthetic.scatter(local_search.random_plan(graph, k, rng), k, scatter_fraction, rng) for s in range(num_solutions) ]
+    return instance['solutions']
+
+
+# xval of a solution, as given by cbGetSolution. For hess, the district with label j is centered at its smallest
+#   vertex, and only the columns of the centers are given (besides the diagonal), to keep it O(nk)
+def solution_values(graph, k, base, label):
+    if base == 'labeling':
+        return { (v,j) : 1.0 if label[v] == j else 0.0 for v in graph.nodes for j in range(k) }
+    center = dict()
+    for v in graph.nodes:
+        center.setdefault(label[v], v)
+    xval = { (v,v) : 0.0 for v in graph.nodes }
+    for c in center.values():
+        for v in graph.nodes:
+            xval[v,c] = 1.0 if center[label[v]] == c else 0.0
+    return xval
+
+
+def bench_separation(results, instance):
+    (graph, population, U, k) = (instance['graph'], instance['population'], instance['U'], instance['k'])
+    solutions = synthetic_solutions(instance)
+    prefix = 'separation/' + instance['name'] + '/'
+
+    # the (component, b) pairs that find_lcuts separates: b is in the largest component of its district
+    pairs = list()
+    for label in solutions:
+        for (j, components) in separation.district_components(graph, label).items():
+            largest = max(components, key=lambda component: sum(population[v] for v in component))
+            pairs.extend( (component, largest[0]) for component in components if component is not largest )
+    measure(results, instance, [ (prefix + 'find_fischetti_separator', lambda state:
+                                    sum( len(separation.find_fischetti_separator(graph, component, b)) for (component, b) in pairs )) ])
+
+    for base in ['hess', 'labeling']:
+        xvals = [ solution_values(graph, k, base, label) for label in solutions ]
+        measure(results, instance, [ (prefix + 'find_lcuts_' + base, lambda state:
+                                        lcut_counts([ separation.find_lcuts(graph, population, U, base, k, xval) for xval in xvals ])) ])
+
+
+# number of cuts, and their total size, of the cuts found for each solution
+def lcut_counts(cuts_per_solution):
+    return [ sum(len(cuts) for cuts in cuts_per_solution),
+             sum(len(C) for cuts in cuts_per_solution for (a,b,j,C) in cuts) ]
+
+
+def bench_build(results, instance):
+    prefix = 'build/' + instance['name'] + '/'
+    for base in ['hess', 'labeling']:
+        if base == 'hess' and instance['graph'].n > hess_max_nodes:
+            continue
+        for contiguity in ['none', 'lcut', 'scf', 'shir']:
+            for builder in ['quicksum', 'matrix']:
+                def step(state):
+                    m = build(instance, base, contiguity, builder)
+                    size = [m.NumVars, m.NumConstrs]
+                    m.dispose()
+                    return size
+                measure(results, instance, [ (prefix + base + '/' + contiguity + '/' + builder, step) ])
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(kinds, sizes, selected_groups, seed):
+    results = dict()
+    benchmarks = { 'reachable' : bench_reachable, 'ordering' : bench_ordering, 'fixing' : bench_fixing,
+                   'separation' : bench_separation, 'build' : bench_build }
+    for kind in kinds:
+        for size in sizes:
+            instance = make_instance(kind, size, seed)
+            print("Instance", instance['name'], ": n =", instance['graph'].n, ", m =", instance['graph'].m,
+                  ", k =", instance['k'], ", L =", instance['L'], ", U =", instance['U'], flush=True)
+            for group in groups:
+                if group in selected_groups:
+                    benchmarks[group](results, instance)
+    return results
+
+
+# Compares the min times of two output files, benchmark by benchmark. Ratios beyond 1 +/- threshold are marked,
+#   and so are benchmarks whose values differ (the change did more than change the speed)
+def compare(before_filename, after_filename, threshold):
+    with open(before_filename, 'r') as f:
+        before = json.load(f)['benchmarks']
+    with open(after_filename, 'r') as f:
+        after = json.load(f)['benchmarks']
+
+    print("{0:66} {1:>10} {2:>10} {3:>8}".format('benchmark', 'before', 'after', 'ratio'))
+    for name in sorted(set(before) & set(after)):
+        ratio = after[name]['min'] / before[name]['min'] if before[name]['min'] > 0 else float('inf')
+        mark = 'faster' if ratio < 1-threshold else 'slower' if ratio > 1+threshold else ''
+        if before[name]['value'] != after[name]['value']:
+            mark += ' (value differs: ' + str(before[name]['value']) + ' -> ' + str(after[name]['value']) + ')'
+        print("{0:66} {1:10.4f} {2:10.4f} {3:8.2f}  {4}".format(name, before[name]['min'], after[name]['min'], ratio, mark))
+    for name in sorted(set(before) ^ set(after)):
+        print("{0:66} only in {1}".format(name, before_filename if name in before else after_filename))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the pre-solve and separation routines on synthetic instances.")
+    parser.add_argument('--kinds', nargs='+', choices=synthetic.kinds, default=synthetic.kinds, help="kinds of synthetic graphs (default: all)")
+    parser.add_argument('--sizes', nargs='+', type=int, default=[100, 500, 1000, 2000, 5000], help="approximate numbers of vertices (default: 100 500 1000 2000 5000)")
+    parser.add_argument('--groups', nargs='+', choices=groups, default=groups, help="groups of benchmarks to run (default: all)")
+    parser.add_argument('--repeats', type=int, default=repeats, help="times to run each benchmark (default: %(default)s)")
+    parser.add_argument('--hess-max-nodes', type=int, default=hess_max_nodes, help="largest instance for hess models (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic instances (default: 0)")
+    parser.add_argument('--output', help="write the results to this json file")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="compare two output files instead of running benchmarks")
+    parser.add_argument('--threshold', type=float, default=0.1, help="with --compare, mark ratios beyond 1 +/- threshold (default: 0.1)")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare[0], args.compare[1], args.threshold)
+        sys.exit(0)
+
+    repeats = args.repeats
+    hess_max_nodes = args.hess_max_nodes
+    meta = { 'date' : str(date.today()), 'commit' : git_commit(), 'python' : platform.python_version(),
+             'gurobi' : '.'.join(str(v) for v in gp.gurobi.version()), 'platform' : platform.platform(),
+             'args' : { key : value for (key, value) in vars(args).items() if key not in ['output', 'compare', 'threshold'] } }
+    results = run_benchmarks(args.kinds, args.sizes, args.groups, args.seed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({ 'meta' : meta, 'benchmarks' : results }, f, indent=1)
+        print("Results written to", args.output)
@@ -0,0 +1,69 @@
+from gurobipy import GRB
+
+import json
+
+# Gurobi takes one callback function per solve. The dispatcher calls each function in m._callbacks
+#   (like separation.lcut_separation_generic and primal.primal_heuristic) in turn.
+
+def dispatcher(m, where):
+    for callback in m._callbacks:
+        callback(m, where)
+
+
+# Records (objective value, running time) of the root LP relaxation in m._rootLP, at the first MIPNODE callback,
+#   which comes before any cuts are added. m._objective lists (variable, coefficient) for the objective
+def root_relaxation(m, where):
+    if where != GRB.Callback.MIPNODE or m._rootLP is not None:
+        return
+    if m.cbGet(GRB.Callback.MIPNODE_NODCNT) != 0 or m.cbGet(GRB.Callback.MIPNODE_STATUS) != GRB.OPTIMAL:
+        return
+    values = m.cbGetNodeRel([ var for (var, coef) in m._objective ])
+    objective = sum( coef * value for ((var, coef), value) in zip(m._objective, values) )
+    m._rootLP = (objective, m.cbGet(GRB.Callback.RUNTIME))
+
+
+# Progress of the MIP solve, one JSON object per line in m._progressFile: running time, incumbent, bound, gap,
+#   nodes, open nodes, and the counters of the other callbacks. One record every m._progressInterval seconds,
+#   one whenever the incumbent improves, and a final one after the solve.
+def start_progress(m, filename, interval):
+    m._progressFile = open(filename, 'w', buffering=1) # line buffered, so that the file can be followed during the solve
+    m._progressInterval = interval
+    m._progressNext = 0
+    m._progressIncumbent = GRB.INFINITY
+    m._callbacks.append(progress)
+
+
+def write_progress(m, runtime, incumbent, bound, nodes, open_nodes):
+    if bound <= -GRB.INFINITY:
+        bound = None
+    if incumbent >= GRB.INFINITY:
+        (incumbent, gap) = (None, None)
+    elif bound is None:
+        gap = None
+    elif incumbent == 0:
+        gap = 0 if bound == 0 else None
+    else:
+        gap = abs(incumbent - bound) / abs(incumbent)
+    record = { 'time' : round(runtime, 3), 'incumbent' : incumbent, 'bound' : bound, 'gap' : gap, 'nodes' : int(nodes),
+               'open_nodes' : None if open_nodes is None else int(open_nodes), 'callbacks' : m._numCallbacks,
+               'lazy_cuts' : m._numLazyCuts, 'user_cuts' : m._numUserCuts, 'primal_solutions' : m._numPrimalSolutions }
+    m._progressFile.write(json.dumps(record) + '\n')
+
+
+def progress(m, where):
+    if where != GRB.Callback.MIP:
+        return
+    runtime = m.cbGet(GRB.Callback.RUNTIME)
+    incumbent = m.cbGet(GRB.Callback.MIP_OBJBST)
+    if runtime < m._progressNext and incumbent >= m._progressIncumbent:
+        return
+    m._progressNext = runtime + m._progressInterval
+    m._progressIncumbent = incumbent
+    write_progress(m, runtime, incumbent, m.cbGet(GRB.Callback.MIP_OBJBND), m.cbGet(GRB.Callback.MIP_NODCNT), m.cbGet(GRB.Callback.MIP_NODLFT))
+
+
+def finish_progress(m):
+    incumbent = m.objVal if m.SolCount > 0 else GRB.INFINITY
+    open_nodes = 0 if m.status == GRB.OPTIMAL else None
+    write_progress(m, m.Runtime, incumbent, m.objBound, m.NodeCount, open_nodes)
+    m._progressFile.close()
@@ -0,0 +1,373 @@
+import gurobipy as gp
+from gurobipy import GRB
+
+import math
+import time
+import heapq
+import random
+
+import csrgraph
+import multilevel
+
+# Set-partitioning model for districting, with districts as columns (base = columns). A column is a vertex set D
+#   (connected, unless contiguity is none) with population in [L,U], and the master problem picks k of them that
+#   partition the vertices:
+#       min sum_D cost(D) lambda_D   s.t.   sum_{D containing v} lambda_D = 1 for each vertex v,   sum_D lambda_D = k
+#   where cost(D) is half the (weighted) number of edges leaving D, so a plan costs its number of cut edges.
+# It is solved by branch-and-price:
+#   - Column generation solves the LP relaxation over a pool of columns. Pricing looks for columns of negative
+#     reduced cost cost(D) - sum_{v in D} pi_v - mu (pi, mu are the duals), first by growing vertex sets greedily from
+#     the vertices with the largest duals, then (if that finds none) by a MIP. The MIP also gives a lower bound when
+#     it is stopped early (the Lagrangian bound LP + k * min reduced cost).
+#   - The pool keeps every column. At each node, the columns that break its branching decisions get upper bound 0.
+#   - Branching (Ryan-Foster) is on an edge {u,v} whose endpoints are together in a fractional part of the solution:
+#     one child cuts the edge (u and v in different districts), the other does not (same district). With connected
+#     columns, such an edge exists whenever the solution is fractional; otherwise any vertex pair is branched on.
+#   - Plans come from the initial plans (like the heuristic warm start), integer LP solutions, and a MIP over the
+#     pool after the root node.
+
+pricing_seeds = 20 # vertices to grow columns from, in each round of heuristic pricing
+max_columns_per_round = 10
+pricing_time_limit = 10 # seconds for each pricing MIP
+master_time_limit = 60 # seconds for the MIP over the pool, after the root node
+initial_tries = 10 # random grown plans, as initial columns
+tolerance = 1e-6
+
+
+# Pricing at one node: vertices that must be together (by the branching decisions) are merged into one vertex,
+#   and those that must be apart are in conflict.
+class Pricing:
+
+    def __init__(self, graph, decisions, L, U, connected):
+        self.L = L
+        self.U = U
+        self.connected = connected
+
+        root = list(graph.nodes)
+        def find(v):
+            while root[v] != v:
+                root[v] = root[root[v]]
+                v = root[v]
+            return v
+        for (u, v, same) in decisions:
+            if same:
+                root[find(u)] = find(v)
+        number = dict()
+        group = [ number.setdefault(find(v), len(number)) for v in graph.nodes ]
+        self.graph = csrgraph.contract(graph, group)
+        self.members = [ list() for g in self.graph.nodes ]
+        for v in graph.nodes:
+            self.members[group[v]].append(v)
+        self.conflicts = [ set() for g in self.graph.nodes ]
+        for (u, v, same) in decisions:
+            if not same:
+                self.conflicts[group[u]].add(group[v])
+                self.conflicts[group[v]].add(group[u])
+        self.degree = [ sum(weights) for weights in self.graph.weights ]
+        self.model = None
+
+    # Grows a vertex set from seed, adding the neighbor that lowers the reduced cost most (or, below L, raises it
+    #   least), until the population reaches L and no neighbor lowers it. Returns (reduced cost, set) or None.
+    def grow(self, seed, value, mu):
+        graph = self.graph
+        pop = graph.pop
+        inside = { seed }
+        population = pop[seed]
+        boundary = self.degree[seed]
+        total = value[seed]
+        blocked = set(self.conflicts[seed])
+        into = dict() # weight of the edges from each neighbor of the set into it
+        for (u, w) in zip(graph.adjacency[seed], graph.weights[seed]):
+            into[u] = into.get(u, 0) + w
+        while True:
+            best = None
+            for (u, w) in into.items():
+                if u not in blocked and population + pop[u] <= self.U:
+                    delta = (self.degree[u] - 2*w) / 2 - value[u]
+                    if best is None or delta < best[0]:
+                        best = (delta, u)
+            if best is None or (population >= self.L and best[0] >= -tolerance):
+                break
+            u = best[1]
+            inside.add(u)
+            population += pop[u]
+            boundary += self.degree[u] - 2*into.pop(u)
+            total += value[u]
+            blocked |= self.conflicts[u]
+            for (x, w) in zip(graph.adjacency[u], graph.weights[u]):
+                if x not in inside:
+                    into[x] = into.get(x, 0) + w
+        if population < self.L:
+            return None
+        reduced_cost = boundary / 2 - total - mu
+        return (reduced_cost, inside) if reduced_cost < -tolerance else None
+
+    # columns (as sets of vertices of the original graph) of negative reduced cost, found by greedy growth
+    def heuristic(self, pi, mu):
+        value = [ sum(pi[v] for v in self.members[g]) for g in self.graph.nodes ]
+        seeds = sorted(self.graph.nodes, key=lambda g: -value[g])[:pricing_seeds]
+        found = dict()
+        for seed in seeds:
+            grown = self.grow(seed, value, mu)
+            if grown is not None:
+                found[frozenset(grown[1])] = grown[0]
+        best = sorted(found, key=lambda D: found[D])[:max_columns_per_round]
+        return [ self.expand(D) for D in best ]
+
+    def expand(self, D):
+        return frozenset( v for g in D for v in self.members[g] )
+
+    # the pricing MIP: x[g]=1 if vertex g is in the column, y[a,b]=1 if edge {a,b} leaves it. With contiguity,
+    #   a single-commodity flow from the column's root r reaches all of its vertices
+    def build(self):
+        graph = self.graph
+        m = gp.Model()
+        m.Params.LogToConsole = 0
+        m._x = m.addVars(graph.nodes, vtype=GRB.BINARY)
+        m._y = m.addVars(graph.edges, ub=1)
+        for ((a,b), w) in zip(graph.edges, graph.edge_weight.tolist()):
+            m._y[a,b].obj = w / 2
+        m.addConstrs( m._x[a] - m._x[b] <= m._y[a,b] for (a,b) in graph.edges )
+        m.addConstrs( m._x[b] - m._x[a] <= m._y[a,b] for (a,b) in graph.edges )
+        m.addConstr( gp.quicksum(graph.pop[g] * m._x[g] for g in graph.nodes) >= self.L )
+        m.addConstr( gp.quicksum(graph.pop[g] * m._x[g] for g in graph.nodes) <= self.U )
+        m.addConstrs( m._x[a] + m._x[b] <= 1 for a in graph.nodes for b in self.conflicts[a] if a < b )
+        if self.connected:
+            M = graph.n
+            r = m.addVars(graph.nodes, vtype=GRB.BINARY)
+            f = m.addVars(graph.arcs)
+            m.addConstr( r.sum() == 1 )
+            m.addConstrs( r[g] <= m._x[g] for g in graph.nodes )
+            m.addConstrs( gp.quicksum(f[a,g] - f[g,a] for a in graph.neighbors(g)) >= m._x[g] - M * r[g] for g in graph.nodes )
+            m.addConstrs( f[a,b] <= (M-1) * m._x[a] for (a,b) in graph.arcs )
+            m.addConstrs( f[a,b] <= (M-1) * m._x[b] for (a,b) in graph.arcs )
+        m.Params.PoolSolutions = max_columns_per_round
+        self.model = m
+
+    # Columns of negative reduced cost found by the pricing MIP, a lower bound on the reduced cost of any column, and
+    #   whether the MIP was solved to optimality (only then does finding no column prove that there is none).
+    #   The MIP stops after time_limit seconds if it has found a column; else it goes on until the deadline.
+    def exact(self, pi, mu, time_limit, deadline):
+        if self.model is None:
+            self.build()
+        m = self.model
+        x = [ m._x[g] for g in self.graph.nodes ]
+        m.setAttr(GRB.Attr.Obj, x, [ -sum(pi[v] for v in self.members[g]) for g in self.graph.nodes ])
+        m.ObjCon = -mu
+        m.Params.TimeLimit = max(0, min(time_limit, deadline - time.time()))
+        m.optimize()
+        while m.status == GRB.TIME_LIMIT and not (m.SolCount > 0 and m.ObjVal < -tolerance) and time.time() < deadline:
+            m.Params.TimeLimit = max(0, deadline - time.time())
+            m.optimize() # resumes the search
+        if m.status in [GRB.INFEASIBLE, GRB.INF_OR_UNBD]: # (it is bounded) no vertex set fits the bounds and decisions
+            return (list(), 0, True)
+        found = list()
+        for s in range(m.SolCount):
+            m.Params.SolutionNumber = s
+            if m.PoolObjVal < -tolerance:
+                values = m.getAttr(GRB.Attr.Xn, x)
+                found.append(self.expand([ g for g in self.graph.nodes if values[g] > 0.5 ]))
+        return (found, m.ObjBound, m.status == GRB.OPTIMAL)
+
+
+class BranchAndPrice:
+
+    def __init__(self, graph, k, L, U, connected):
+        self.graph = graph
+        self.k = k
+        self.L = L
+        self.U = U
+        self.connected = connected
+
+        self.master = gp.Model()
+        self.master.Params.LogToConsole = 0
+        self.partition = [ self.master.addConstr(gp.LinExpr() == 1) for v in graph.nodes ]
+        self.count = self.master.addConstr(gp.LinExpr() == k)
+
+        # artificial variables keep the master feasible at every node; they cost more than any plan
+        big = 1 + sum(graph.edge_weight.tolist())
+        self.artificial = [ self.master.addVar(obj=big, column=gp.Column([1], [constr])) for constr in self.partition ]
+        self.artificial.append(self.master.addVar(obj=big, column=gp.Column([1], [self.count])))
+        self.artificial.append(self.master.addVar(obj=big, column=gp.Column([-1], [self.count])))
+
+        self.columns = list() # the pool: vertex sets, in the order of self.variables
+        self.variables = list()
+        self.known = set()
+        self.incumbent = None # (number of cut edges, districts)
+        self.nodes = 0
+        self.heuristic_columns = 0
+        self.mip_columns = 0
+
+    def cost(self, D):
+        graph = self.graph
+        return sum( w for v in D for (u, w) in zip(graph.adjacency[v], graph.weights[v]) if u not in D ) / 2
+
+    def add_column(self, D):
+        if D in self.known:
+            return False
+        self.known.add(D)
+        constrs = [ self.partition[v] for v in D ] + [ self.count ]
+        self.variables.append(self.master.addVar(obj=self.cost(D), column=gp.Column([1] * len(constrs), constrs)))
+        self.columns.append(D)
+        return True
+
+    def feasible(self, D):
+        population = sum(self.graph.pop[v] for v in D)
+        return self.L <= population <= self.U and (not self.connected or csrgraph.is_connected(self.graph, D))
+
+    # adds the feasible districts of the plan as columns, and the plan as incumbent if it is a better plan
+    #   (a plan mapped to a reduced graph can overlap, or break the bounds)
+    def add_plan(self, districts):
+        plan = [ frozenset(district) for district in districts if self.feasible(district) ]
+        for D in plan:
+            self.add_column(D)
+        if len(plan) != self.k or sum(len(D) for D in plan) != self.graph.n or len(frozenset().union(*plan)) != self.graph.n:
+            return
+        obj = round(sum(self.cost(D) for D in plan))
+        if self.incumbent is None or obj < self.incumbent[0]:
+            self.incumbent = (obj, [ sorted(D) for D in plan ])
+            print("Branch-and-price: plan with",obj,"cut edges")
+
+    def compatible(self, D, decisions):
+        for (u, v, same) in decisions:
+            if (u in D) != (v in D) if same else (u in D and v in D):
+                return False
+        return True
+
+    # Column generation at the node with the given branching decisions. Returns (LP bound, LP values of the
+    #   columns, converged), or None if the node has no plan. The bound is the LP value once the pricing MIP proves
+    #   that no column of negative reduced cost is left; else (at the deadline) it is the best Lagrangian bound found,
+    #   or the parent's bound.
+    def solve_node(self, decisions, parent_bound, deadline):
+        # columns that break the decisions of this node get upper bound 0. The others get none: the partition rows imply
+        #   lambda <= 1, and with an upper bound of 1, a column at that bound could have negative reduced cost
+        self.master.setAttr(GRB.Attr.UB, self.variables, [ GRB.INFINITY if self.compatible(D, decisions) else 0 for D in self.columns ])
+        pricing = Pricing(self.graph, decisions, self.L, self.U, self.connected)
+        bound = parent_bound
+        while True:
+            self.master.optimize()
+            pi = self.master.getAttr(GRB.Attr.Pi, self.partition)
+            mu = self.count.Pi
+            found = [ D for D in pricing.heuristic(pi, mu) if self.add_column(D) ]
+            self.heuristic_columns += len(found)
+            if not found:
+                if time.time() >= deadline:
+                    return (bound, None, False)
+                (found, lower, optimal) = pricing.exact(pi, mu, pricing_time_limit, deadline)
+                found = [ D for D in found if self.add_column(D) ]
+                self.mip_columns += len(found)
+                bound = max(bound, self.master.ObjVal + self.k * min(0, lower))
+                if not found:
+                    if not optimal:
+                        return (bound, None, False)
+                    break
+            if time.time() >= deadline:
+                return (bound, None, False)
+
+        values = self.master.getAttr(GRB.Attr.X, self.variables)
+        if max(self.master.getAttr(GRB.Attr.X, self.artificial)) > tolerance:
+            return None
+        return (max(bound, self.master.ObjVal), values, True)
+
+    # the pair (u,v) to branch on: together in a fractional part of the solution closest to one half, or None
+    #   if the solution is integer. Only edges, if columns are connected
+    def branching_pair(self, values):
+        together = dict()
+        for (D, value) in zip(self.columns, values):
+            if tolerance < value < 1 - tolerance:
+                if self.connected:
+                    pairs = [ (u,v) for u in D for v in self.graph.adjacency[u] if u < v and v in D ]
+                else:
+                    pairs = [ (u,v) for u in D for v in D if u < v ]
+                for pair in pairs:
+                    together[pair] = together.get(pair, 0) + value
+        fractional = [ pair for pair in together if tolerance < together[pair] < 1 - tolerance ]
+        if not fractional:
+            return None
+        return min(fractional, key=lambda pair: (abs(together[pair] - 0.5), pair))
+
+    # the master problem as a MIP over the columns of the pool (the artificial variables are not allowed)
+    def solve_master_mip(self, time_limit):
+        self.master.update() # so that the indices of new columns match the variables of the copy
+        mip = self.master.copy()
+        variables = mip.getVars()
+        artificial = set( var.index for var in self.artificial )
+        columns = [ var.index for var in self.variables ]
+        mip.setAttr(GRB.Attr.UB, [ variables[i] for i in artificial ], [0] * len(artificial))
+        mip.setAttr(GRB.Attr.UB, [ variables[i] for i in columns ], [1] * len(columns))
+        mip.setAttr(GRB.Attr.VType, [ variables[i] for i in columns ], [GRB.BINARY] * len(columns))
+        mip.Params.TimeLimit = max(0, time_limit)
+        mip.optimize()
+        if mip.SolCount > 0:
+            values = mip.getAttr(GRB.Attr.X, [ variables[i] for i in columns ])
+            self.add_plan([ D for (D, value) in zip(self.columns, values) if value > 0.5 ])
+        mip.dispose()
+
+    # Branch-and-price (best bound first) for at most time_limit seconds, starting from the given plans
+    def solve(self, plans, time_limit):
+        start = time.time()
+        deadline = start + time_limit
+        for districts in plans:
+            self.add_plan(districts)
+        self.master.update()
+
+        self.root_bound = None
+        self.root_time = None
+        open_nodes = [ (0, 0, list()) ] # (bound, number, branching decisions); cut edges are never negative
+        created = 1
+        while open_nodes and time.time() < deadline:
+            (parent_bound, number, decisions) = heapq.heappop(open_nodes)
+            if self.incumbent is not None and math.ceil(parent_bound - tolerance) >= self.incumbent[0]:
+                continue
+            self.nodes += 1
+            node = self.solve_node(decisions, parent_bound, deadline)
+            if number == 0:
+                # the root LP bound is known only if column generation converged at the root
+                self.root_bound = node[0] if node is not None and node[2] else None
+                self.root_time = time.time() - start
+                if self.root_bound is not None:
+                    print("Branch-and-price: root LP bound",'{0:.2f}'.format(self.root_bound),"after",'{0:.2f}'.format(self.root_time),"seconds, with",len(self.columns),"columns")
+                elif node is not None:
+                    print("Branch-and-price: root LP not solved by the deadline; Lagrangian bound",'{0:.2f}'.format(node[0]),"with",len(self.columns),"columns")
+                self.solve_master_mip(min(master_time_limit, deadline - time.time()))
+            if node is None:
+                continue
+            (bound, values, converged) = node
+            if not converged:
+                heapq.heappush(open_nodes, (bound, number, decisions))
+                break
+            if self.incumbent is not None and math.ceil(bound - tolerance) >= self.incumbent[0]:
+                continue
+            pair = self.branching_pair(values)
+            if pair is None:
+                self.add_plan([ D for (D, value) in zip(self.columns, values) if value > 0.5 ])
+                continue
+            (u, v) = pair
+            for same in [False, True]:
+                heapq.heappush(open_nodes, (bound, created, decisions + [ (u, v, same) ]))
+                created += 1
+
+        self.closed = not open_nodes
+        bounds = [ math.ceil(bound - tolerance) for (bound, number, decisions) in open_nodes ]
+        if self.incumbent is not None:
+            bounds.append(self.incumbent[0])
+        self.bound = min(bounds) if bounds else math.inf
+        self.time = time.time() - start
+
+
+# Solves the instance by branch-and-price for at most time_limit seconds. The initial columns are the districts of
+#   the given plans (like a heuristic warm start) and of random grown plans. Returns the BranchAndPrice object,
+#   whose incumbent is (number of cut edges, districts) of the best plan found, or None.
+def solve(graph, k, L, U, connected, plans, time_limit, seed=0):
+    deadline = time.time() + time_limit
+    rng = random.Random(seed)
+    plans = list(plans)
+    for t in range(initial_tries):
+        if time.time() >= deadline:
+            break
+        label = multilevel.initial_plan(graph, k, L, U, rng, 1, deadline)
+        if label is not None:
+            plans.append([ [ v for v in graph.nodes if label[v] == j ] for j in range(k) ])
+    bp = BranchAndPrice(graph, k, L, U, connected)
+    bp.solve(plans, max(0, deadline - time.time()))
+    return bp
@@ -0,0 +1,165 @@
+import heapq
+import numpy as np
+
+
+# make a NumPy array read-only, so that the graph can be shared safely
+def frozen(array):
+    array.flags.writeable = False
+    return array
+
+
+class CSRGraph:
+
+    # Read-only compressed sparse row (CSR) version of an undirected graph G with nodes 0, 1, ..., n-1.
+    #   Neighbors of vertex i are indices[indptr[i]:indptr[i+1]], in the same order as G.neighbors(i).
+    #   Built once per instance and shared by all modules; nothing writes to it.
+    def __init__(self, G, population):
+        n = G.number_of_nodes()
+        indptr = [0]
+        indices = []
+        for i in range(n):
+            indices.extend(G.neighbors(i))
+            indptr.append(len(indices))
+        geoid = [G.nodes[i].get('GEOID10', str(i)) for i in range(n)]
+        name = [G.nodes[i].get('NAME10', str(i)) for i in range(n)]
+        edges = [ (u,v) for u,v in G.edges ]
+        self.set_arrays(np.array(indptr), np.array(indices), np.array(population), np.array(geoid, dtype=str),
+                        np.array(name, dtype=str), np.array(edges).reshape(-1,2))
+
+    # the same graph, from its arrays (like those saved by data_cache.py, which may be memory-mapped).
+    #   edge_weight[e] is the weight of edge e (default: 1), like the number of original edges that a coarse
+    #   edge stands for in multilevel.py
+    @classmethod
+    def from_arrays(cls, indptr, indices, population, geoid, name, edges, edge_weight=None):
+        graph = cls.__new__(cls)
+        graph.set_arrays(indptr, indices, population, geoid, name, edges, edge_weight)
+        return graph
+
+    def set_arrays(self, indptr, indices, population, geoid, name, edges, edge_weight=None):
+        n = len(indptr) - 1
+        self.n = n
+        self.m = len(edges)
+        self.indptr = frozen(np.asarray(indptr, dtype=np.int64))
+        self.indices = frozen(np.asarray(indices, dtype=np.int64))
+        self.population = frozen(np.asarray(population, dtype=np.int64))
+        self.geoid = frozen(np.asarray(geoid))
+        self.name = frozen(np.asarray(name))
+        self.edge_array = frozen(np.asarray(edges, dtype=np.int64))
+
+        # tuples are immutable and faster than NumPy arrays to index in pure-Python loops
+        indptr = self.indptr.tolist()
+        indices = self.indices.tolist()
+        self.adjacency = tuple( tuple(indices[indptr[i]:indptr[i+1]]) for i in range(n) )
+        self.pop = tuple( self.population.tolist() )
+
+        # edges {u,v} in the same order (and orientation) as G.edges, and arcs (u,v) of the bidirected graph
+        self.edges = tuple( (u,v) for u,v in self.edge_array.tolist() )
+        self.arcs = tuple( (u,v) for u in range(n) for v in self.adjacency[u] )
+
+        # weight of each edge, and weights[i] = weights of the edges to the neighbors of vertex i (in their order)
+        if edge_weight is None:
+            self.edge_weight = frozen(np.ones(self.m, dtype=np.int64))
+            self.weights = tuple( (1,) * len(neighbors) for neighbors in self.adjacency )
+        else:
+            self.edge_weight = frozen(np.asarray(edge_weight, dtype=np.int64))
+            weight = dict()
+            for ((u,v), w) in zip(self.edges, self.edge_weight.tolist()):
+                weight[u,v] = w
+                weight[v,u] = w
+            self.weights = tuple( tuple( weight[i,j] for j in self.adjacency[i] ) for i in range(n) )
+
+    @property
+    def nodes(self):
+        return range(self.n)
+
+    def neighbors(self, i):
+        return self.adjacency[i]
+
+    def number_of_nodes(self):
+        return self.n
+
+    def number_of_edges(self):
+        return self.m
+
+
+# The graph with the vertices of each group merged into one vertex: parent[v] in 0, 1, ..., groups-1 is the new vertex
+#   of v. Populations add up, and each new edge has as weight the total weight of the edges it stands for (edges
+#   inside a group disappear). A new vertex takes the geoid and name of its first vertex.
+def contract(graph, parent):
+    n = max(parent) + 1
+    population = [0] * n
+    first = [ -1 for c in range(n) ]
+    for v in graph.nodes:
+        population[parent[v]] += graph.pop[v]
+        if first[parent[v]] < 0:
+            first[parent[v]] = v
+    weight = dict()
+    for ((u,v), w) in zip(graph.edges, graph.edge_weight.tolist()):
+        (a, b) = (parent[u], parent[v])
+        if a != b:
+            edge = (min(a,b), max(a,b))
+            weight[edge] = weight.get(edge, 0) + w
+    edges = sorted(weight)
+
+    neighbors = [ list() for c in range(n) ]
+    for (a,b) in edges:
+        neighbors[a].append(b)
+        neighbors[b].append(a)
+    indptr = [0]
+    indices = list()
+    for c in range(n):
+        indices.extend(neighbors[c])
+        indptr.append(len(indices))
+    return CSRGraph.from_arrays(np.array(indptr), np.array(indices), np.array(population), graph.geoid[first], graph.name[first],
+                                np.array(edges, dtype=np.int64).reshape(-1,2), [ weight[edge] for edge in edges ])
+
+
+# connected components of G[S], where S is a collection of vertices. Uses BFS
+def connected_components(graph, S):
+    in_S = set(S)
+    visited = set()
+    components = list()
+    for v in S:
+        if v in visited:
+            continue
+        visited.add(v)
+        component = [v]
+        for i in component: # component grows while we scan it
+            for j in graph.adjacency[i]:
+                if j in in_S and j not in visited:
+                    visited.add(j)
+                    component.append(j)
+        components.append(component)
+    return components
+
+
+def is_connected(graph, S):
+    return len(connected_components(graph, S)) <= 1
+
+
+# Population-weighted shortest paths from source: the length of a path is the total population
+#   of its vertices, not counting the source. Vertices v with removed[v] are never entered, and
+#   vertices farther than cutoff are never expanded. Returns { v : dist(source,v) } for all v with
+#   dist(source,v) <= cutoff (and the source itself). If target is given, stops once it is reached.
+def dijkstra(graph, source, cutoff, removed=None, target=None):
+    adjacency = graph.adjacency
+    pop = graph.pop
+
+    dist = { source : 0 } # tentative distances
+    settled = dict()
+    heap = [ (0, source) ]
+    while heap:
+        (d, v) = heapq.heappop(heap)
+        if v in settled:
+            continue
+        settled[v] = d
+        if v == target:
+            break
+        for u in adjacency[v]:
+            if u in settled or (removed is not None and removed[u]):
+                continue
+            du = d + pop[u]
+            if du <= cutoff and du < dist.get(u, du+1):
+                dist[u] = du
+                heapq.heappush(heap, (du, u))
+    return settled
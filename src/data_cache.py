@@ -0,0 +1,220 @@
+import numpy as np
+
+import os
+import json
+import hashlib
+import importlib.util
+import argparse
+
+import csrgraph
+
+# Binary copies of the input data, so that runs do not parse the dual graphs (json) and shape files each time.
+#   data/<level>/binary/<level><code>/            dual graph as NumPy arrays (.npy), memory-mapped when loaded:
+#                                                 indptr, indices, population, geoid, name, edges (in the order of G.edges)
+#   data/<level>/binary/<state>_<level>.parquet   geometries and attributes of the shape file (needs pyarrow)
+#   Each comes with a meta file (meta.json, or <state>_<level>.json) that records the size, mtime, and
+#   SHA-256 hash of its source files. It is written last, so a copy exists once its meta file does.
+#   A copy is used only if its sources are unchanged: same size and mtime, or else the same hash.
+
+format_version = 1 # change whenever the arrays change, so that old copies are rebuilt
+
+graph_arrays = ['indptr', 'indices', 'population', 'geoid', 'name', 'edges']
+
+shape_extensions = ['.shp', '.shx', '.dbf', '.prj', '.cpg']
+
+
+# where the binary copy of a source file goes: data/<level>/binary/<basename without extension>
+def binary_path(source_filename):
+    (directory, basename) = os.path.split(os.path.abspath(source_filename))
+    return os.path.join(os.path.dirname(directory), 'binary', os.path.splitext(basename)[0])
+
+
+def file_hash(filename):
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1<<20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_info(filenames):
+    info = dict()
+    for filename in filenames:
+        stat = os.stat(filename)
+        info[os.path.basename(filename)] = { 'size' : stat.st_size, 'mtime_ns' : stat.st_mtime_ns, 'sha256' : file_hash(filename) }
+    return info
+
+
+# True if meta_filename exists and records the current versions of the source files.
+#   Files that were only touched (same hash, new mtime) get their new mtime recorded, so they are not hashed again.
+def is_fresh(meta_filename, filenames):
+    try:
+        with open(meta_filename, 'r') as meta_file:
+            meta = json.load(meta_file)
+    except (OSError, ValueError):
+        return False
+    if meta.get('version') != format_version or set(meta['sources']) != set(os.path.basename(f) for f in filenames):
+        return False
+
+    touched = False
+    for filename in filenames:
+        recorded = meta['sources'][os.path.basename(filename)]
+        stat = os.stat(filename)
+        if stat.st_size != recorded['size']:
+            return False
+        if stat.st_mtime_ns != recorded['mtime_ns']:
+            if file_hash(filename) != recorded['sha256']:
+                return False
+            recorded['mtime_ns'] = stat.st_mtime_ns
+            touched = True
+
+    if touched:
+        try:
+            write_meta(meta_filename, meta)
+        except OSError:
+            pass # read-only data directory; still fresh
+    return True
+
+
+# write to a temporary file first, so that other processes never read a partial file
+def write_meta(meta_filename, meta):
+    tmp = meta_filename + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp, 'w') as meta_file:
+        json.dump(meta, meta_file, indent=1)
+    os.replace(tmp, meta_filename)
+
+
+def remove(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+##################################
+# Dual graphs
+##################################
+
+def read_graph_json(graph_filename):
+    from gerrychain import Graph
+    G = Graph.from_json(graph_filename)
+    population = [G.nodes[i]['TOTPOP'] for i in G.nodes()]
+    return csrgraph.CSRGraph(G, population)
+
+
+def save_graph(graph, directory, graph_filename):
+    os.makedirs(directory, exist_ok=True)
+    meta_filename = os.path.join(directory, 'meta.json')
+    remove(meta_filename) # the old arrays stop being loadable before they are replaced
+
+    arrays = { 'indptr' : graph.indptr, 'indices' : graph.indices, 'population' : graph.population,
+               'geoid' : graph.geoid, 'name' : graph.name, 'edges' : graph.edge_array }
+    tmp = '.' + str(os.getpid()) + '.tmp.npy'
+    for array_name in graph_arrays:
+        filename = os.path.join(directory, array_name + '.npy')
+        np.save(filename + tmp, np.ascontiguousarray(arrays[array_name]))
+        os.replace(filename + tmp, filename)
+
+    meta = { 'version' : format_version, 'sources' : source_info([graph_filename]), 'n' : graph.n, 'm' : graph.m }
+    write_meta(meta_filename, meta)
+
+
+# CSRGraph of the dual graph in graph_filename (like ../data/county/dual_graphs/county01.json).
+#   Uses the binary copy if it is fresh, else builds it (if the data directory is writable).
+def load_graph(graph_filename):
+    directory = binary_path(graph_filename)
+    if is_fresh(os.path.join(directory, 'meta.json'), [graph_filename]):
+        try:
+            arrays = [ np.load(os.path.join(directory, array_name + '.npy'), mmap_mode='r') for array_name in graph_arrays ]
+            return csrgraph.CSRGraph.from_arrays(*arrays)
+        except (OSError, ValueError):
+            pass # replaced or removed by another process; read the source instead
+
+    graph = read_graph_json(graph_filename)
+    try:
+        save_graph(graph, directory, graph_filename)
+    except OSError as error:
+        print("Could not save binary copy of", graph_filename, ":", error)
+    return graph
+
+
+##################################
+# Shape files
+##################################
+
+def has_pyarrow():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def shape_sources(shape_filename):
+    base = os.path.splitext(shape_filename)[0]
+    return [ base + ext for ext in shape_extensions if os.path.exists(base + ext) ]
+
+
+# GeoDataFrame of the shape file shape_filename (like ../data/county/shape_files/AL_county.shp).
+#   Uses the parquet copy if it is fresh, else reads the shape file and saves the copy (if pyarrow is installed).
+def load_shapes(shape_filename):
+    import geopandas as gpd
+    parquet_filename = binary_path(shape_filename) + '.parquet'
+    meta_filename = binary_path(shape_filename) + '.json'
+    sources = shape_sources(shape_filename)
+    pyarrow = has_pyarrow()
+
+    if pyarrow and is_fresh(meta_filename, sources):
+        try:
+            return gpd.read_parquet(parquet_filename)
+        except (OSError, ValueError):
+            pass
+
+    df = gpd.read_file(shape_filename)
+    if pyarrow:
+        try:
+            save_shapes(df, parquet_filename, meta_filename, sources)
+        except OSError as error:
+            print("Could not save binary copy of", shape_filename, ":", error)
+    return df
+
+
+def save_shapes(df, parquet_filename, meta_filename, sources):
+    os.makedirs(os.path.dirname(parquet_filename), exist_ok=True)
+    remove(meta_filename)
+    tmp = parquet_filename + '.' + str(os.getpid()) + '.tmp'
+    try:
+        df.to_parquet(tmp)
+        os.replace(tmp, parquet_filename)
+    finally:
+        remove(tmp)
+    write_meta(meta_filename, { 'version' : format_version, 'sources' : source_info(sources) })
+
+
+##################################
+# Preprocessing
+##################################
+
+# build (or refresh) the binary copies of all dual graphs and shape files of the given levels, e.g.
+#   python data_cache.py county tract
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert dual graphs and shape files to binary copies for faster loading.")
+    parser.add_argument('levels', nargs='*', default=['county', 'tract'], help="levels to convert (default: county tract)")
+    parser.add_argument('--data-dir', default='../data', help="data directory (default: ../data)")
+    args = parser.parse_args()
+
+    if not has_pyarrow():
+        print("pyarrow is not installed, so shape files will not be converted.")
+
+    for level in args.levels:
+        graph_dir = os.path.join(args.data_dir, level, 'dual_graphs')
+        for basename in sorted(os.listdir(graph_dir)):
+            if basename.endswith('.json'):
+                graph_filename = os.path.join(graph_dir, basename)
+                graph = load_graph(graph_filename)
+                print(graph_filename, ": n =", graph.n, ", m =", graph.m)
+
+        shape_dir = os.path.join(args.data_dir, level, 'shape_files')
+        if not has_pyarrow() or not os.path.isdir(shape_dir):
+            continue
+        for basename in sorted(os.listdir(shape_dir)):
+            if basename.endswith('.shp'):
+                shape_filename = os.path.join(shape_dir, basename)
+                df = load_shapes(shape_filename)
+                print(shape_filename, ":", len(df), "shapes")
@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+
+import json
+import queue
+import threading
+import traceback
+
+# Exports of districting solutions (json files and png maps), and a background worker that writes them,
+#   so that drawing maps overlaps with the next solve.
+
+
+################################################
+# Writes districting solution to json file
+################################################
+
+def export_to_json(graph, districts, filename):
+    with open(filename, 'w') as outfile:
+        soln = {}
+        soln['nodes'] = []
+        for j in range(len(districts)):
+            for i in districts[j]:
+                soln['nodes'].append({
+                        'name': str(graph.name[i]),
+                        'index': i,
+                        'district': j
+                        })
+        json.dump(soln, outfile)
+
+
+################################################
+# Draws maps
+################################################
+
+# row of df (the shape file) for each vertex of graph, matched by GEOID; -1 if there is none
+def geoid_rows(graph, df):
+    return pd.Index(df['GEOID10']).get_indexer(graph.geoid)
+
+
+# Draws values on the shapes of df. The shapes are plotted once; later maps of the same df only recolor them.
+class MapRenderer:
+
+    def __init__(self, df):
+        RESIZE_FACTOR = 3
+        self.figure = Figure()
+        self.figure.set_size_inches(self.figure.get_size_inches()*RESIZE_FACTOR)
+        self.ax = self.figure.add_subplot()
+
+        # plot each shape with its row number as value, so that we know which row each patch
+        #   (several for a MultiPolygon) belongs to
+        df.plot(column=np.arange(len(df)), ax=self.ax)
+        self.ax.axis('off')
+        self.collection = self.ax.collections[0]
+        self.patch_rows = np.asarray(self.collection.get_array(), dtype=np.int64)
+
+    # values[r] is the value of row r of df
+    def draw(self, values, filename):
+        values = np.asarray(values)
+        self.collection.set_array(values[self.patch_rows])
+        self.collection.set_clim(values.min(), values.max())
+        self.figure.savefig(filename)
+
+    # frees the figure and its artists
+    def close(self):
+        self.figure.clear()
+        self.collection = None
+
+
+# the renderer of the last shape file, identified by its GEOIDs (the maps of a run share one shape file;
+#   keeping only the last one bounds memory over runs on many states). Maps are drawn by the export worker
+#   (see submit), but the renderer is not thread-safe, so each draw holds renderer_lock, also when called directly
+renderer = None
+renderer_key = None
+renderer_lock = threading.Lock()
+
+def renderer_for(df):
+    global renderer, renderer_key
+    key = (len(df), hash(tuple(df['GEOID10'])))
+    if key != renderer_key:
+        if renderer is not None:
+            renderer.close()
+        renderer = MapRenderer(df)
+        renderer_key = key
+    return renderer
+
+
+def draw(df, values, filename):
+    with renderer_lock:
+        renderer_for(df).draw(values, filename)
+
+
+def export_to_png(graph, df, districts, filename):
+
+    rows = geoid_rows(graph, df)
+    assignment = np.full(len(df), -1)
+    for j in range(len(districts)):
+        assignment[rows[districts[j]]] = j
+
+    if min(rows) < 0 or min(assignment) < 0:
+        print("Error: did not assign all nodes in district map png.")
+    else:
+        draw(df, assignment, filename)
+
+
+def export_B_to_png(graph, df, B, filename):
+
+    rows = geoid_rows(graph, df)
+    B_rows = rows[B]
+    in_B = np.zeros(len(df), dtype=np.int64)
+    in_B[B_rows[B_rows >= 0]] = 1
+    draw(df, in_B, filename)
+
+
+################################################
+# Background export worker
+################################################
+
+# exports waiting to be written, as (function, args), and the thread that writes them
+exports = queue.Queue()
+worker = None
+
+def work():
+    while True:
+        (function, args) = exports.get()
+        try:
+            function(*args)
+        except Exception:
+            print("Error: export", function.__name__, "failed.")
+            traceback.print_exc()
+        exports.task_done()
+
+
+# write an export in the background, e.g., submit(export_to_png, graph, df, districts, png_fn).
+#   The arguments should not be changed afterwards.
+def submit(function, *args):
+    global worker
+    if worker is None:
+        worker = threading.Thread(target=work, daemon=True)
+        worker.start()
+    exports.put((function, args))
+
+
+# wait until all submitted exports are written
+def wait():
+    exports.join()
@@ -1,12 +1,34 @@
-import networkx as nx
+import numpy as np
+from gurobipy import GRB
+
+import csrgraph
+
+
+# the variables V[i,j] for i in rows and j in cols, as a flat list in row-major order
+def var_list(V, rows, cols):
+    return [V[i,j] for i in rows for j in cols]
+
+
+# current value of attribute attr (LB or UB) of the variables, in one bulk query, as an array of given shape
+def get_bound(m, variables, attr, shape):
+    return np.array(m.getAttr(attr, variables)).reshape(shape)
+
+
+# set attribute attr (LB or UB) to value for those variables where mask is true, in one bulk call
+def set_bound(m, variables, mask, attr, value):
+    chosen = [variables[t] for t in np.flatnonzero(mask)]
+    if chosen:
+        m.setAttr(attr, chosen, [value] * len(chosen))
+    return len(chosen)
+
 
 # how many people are reachable from v in G[S]? Uses BFS
-def reachable_population(G, population, S, v):
+def reachable_population(graph, population, S, v):
     pr = 0 # population reached
     if not S[v]:
         return 0
     
-    visited = [False for i in G.nodes]
+    visited = [False for i in graph.nodes]
     child = [v]
     visited[v] = True
     while child:
@@ -14,45 +36,82 @@ def reachable_population(G, population, S, v):
         child = list()
         for i in parent:
             pr += population[i]
-            for j in G.neighbors(i):
+            for j in graph.neighbors(i):
                 if S[j] and not visited[j]:
                     child.append(j)
                     visited[j] = True
     return pr   
 
 
-def do_Hess_DFixing(m, G, position):
-    DFixings = 0
-    for i in G.nodes:
-        for j in G.nodes:
-            if position[i] < position[j] and m._X[i,j].UB > 0.5:
-                m._X[i,j].UB = 0
-                DFixings += 1
+# how many people are reachable from ordering[p] in G[{ordering[p], ..., ordering[n-1]}]? Answers for every p.
+# Adds vertices in reverse order to a union-find that keeps the population of each component at its root,
+#   so all n queries take near-linear time in total (instead of one BFS per query)
+def reachable_populations(graph, population, ordering):
+    parent = [-1 for i in graph.nodes] # parent[v] = -1 means v has not been added yet
+    size = [1 for i in graph.nodes]
+    component_population = [0 for i in graph.nodes]
+    
+    def find(v):
+        while parent[v] != v:
+            parent[v] = parent[parent[v]] # path halving
+            v = parent[v]
+        return v
+    
+    pr = [0 for p in range(len(ordering))]
+    for p in range(len(ordering)-1, -1, -1):
+        v = ordering[p]
+        parent[v] = v
+        component_population[v] = population[v]
+        for u in graph.neighbors(v):
+            if parent[u] == -1:
+                continue
+            ru = find(u)
+            rv = find(v)
+            if ru == rv:
+                continue
+            if size[ru] > size[rv]:
+                (ru, rv) = (rv, ru)
+            parent[ru] = rv # union by size
+            size[rv] += size[ru]
+            component_population[rv] += component_population[ru]
+        pr[p] = component_population[find(v)]
+    return pr
+
+
+def do_Hess_DFixing(m, graph, position):
+    nodes = list(graph.nodes)
+    X = var_list(m._X, nodes, nodes)
+    XUB = get_bound(m, X, GRB.Attr.UB, (len(nodes),len(nodes)))
+    
+    # X[i,j]=0 if i comes before j in the ordering
+    p = np.array([position[i] for i in nodes])
+    mask = (p[:,None] < p[None,:]) & (XUB > 0.5)
+    DFixings = set_bound(m, X, mask, GRB.Attr.UB, 0)
     m.update()
     return DFixings
 
 
-def do_Hess_LFixing(m, G, population, L, ordering):
+def do_Hess_LFixing(m, graph, population, L, ordering):
     LFixings = 0
-    S = [True for v in G.nodes]
-    for j in ordering:       
-        if reachable_population(G, population, S, j) < L:
-            for i in G.nodes:
+    pr = reachable_populations(graph, population, ordering)
+    for p in range(len(ordering)):
+        j = ordering[p]
+        if pr[p] < L:
+            for i in graph.nodes:
                 if m._X[i,j].UB > 0.5:
                     m._X[i,j].UB = 0
                     LFixings += 1
-        S[j] = False
         
     m.update()
     return LFixings
 
 
-def do_Hess_LFixing_without_Contiguity(m, G, population, L, ordering):
+def do_Hess_LFixing_without_Contiguity(m, graph, population, L, ordering):
     LFixings = 0
-    remaining_population = sum(population[v] for v in G.nodes)
+    remaining_population = sum(population[v] for v in graph.nodes)
     for j in ordering:
         if remaining_population < L:
-            for i in G.nodes:
+            for i in graph.nodes:
                 if m._X[i,j].UB > 0.5:
                     m._X[i,j].UB = 0
                     LFixings += 1
@@ -61,52 +120,70 @@ def do_Hess_LFixing_without_Contiguity(m, G, population, L, ordering):
     return LFixings
 
 
-def do_Hess_UFixing(m, DG, population, U, ordering): 
-    UFixings = 0
+def do_Hess_UFixing(m, graph, population, U, ordering): 
+    nodes = range(graph.n)
+    X = var_list(m._X, nodes, nodes)
+    XUB = get_bound(m, X, GRB.Attr.UB, (graph.n,graph.n))
     
-    for (i,j) in DG.edges:
-        DG[i][j]['ufixweight'] = population[j] # weight of edge (i,j) is population of its head j
-       
+    # X[i,j]=0 if i is farther than U-p(j) from j in G-{vertices before j}
+    mask = np.ones((graph.n,graph.n), dtype=bool)
+    deleted = [False for i in nodes]
     for j in ordering:
-        dist = nx.shortest_path_length(DG,source=j,weight='ufixweight')
-        for i in DG.nodes:
-            if i != j and dist[i]+population[j] > U and m._X[i,j].UB > 0.5: 
-                m._X[i,j].UB = 0
-                UFixings += 1
-                
-        # we should "remove" vertex j from the graph for subsequent distance calculations, so give incoming edges large weights
-        for i in DG.neighbors(j):
-            DG[i][j]['ufixweight'] = U+1
-
+        dist = csrgraph.dijkstra(graph, j, U-population[j], removed=deleted)
+        mask[list(dist.keys()), j] = False
+        mask[j,j] = False
+        
+        # "remove" vertex j from the graph for subsequent distance calculations
+        deleted[j] = True
+    
+    mask &= (XUB > 0.5)
+    UFixings = set_bound(m, X, mask, GRB.Attr.UB, 0)
     m.update()
     return UFixings
 
 
-def do_Hess_UFixing_without_Contiguity(m, G, population, U): 
-    UFixings = 0
-    for i in G.nodes:
-        for j in G.nodes:
-            if i != j and population[i] + population[j] > U and m._X[i,j].UB > 0.5:
-                m._X[i,j].UB = 0
-                UFixings += 1
+def do_Hess_UFixing_without_Contiguity(m, graph, population, U): 
+    nodes = list(graph.nodes)
+    X = var_list(m._X, nodes, nodes)
+    XUB = get_bound(m, X, GRB.Attr.UB, (len(nodes),len(nodes)))
+    
+    # X[i,j]=0 if i and j together have too much population
+    p = np.array([population[i] for i in nodes], dtype=np.int64)
+    mask = (p[:,None] + p[None,:] > U) & (XUB > 0.5)
+    np.fill_diagonal(mask, False)
+    UFixings = set_bound(m, X, mask, GRB.Attr.UB, 0)
     m.update()
     return UFixings
     
 
-def do_Hess_ZFixing(m, G):
-    ZFixings = 0
-    for u,v in G.edges:
-        for j in G.nodes:
-            if m._X[u,j].UB < 0.5 or m._X[v,j].LB > 0.5:
-                m._Z[u,v,j].UB = 0
-                ZFixings += 1
+# Z[u,v,j] for each edge {u,v} and each district j, with the matching rows of X bounds for u and for v
+def edge_endpoint_bounds(m, graph, labels):
+    nodes = list(graph.nodes)
+    index = { nodes[t] : t for t in range(len(nodes)) }
+    X = var_list(m._X, nodes, labels)
+    XLB = get_bound(m, X, GRB.Attr.LB, (len(nodes),len(labels)))
+    XUB = get_bound(m, X, GRB.Attr.UB, (len(nodes),len(labels)))
+    
+    edges = list(graph.edges)
+    tail = np.array([index[u] for u,v in edges], dtype=np.int64)
+    head = np.array([index[v] for u,v in edges], dtype=np.int64)
+    Z = [m._Z[u,v,j] for u,v in edges for j in labels]
+    return (Z, XLB[tail], XUB[tail], XLB[head], XUB[head])
+
+
+def do_Hess_ZFixing(m, graph):
+    (Z, uLB, uUB, vLB, vUB) = edge_endpoint_bounds(m, graph, list(graph.nodes))
+    
+    # Z[u,v,j]=0 if u cannot be assigned to j or if v must be assigned to j
+    mask = (uUB < 0.5) | (vLB > 0.5)
+    ZFixings = set_bound(m, Z, mask, GRB.Attr.UB, 0)
     m.update()
     return ZFixings
 
 
-def do_Labeling_DFixing(m, G, ordering, k):
+def do_Labeling_DFixing(m, graph, ordering, k):
     DFixings = 0
-    for p in range(G.number_of_nodes()):
+    for p in range(graph.number_of_nodes()):
         i = ordering[p]
         for j in range(p+1,k):
             if m._X[i,j].UB > 0.5:
@@ -116,32 +193,30 @@ def do_Labeling_DFixing(m, G, ordering, k):
     return DFixings
 
 
-def do_Labeling_ZFixing(m, G, k):
-    ZFixings = 0
-    for u,v in G.edges:
-        for j in range(k):
-            if m._X[u,j].UB < 0.5 or m._X[v,j].LB > 0.5:
-                m._Z[u,v,j].UB = 0
-                ZFixings += 1
-            elif m._X[u,j].LB > 0.5 and m._X[v,j].UB < 0.5:
-                m._Z[u,v,j].LB = 1
-                ZFixings += 1
+def do_Labeling_ZFixing(m, graph, k):
+    (Z, uLB, uUB, vLB, vUB) = edge_endpoint_bounds(m, graph, list(range(k)))
+    
+    # Z[u,v,j]=0 if u cannot be assigned to j or if v must be assigned to j
+    mask_zero = (uUB < 0.5) | (vLB > 0.5)
+    
+    # Z[u,v,j]=1 if u must be assigned to j but v cannot be
+    mask_one = ~mask_zero & (uLB > 0.5) & (vUB < 0.5)
+    
+    ZFixings = set_bound(m, Z, mask_zero, GRB.Attr.UB, 0)
+    ZFixings += set_bound(m, Z, mask_one, GRB.Attr.LB, 1)
     m.update()
     return ZFixings
 
 
-def do_Labeling_LFixing(m, G, population, L, ordering, k):
+def do_Labeling_LFixing(m, graph, population, L, ordering, k):
     LFixings = 0
     
     # find "back" of ordering B = {v_q, v_{q+1}, ..., v_{n-1} }
-    n = G.number_of_nodes()
-    S = [False for v in G.nodes]
+    n = graph.number_of_nodes()
+    pr = reachable_populations(graph, population, ordering)
     for p in range(n):
         v_pos = n - p - 1
-        v = ordering[v_pos]
-        S[v] = True
-        pr = reachable_population(G, population, S, v)
-        if pr >= L:
+        if pr[v_pos] >= L:
             q = v_pos + 1
             break
     
@@ -170,11 +245,11 @@ def do_Labeling_LFixing(m, G, population, L, ordering, k):
     return LFixings 
 
 
-def do_Labeling_LFixing_without_Contiguity(m, G, population, L, ordering, k):
+def do_Labeling_LFixing_without_Contiguity(m, graph, population, L, ordering, k):
     LFixings = 0
     
     # find "back" of ordering B = {v_q, v_{q+1}, ..., v_{n-1} }
-    n = G.number_of_nodes()
+    n = graph.number_of_nodes()
     cumulative_population = 0
     for p in range(n):
         v_pos = n - p - 1
@@ -209,24 +284,17 @@ def do_Labeling_LFixing_without_Contiguity(m, G, population, L, ordering, k):
     return LFixings 
 
 
-def do_Labeling_UFixing(m, DG, population, U, ordering, k):
+def do_Labeling_UFixing(m, graph, population, U, ordering, k):
     UFixings_X = 0
     UFixings_R = 0
-    DG = m._DG
-    for (i,j) in DG.edges:
-        DG[i][j]['ufixweight'] = population[j] # weight of edge (i,j) is population of its head j
     
     for j in range(k):
         
         v = ordering[j]
-        dist = nx.shortest_path_length(DG,source=v,weight='ufixweight')
-        
-        if j == 0:
-            min_dist = U+1
-        else:
-            min_dist = min( dist[ordering[t]] + population[v] for t in range(j) )
+        dist = csrgraph.dijkstra(graph, v, U-population[v])
         
-        if min_dist <= U:
+        # can v share a district with some earlier vertex? i.e., is dist(v,ordering[t])+p(v) <= U?
+        if any( ordering[t] in dist for t in range(j) ):
             break
         
         if m._R[v,j].LB < 0.5:
@@ -242,13 +310,13 @@ def do_Labeling_UFixing(m, DG, population, U, ordering, k):
                 m._X[v,t].UB = 0
                 UFixings_X += 1
         
-        for i in DG.nodes:
+        for i in range(graph.n):
             if i != v and m._R[i,j].UB > 0.5:
                 m._R[i,j].UB = 0
                 UFixings_R += 1
         
-        for i in DG.nodes:
-            if i != v and dist[i] + population[v] > U and m._X[i,j].UB > 0.5:
+        for i in range(graph.n):
+            if i != v and i not in dist and m._X[i,j].UB > 0.5:
                 m._X[i,j].UB = 0
                 UFixings_X += 1
         
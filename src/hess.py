@@ -2,41 +2,41 @@ import gurobipy as gp
 from gurobipy import GRB 
 
 def add_base_constraints(m, population, L, U, k):
-    DG = m._DG
+    graph = m._graph
     # Each vertex i assigned to one district
-    m.addConstrs(gp.quicksum(m._X[i,j] for j in DG.nodes) == 1 for i in DG.nodes)
+    m.addConstrs(gp.quicksum(m._X[i,j] for j in graph.nodes) == 1 for i in graph.nodes)
      
     # Pick k centers
-    m.addConstr(gp.quicksum(m._X[j,j] for j in DG.nodes) == k)
+    m.addConstr(gp.quicksum(m._X[j,j] for j in graph.nodes) == k)
     
     # Population balance: population assigned to vertex j should be in [L,U], if j is a center
-    m.addConstrs(gp.quicksum(population[i] * m._X[i,j] for i in DG.nodes) <= U * m._X[j,j] for j in DG.nodes)
-    m.addConstrs(gp.quicksum(population[i] * m._X[i,j] for i in DG.nodes) >= L * m._X[j,j] for j in DG.nodes)
+    m.addConstrs(gp.quicksum(population[i] * m._X[i,j] for i in graph.nodes) <= U * m._X[j,j] for j in graph.nodes)
+    m.addConstrs(gp.quicksum(population[i] * m._X[i,j] for i in graph.nodes) >= L * m._X[j,j] for j in graph.nodes)
     
     # Add coupling inequalities for added model strength
-    couplingConstrs = m.addConstrs(m._X[i,j] <= m._X[j,j] for i in DG.nodes for j in DG.nodes)
+    couplingConstrs = m.addConstrs(m._X[i,j] <= m._X[j,j] for i in graph.nodes for j in graph.nodes)
     
     # Make them user cuts
-    for i in DG.nodes:
-        for j in DG.nodes:
+    for i in graph.nodes:
+        for j in graph.nodes:
             couplingConstrs[i,j].Lazy = -1
     
     # Set branch priority on center vars
-    for j in DG.nodes:
+    for j in graph.nodes:
         m._X[j,j].BranchPriority=1         
 
         
-def add_objective(m, G):
+def add_objective(m, graph):
     # Y[i,j] = 1 if edge {i,j} is cut
-    m._Y = m.addVars(G.edges, vtype=GRB.BINARY)
-    m.addConstrs( m._X[i,v]-m._X[j,v] <= m._Y[i,j] for i,j in G.edges for v in G.nodes)
+    m._Y = m.addVars(graph.edges, vtype=GRB.BINARY)
+    m.addConstrs( m._X[i,v]-m._X[j,v] <= m._Y[i,j] for i,j in graph.edges for v in graph.nodes)
     m.setObjective( gp.quicksum(m._Y), GRB.MINIMIZE )
     
 
-def add_extended_objective(m, G):
+def add_extended_objective(m, graph):
     # Z[i,j,v] = 1 if edge (i,j) is cut because i->v but j!->v
-    m._Z = m.addVars(G.edges, G.nodes, vtype=GRB.BINARY) 
-    m.addConstrs( m._X[i,v]-m._X[j,v] <= m._Z[i,j,v] for i,j in G.edges for v in G.nodes)
+    m._Z = m.addVars(graph.edges, graph.nodes, vtype=GRB.BINARY) 
+    m.addConstrs( m._X[i,v]-m._X[j,v] <= m._Z[i,j,v] for i,j in graph.edges for v in graph.nodes)
     m.setObjective( gp.quicksum(m._Z), GRB.MINIMIZE )
     
     
@@ -51,34 +51,33 @@ def most_possible_nodes_in_one_district(population, U):
    
     
 def add_shir_constraints(m):
-    DG = m._DG
+    graph = m._graph
     
     # F[j,u,v] tells how much flow (from source j) is sent across arc (u,v)
-    F = m.addVars( DG.nodes, DG.edges, vtype=GRB.CONTINUOUS)
+    F = m.addVars( graph.nodes, graph.arcs, vtype=GRB.CONTINUOUS)
     
     # compute big-M    
     M = most_possible_nodes_in_one_district(m._population, m._U) - 1
     
-    m.addConstrs( gp.quicksum(F[j,u,j] for u in DG.neighbors(j)) == 0 for j in DG.nodes)
-    m.addConstrs( gp.quicksum( F[j,u,i]-F[j,i,u] for u in DG.neighbors(i) ) == m._X[i,j] for i in DG.nodes for j in DG.nodes if i!=j)
-    m.addConstrs( gp.quicksum( F[j,u,i] for u in DG.neighbors(i) ) <= M * m._X[i,j] for i in DG.nodes for j in DG.nodes if i!=j)
+    m.addConstrs( gp.quicksum(F[j,u,j] for u in graph.neighbors(j)) == 0 for j in graph.nodes)
+    m.addConstrs( gp.quicksum( F[j,u,i]-F[j,i,u] for u in graph.neighbors(i) ) == m._X[i,j] for i in graph.nodes for j in graph.nodes if i!=j)
+    m.addConstrs( gp.quicksum( F[j,u,i] for u in graph.neighbors(i) ) <= M * m._X[i,j] for i in graph.nodes for j in graph.nodes if i!=j)
     m.update()
       
         
-def add_scf_constraints(m, G, extended):
-    DG = m._DG
+def add_scf_constraints(m, graph, extended):
     
     # F[u,v] tells how much flow is sent across arc (u,v)
-    F = m.addVars( DG.edges, vtype=GRB.CONTINUOUS )
+    F = m.addVars( graph.arcs, vtype=GRB.CONTINUOUS )
     
     # compute big-M
     M = most_possible_nodes_in_one_district(m._population, m._U) - 1
     
-    m.addConstrs( gp.quicksum(m._X[i,j] for i in DG.nodes) == gp.quicksum(F[j,u]-F[u,j] for u in DG.neighbors(j)) + 1 for j in DG.nodes)
-    m.addConstrs( gp.quicksum(F[u,j] for u in DG.neighbors(j)) <= M * (1-m._X[j,j]) for j in DG.nodes)
+    m.addConstrs( gp.quicksum(m._X[i,j] for i in graph.nodes) == gp.quicksum(F[j,u]-F[u,j] for u in graph.neighbors(j)) + 1 for j in graph.nodes)
+    m.addConstrs( gp.quicksum(F[u,j] for u in graph.neighbors(j)) <= M * (1-m._X[j,j]) for j in graph.nodes)
         
     if extended:
-        m.addConstrs( F[i,j] + F[j,i] <= M * (1 - gp.quicksum(m._Z[i,j,v] for v in G.nodes)) for i,j in G.edges)
+        m.addConstrs( F[i,j] + F[j,i] <= M * (1 - gp.quicksum(m._Z[i,j,v] for v in graph.nodes)) for i,j in graph.edges)
     else:
-        m.addConstrs( F[i,j] + F[j,i] <= M * (1 - m._Y[i,j]) for i,j in G.edges)
+        m.addConstrs( F[i,j] + F[j,i] <= M * (1 - m._Y[i,j]) for i,j in graph.edges)
         
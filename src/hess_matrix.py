@@ -0,0 +1,146 @@
+import numpy as np
+from gurobipy import GRB
+
+import matrix
+from hess import most_possible_nodes_in_one_district
+
+# Same formulations as hess.py, built in bulk from sparse coefficient matrices. The models are identical
+#   (same variables, rows, and attributes, in the same order), but much faster to build for large graphs.
+
+def add_base_constraints(m, population, L, U, k):
+    graph = m._graph
+    n = graph.n
+    X = matrix.columns(m, m._X, (n,n))
+    diag = np.diagonal(X)
+    p = np.array(population, dtype=float)
+    V = np.arange(n)
+
+    # Each vertex i assigned to one district
+    matrix.add_rows(m, np.repeat(V, n), X.ravel(), np.ones(n*n), GRB.EQUAL, np.ones(n))
+
+    # Pick k centers
+    matrix.add_rows(m, np.zeros(n, dtype=np.int64), diag, np.ones(n), GRB.EQUAL, [k])
+
+    # Population balance: population assigned to vertex j should be in [L,U], if j is a center
+    row = np.concatenate((np.tile(V, n), V))
+    col = np.concatenate((X.ravel(), diag))
+    matrix.add_rows(m, row, col, np.concatenate((np.repeat(p, n), -U * np.ones(n))), GRB.LESS_EQUAL, np.zeros(n))
+    matrix.add_rows(m, row, col, np.concatenate((np.repeat(p, n), -L * np.ones(n))), GRB.GREATER_EQUAL, np.zeros(n))
+
+    # Add coupling inequalities for added model strength
+    row = np.arange(n*n)
+    couplingConstrs = matrix.add_rows(m, np.concatenate((row, row)), np.concatenate((X.ravel(), np.tile(diag, n))),
+                                      np.concatenate((np.ones(n*n), -np.ones(n*n))), GRB.LESS_EQUAL, np.zeros(n*n))
+
+    # Make them user cuts
+    couplingConstrs = couplingConstrs.tolist()
+    m.setAttr('Lazy', couplingConstrs, [-1] * len(couplingConstrs))
+
+    # Set branch priority on center vars
+    m.setAttr('BranchPriority', [m._X[j,j] for j in graph.nodes], [1] * n)
+
+
+# rows X[i,v] - X[j,v] - W[i,j,v] <= 0 for each edge {i,j} and each v, where W has shape (edges, n)
+def add_cut_edge_rows(m, graph, X, W):
+    n = graph.n
+    (tail, head) = matrix.edge_arrays(graph)
+    row = np.arange(len(tail) * n)
+    col = np.concatenate((X[tail].ravel(), X[head].ravel(), W.ravel()))
+    val = np.concatenate((np.ones(len(row)), -np.ones(len(row)), -np.ones(len(row))))
+    matrix.add_rows(m, np.tile(row, 3), col, val, GRB.LESS_EQUAL, np.zeros(len(row)))
+
+
+def add_objective(m, graph):
+    # Y[i,j] = 1 if edge {i,j} is cut
+    m._Y = m.addVars(graph.edges, vtype=GRB.BINARY)
+    X = matrix.columns(m, m._X, (graph.n,graph.n))
+    Y = matrix.columns(m, m._Y, (graph.m,))
+    add_cut_edge_rows(m, graph, X, np.repeat(Y, graph.n).reshape(graph.m, graph.n))
+    matrix.minimize_sum(m, m._Y)
+
+
+def add_extended_objective(m, graph):
+    # Z[i,j,v] = 1 if edge (i,j) is cut because i->v but j!->v
+    m._Z = m.addVars(graph.edges, graph.nodes, vtype=GRB.BINARY)
+    X = matrix.columns(m, m._X, (graph.n,graph.n))
+    Z = matrix.columns(m, m._Z, (graph.m,graph.n))
+    add_cut_edge_rows(m, graph, X, Z)
+    matrix.minimize_sum(m, m._Z)
+
+
+def add_shir_constraints(m):
+    graph = m._graph
+    n = graph.n
+    (tail, head, reverse) = matrix.arc_arrays(graph)
+
+    # F[j,u,v] tells how much flow (from source j) is sent across arc (u,v). Only used here, so no tupledict is needed
+    F = m.addMVar( (n,len(tail)), vtype=GRB.CONTINUOUS)
+    X = matrix.columns(m, m._X, (n,n))
+    F = matrix.columns(m, F, (n,len(tail)))
+
+    # compute big-M
+    M = most_possible_nodes_in_one_district(m._population, m._U) - 1
+
+    # no flow enters source j: arcs (u,j) are the reverses of arcs (j,u)
+    matrix.add_rows(m, tail, F[tail,reverse], np.ones(len(tail)), GRB.EQUAL, np.zeros(n))
+
+    # rows (i,j) for i!=j, in order i = 0, 1, ..., and then j. Arc p=(i,u) contributes F[j,u,i] - F[j,i,u]
+    J = np.arange(n)
+    arc_rows = tail[:,None] * (n-1) + J[None,:] - (J[None,:] > tail[:,None])
+    arc_keep = J[None,:] != tail[:,None]
+    arc_rows = arc_rows[arc_keep]
+    F_in = F.T[reverse][arc_keep]
+    F_out = F.T[np.arange(len(tail))][arc_keep]
+    X_keep = ~np.eye(n, dtype=bool)
+    X_rows = np.arange(n*(n-1))
+    X_cols = X[X_keep]
+
+    row = np.concatenate((arc_rows, arc_rows, X_rows))
+    col = np.concatenate((F_in, F_out, X_cols))
+    val = np.concatenate((np.ones(len(arc_rows)), -np.ones(len(arc_rows)), -np.ones(len(X_rows))))
+    matrix.add_rows(m, row, col, val, GRB.EQUAL, np.zeros(n*(n-1)))
+
+    row = np.concatenate((arc_rows, X_rows))
+    col = np.concatenate((F_in, X_cols))
+    val = np.concatenate((np.ones(len(arc_rows)), -M * np.ones(len(X_rows))))
+    matrix.add_rows(m, row, col, val, GRB.LESS_EQUAL, np.zeros(n*(n-1)))
+    m.update()
+
+
+def add_scf_constraints(m, graph, extended):
+    n = graph.n
+    (tail, head, reverse) = matrix.arc_arrays(graph)
+    (etail, ehead) = matrix.edge_arrays(graph)
+
+    # F[u,v] tells how much flow is sent across arc (u,v). Only used here, so no tupledict is needed
+    F = m.addMVar( len(tail), vtype=GRB.CONTINUOUS )
+    X = matrix.columns(m, m._X, (n,n))
+    F = matrix.columns(m, F, (len(tail),))
+
+    # compute big-M
+    M = most_possible_nodes_in_one_district(m._population, m._U) - 1
+
+    # sum_i X[i,j] - sum_u (F[j,u] - F[u,j]) = 1
+    row = np.concatenate((np.tile(np.arange(n), n), tail, tail))
+    col = np.concatenate((X.ravel(), F, F[reverse]))
+    val = np.concatenate((np.ones(n*n), -np.ones(len(tail)), np.ones(len(tail))))
+    matrix.add_rows(m, row, col, val, GRB.EQUAL, np.ones(n))
+
+    # sum_u F[u,j] + M X[j,j] <= M
+    row = np.concatenate((tail, np.arange(n)))
+    col = np.concatenate((F[reverse], np.diagonal(X)))
+    val = np.concatenate((np.ones(len(tail)), M * np.ones(n)))
+    matrix.add_rows(m, row, col, val, GRB.LESS_EQUAL, M * np.ones(n))
+
+    # F[i,j] + F[j,i] + M (sum_v Z[i,j,v] or Y[i,j]) <= M
+    e = np.arange(len(etail))
+    if extended:
+        W = matrix.columns(m, m._Z, (len(etail),n))
+    else:
+        W = matrix.columns(m, m._Y, (len(etail),1))
+    forward = F[matrix.arc_positions(graph, etail, ehead)]
+    backward = F[matrix.arc_positions(graph, ehead, etail)]
+    row = np.concatenate((e, e, np.repeat(e, W.shape[1])))
+    col = np.concatenate((forward, backward, W.ravel()))
+    val = np.concatenate((np.ones(len(e)), np.ones(len(e)), M * np.ones(W.size)))
+    matrix.add_rows(m, row, col, val, GRB.LESS_EQUAL, M * np.ones(len(e)))
@@ -5,6 +5,11 @@
 levels = { 'county', 'tract' }
 iteration_options = { 100, 1000, 10000 }
 
+# default limits for each chain (see --help)
+proposal_time_limit = 60    # seconds for recursive_tree_part, and for each recom proposal
+max_rejections = 1000       # rejected proposals in a row
+max_retries = 3             # retries with a fresh seed, after the chain gets stuck
+
 ###########################
 # Imports
 ###########################  
@@ -12,14 +17,23 @@ iteration_options = { 100, 1000, 10000 }
 import time
 import json
 import os
+import random
+import argparse
+import multiprocessing
+import concurrent.futures
+import contextlib
+import signal
+import math
 
 from gerrychain import (GeographicPartition, Graph, MarkovChain, updaters, constraints, accept)
 from gerrychain.tree import recursive_tree_part
 from gerrychain.proposals import recom
 from functools import partial
+import networkx as nx
 
-import geopandas as gpd
-import matplotlib.pyplot as plt
+import data_cache
+import export
+import local_search
 
 ###########################
 # Hard-coded inputs
@@ -49,164 +63,411 @@ congressional_districts = {
     'SC': 7, 'KY': 6, 'OR': 5, 'SD': 1
 }
 
-skips = {
-    ('WA','tract'), ('WA','county'), ('DE','tract'), ('DE','county'), ('WI','tract'), 
-    ('WI','county'), ('HI','tract'), ('HI','county'), ('FL','tract'), ('FL','county'), 
-    ('WY','tract'), ('WY','county'), ('NJ','tract'), ('NJ','county'), ('TX','tract'), 
-    ('TX','county'), ('LA','tract'), ('LA','county'), ('NC','tract'), ('NC','county'), 
-    ('ND','tract'), ('ND','county'), ('TN','tract'), ('TN','county'), ('NY','tract'), 
-    ('NY','county'), ('PA','tract'), ('PA','county'), ('AK','tract'), ('AK','county'), 
-    ('NV','county'), ('NH','county'), ('VA','tract'), ('VA','county'), ('CO','tract'), 
-    ('CO','county'), ('CA','tract'), ('CA','county'), ('AL','tract'), ('VT','tract'), 
-    ('VT','county'), ('IL','tract'), ('IL','county'), ('GA','tract'), ('GA','county'),
-    ('IN','tract'), ('IN','county'), ('IA','tract'), ('MA','tract'), ('MA','county'), 
-    ('AZ','tract'), ('AZ','county'), ('CT','tract'), ('CT','county'), ('ME','county'), 
-    ('MD','tract'), ('MD','county'), ('OK','tract'), ('OH','tract'), ('OH','county'), 
-    ('UT','county'), ('MO','tract'), ('MO','county'), ('MN','tract'), ('MN','county'), 
-    ('MI','tract'), ('MI','county'), ('RI','tract'), ('RI','county'), ('KS','tract'), 
-    ('MT','tract'), ('MT','county'), ('SC','tract'), ('SC','county'), ('KY','tract'), 
-    ('KY','county'), ('OR','tract'), ('OR','county'), ('SD','tract'), ('SD','county')
-}
-
-################################################
-# Draws districts and saves to png file
-################################################ 
+####################################
+# Updater for the total length of cut edges
+####################################
 
-def export_to_png(G, df, districts, filename):
-    
-    assignment = [ -1 for u in G.nodes ]
-    
-    for j in range(len(districts)):
-        for i in districts[j]:
-            geoID = G.nodes[i]["GEOID10"]
-            for u in G.nodes:
-                if geoID == df['GEOID10'][u]:
-                    assignment[u] = j
+# Sum of edge_length over the cut edges. After the first partition, it is updated from the parent's by looking
+#   only at the edges of flipped nodes (each edge once), whose cut status may have changed.
+def cut_length(partition):
+    graph = partition.graph
+    parent = partition.parent
+    if not parent:
+        return sum(graph.edges[e]['edge_length'] for e in partition["cut_edges"])
     
-    if min(assignment[v] for v in G.nodes) < 0:
-        print("Error: did not assign all nodes in district map png.")
-    else:
-        df['assignment'] = assignment
-        my_fig = df.plot(column='assignment').get_figure()
-        RESIZE_FACTOR = 3
-        my_fig.set_size_inches(my_fig.get_size_inches()*RESIZE_FACTOR)
-        plt.axis('off')
-        my_fig.savefig(filename)
-        
+    assignment = partition.assignment
+    old_assignment = parent.assignment
+    length = parent["cut_length"]
+    done = set()
+    for v in partition.flips:
+        for u in graph.neighbors(v):
+            if u in done:
+                continue # edge already looked at from u
+            was_cut = old_assignment[u] != old_assignment[v]
+            is_cut = assignment[u] != assignment[v]
+            if was_cut != is_cut:
+                edge_length = graph.edges[u,v]['edge_length']
+                length += edge_length if is_cut else -edge_length
+        done.add(v)
+    return length
+
+
+####################################
+# Settings to skip, and stuck chains
+####################################
+
+# reason to skip a setting (because it is trivial, or infeasible for recom), or None.
+#   Large settings are limited by --time-limit instead, and chains that get stuck by the limits below.
+def skip_reason(G, k, population_deviation):
+    if k == 1:
+        return "trivial (one district)"
+    if not nx.is_connected(G):
+        return "recom needs a connected graph"
+    U = math.floor((1+population_deviation/2)*sum(G.nodes[i]["TOTPOP"] for i in G.nodes())/k)
+    if max(G.nodes[i]["TOTPOP"] for i in G.nodes()) > U:
+        return "infeasible (a node has more population than a district may have)"
+    return None
+
+
+class ChainStuck(Exception):
+    pass
+
+
+# raises ChainStuck if the block takes more than seconds. Uses SIGALRM, so it only works in the main thread
+#   on Unix; elsewhere (or if seconds is None) there is no limit.
+@contextlib.contextmanager
+def time_limit(seconds, what):
+    if seconds is None or not hasattr(signal, 'SIGALRM'):
+        yield
+        return
+    def alarm(signum, frame):
+        raise ChainStuck(what+" took more than "+str(seconds)+" seconds")
+    previous = signal.signal(signal.SIGALRM, alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+# random state for retry r of the chain with the given seed
+def reseed(seed, r):
+    random.seed(None if seed is None else str(seed)+"-retry"+str(r))
+
 
 ####################################
 # Function for GerryChain call
 ####################################                       
 
-def run_GerryChain_heuristic(G,population_deviation,k,iterations):
+# Runs a chain until it has visited max(budgets) partitions (counting the initial one, like MarkovChain's total_steps).
+#   At each budget, takes a snapshot of the best partition so far, its # cut edges, and the time so far.
+#   The chain's state (a dict) can be saved and passed back in as saved, to continue the chain to larger budgets.
+#   The continued chain starts from the same partition and random state, but may differ from an uninterrupted
+#   chain, because recom picks from the cut edges in set order.
+# When the chain gets stuck (a proposal takes too long, or too many are rejected in a row), it continues from
+#   its current partition with a fresh random state, up to limits['retries'] times; then it stops. It also stops
+#   after limits['time'] seconds. A stopped chain reports its best partition for the budgets it did not reach.
+#   If no initial partition is found, ChainStuck is raised.
+def run_GerryChain_heuristic(G,population_deviation,k,budgets,verbose=True,saved=None,limits=None,seed=None):
     
-    my_updaters = {"population": updaters.Tally("TOTPOP", alias="population")}
-    start = recursive_tree_part(G,range(k),sum(G.nodes[i]["TOTPOP"] for i in G.nodes())/k,"TOTPOP", population_deviation/2,1)
-    initial_partition = GeographicPartition(G, start, updaters = my_updaters)
+    if limits is None:
+        limits = { 'time' : None, 'proposal_time' : proposal_time_limit, 'rejections' : max_rejections, 'retries' : max_retries }
+    
+    my_updaters = {"population": updaters.Tally("TOTPOP", alias="population"), "cut_length": cut_length}
+    pop_target = sum(G.nodes[i]["TOTPOP"] for i in G.nodes())/k
+    if saved is None:
+        for r in range(limits['retries']+1):
+            try:
+                with time_limit(limits['proposal_time'], "recursive_tree_part"):
+                    start = recursive_tree_part(G,range(k),pop_target,"TOTPOP", population_deviation/2,1)
+                break
+            except (ChainStuck, RuntimeError) as error:
+                print("Could not find an initial partition:",error)
+                if r == limits['retries']:
+                    raise ChainStuck("no initial partition after "+str(r+1)+" tries")
+                reseed(seed, r+1)
+        initial_partition = GeographicPartition(G, start, updaters = my_updaters)
+        saved = { 'steps' : 0, 'time' : 0.0, 'initial_obj' : initial_partition["cut_length"], 'snapshots' : dict(),
+                  'best_obj' : sum(G[i][j]['edge_length'] for i,j in G.edges), 'best_step' : None, 'best_assignment' : None,
+                  'proposals' : 0, 'retries' : 0, 'stopped' : None }
+    else:
+        (version, internal_state, gauss_next) = saved['random_state']
+        random.setstate((version, tuple(internal_state), gauss_next))
+        initial_partition = GeographicPartition(G, dict(enumerate(saved['assignment'])), updaters = my_updaters)
+        saved['stopped'] = None
+    retries = 0
     
     proposal = partial(recom,
                        pop_col="TOTPOP",
-                       pop_target=sum(G.nodes[i]["TOTPOP"] for i in G.nodes())/k,
+                       pop_target=pop_target,
                        epsilon=population_deviation/2,
                        node_repeats=2
                       )
     
+    # recom with a watchdog, counting the proposals since the last step (the rejected ones)
+    rejected = [0]
+    def watched_proposal(partition):
+        if rejected[0] >= limits['rejections']:
+            raise ChainStuck(str(rejected[0])+" proposals were rejected in a row")
+        rejected[0] += 1
+        saved['proposals'] += 1
+        with time_limit(limits['proposal_time'], "recom proposal"):
+            try:
+                return proposal(partition)
+            except RuntimeError as error: # recom found no balanced bipartition
+                raise ChainStuck("recom failed: "+str(error))
+    
+    # bound from the chain's first partition, also when continuing
     compactness_bound = constraints.UpperBound(
-        lambda p: len(p["cut_edges"]),
-        1.5*len(initial_partition["cut_edges"])
+        lambda p: p["cut_length"],
+        1.5*saved['initial_obj']
     )
     
     pop_constraint = constraints.within_percent_of_ideal_population(initial_partition, population_deviation/2)
     
-    my_chain = MarkovChain(
-        proposal=proposal,
-        constraints=[
-            pop_constraint,
-            compactness_bound
-        ],
-        accept=accept.always_accept,
-        initial_state=initial_partition,
-        total_steps=iterations
-    )
+    chain_start = time.time()
+    min_cut_edges = saved['best_obj']
+    if verbose:
+        print("In GerryChain heuristic, current # of cut edges: ",end='')
+        print(min_cut_edges,",",sep='',end=' ')
+    
+    # a continued (or restarted) chain has visited its initial partition already, so skip it
+    last_step = max(budgets)
+    partition = initial_partition
+    while saved['steps'] < last_step and saved['stopped'] is None:
+        skip = saved['steps'] > 0
+        my_chain = MarkovChain(
+            proposal=watched_proposal,
+            constraints=[
+                pop_constraint,
+                compactness_bound
+            ],
+            accept=accept.always_accept,
+            initial_state=partition,
+            total_steps=last_step-saved['steps']+skip
+        )
+        try:
+            for partition in my_chain:
+                if skip:
+                    skip = False
+                    continue
+                step = saved['steps']
+                saved['steps'] += 1
+                rejected[0] = 0
+                current_cut_edges = partition["cut_length"]
+                if verbose:
+                    print(current_cut_edges,",",sep='',end=' ')
+                if current_cut_edges < min_cut_edges:
+                    min_cut_edges = current_cut_edges
+                    saved['best_obj'] = current_cut_edges
+                    saved['best_step'] = step
+                    saved['best_assignment'] = [ partition.assignment[i] for i in G.nodes ]
+                elapsed = saved['time'] + time.time() - chain_start
+                if step+1 in budgets:
+                    saved['snapshots'][str(step+1)] = { 'obj' : min_cut_edges, 'best_step' : saved['best_step'], 'current_obj' : current_cut_edges, 'time' : elapsed,
+                                                        'districts' : [ [ i for i in G.nodes if saved['best_assignment'][i]==j ] for j in range(k) ] }
+                if limits['time'] is not None and elapsed > limits['time'] and saved['steps'] < last_step:
+                    saved['stopped'] = "time limit after "+str(saved['steps'])+" iterations"
+                    break
+        except ChainStuck as error:
+            retries += 1
+            saved['retries'] += 1
+            print("GerryChain got stuck after",saved['steps'],"iterations:",error)
+            if retries > limits['retries']:
+                saved['stopped'] = "stuck after "+str(saved['steps'])+" iterations ("+str(error)+")"
+            else:
+                reseed(seed, saved['retries'])
+                rejected[0] = 0
+    
+    if verbose:
+        print("Best heuristic solution has # cut edges =",min_cut_edges)
     
-    min_cut_edges = sum(G[i][j]['edge_length'] for i,j in G.edges)
-    print("In GerryChain heuristic, current # of cut edges: ",end='')
-    print(min_cut_edges,",",sep='',end=' ')
-    for partition in my_chain:
-        current_cut_edges = sum(G[i][j]['edge_length'] for i,j in partition["cut_edges"])
-        print(current_cut_edges,",",sep='',end=' ')
-        if current_cut_edges < min_cut_edges:
-            best_partition = partition
-            min_cut_edges = current_cut_edges
+    # budgets not reached by a stopped chain get its best partition
+    if saved['stopped'] is not None:
+        print("GerryChain stopped:",saved['stopped'])
+        elapsed = saved['time'] + time.time() - chain_start
+        for budget in budgets:
+            if budget > saved['steps']:
+                saved['snapshots'][str(budget)] = { 'obj' : min_cut_edges, 'best_step' : saved['best_step'], 'current_obj' : partition["cut_length"], 'time' : elapsed,
+                                                    'districts' : [ [ i for i in G.nodes if saved['best_assignment'][i]==j ] for j in range(k) ],
+                                                    'stopped' : saved['stopped'] }
     
-    print("Best heuristic solution has # cut edges =",min_cut_edges)
-    return ([[i for i in G.nodes if best_partition.assignment[i]==j] for j in range(k)],min_cut_edges)
+    saved['time'] += time.time() - chain_start
+    saved['assignment'] = [ partition.assignment[i] for i in G.nodes ]
+    saved['random_state'] = random.getstate()
+    return saved
+
+
+# one seeded chain (or a saved one, continued), as run by the worker processes. GerryChain draws from the random module.
+#   Returns None if the chain could not start.
+def run_chain(G,population_deviation,k,budgets,seed,saved=None,limits=None,verbose=False):
+    if saved is None:
+        random.seed(seed)
+    try:
+        saved = run_GerryChain_heuristic(G,population_deviation,k,budgets,verbose,saved,limits,seed)
+    except ChainStuck as error:
+        print("Chain with seed",seed,"failed:",error)
+        return None
+    saved['seed'] = seed
+    return saved
+
+
+# saved chains are kept in ../heuristic-results/chains, one file per chain
+def chain_filename(state, level, seed):
+    return "../heuristic-results/chains/heur_"+state+"_"+level+"_seed"+str(seed)+".json"
+
+
+def load_chains(state, level):
+    prefix = "heur_"+state+"_"+level+"_seed"
+    chains = list()
+    for filename in sorted(os.listdir("../heuristic-results/chains")):
+        if filename.startswith(prefix) and filename.endswith(".json"):
+            with open("../heuristic-results/chains/"+filename, 'r') as chain_file:
+                chains.append(json.load(chain_file))
+    return chains
 
 
 ###########################
 # Main part of the code
 ###########################  
 
-# create directories for results
-os.mkdir("../heuristic-results")
-for iterations in iteration_options:
-    os.mkdir("../heuristic-results/"+str(iterations)+"-iterations") 
-
-# run all settings
-for state in state_codes.keys():
+if __name__ == '__main__':
     
-    # parameters            
-    k = congressional_districts[state]
-    deviation = 0.01
-    code = state_codes[state]
+    # to run 8 independent chains per setting, all at the same time, and keep the best one, like this:
+    #       python heuristic.py --chains 8
+    # chains are seeded, so rerunning with the same --seed gives the same chains.
+    # each chain runs once, to the largest number of iterations, with results for the smaller numbers taken along the way.
+    # to continue the saved chains to more iterations, like this:
+    #       python heuristic.py --resume --iterations 100 1000 10000 20000
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chains', type=int, default=1, help='number of independent chains per setting; the best one is kept')
+    parser.add_argument('--processes', type=int, default=0, help='number of chains to run at the same time (default: all of them)')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the first chain; chain c gets seed+c (default: random)')
+    parser.add_argument('--iterations', type=int, nargs='+', default=sorted(iteration_options), help='numbers of iterations to report results for')
+    parser.add_argument('--resume', action='store_true', help='continue the saved chains of each setting (if any) instead of starting new ones')
+    parser.add_argument('--time-limit', type=float, default=None, help='seconds per chain; then it stops with its best partition so far (default: no limit)')
+    parser.add_argument('--proposal-time-limit', type=float, default=proposal_time_limit, help='seconds for finding the initial partition, and for each recom proposal')
+    parser.add_argument('--max-rejections', type=int, default=max_rejections, help='rejected proposals in a row, after which a chain is stuck')
+    parser.add_argument('--retries', type=int, default=max_retries, help='times a stuck chain continues with a fresh seed before it stops')
+    parser.add_argument('--no-refine', dest='refine', action='store_false', help='do not improve the best partition by local search')
+    args = parser.parse_args()
+    limits = { 'time' : args.time_limit, 'proposal_time' : args.proposal_time_limit, 'rejections' : args.max_rejections, 'retries' : args.retries }
     
-    for level in levels:
-        
-        # skip certain (state,level) pairs that we know:
-        #   1. are infeasible, 
-        #   2. are outside our scope (because of size), or
-        #   3. gerrychain gets stuck on (infinite loop).
-        
-        if (state,level) in skips:
-            continue
-        
-        # read input graph and shapefile df
-        G = Graph.from_json("../data/"+level+"/dual_graphs/"+level+code+".json")
-        df = gpd.read_file("../data/"+level+"/shape_files/"+state+"_"+level+".shp")
-        
-        # give each edge a "length" of one
-        for i,j in G.edges:
-            G[i][j]['edge_length'] = 1
+    number_of_chains = args.chains
+    processes = args.processes if args.processes > 0 else number_of_chains
+    first_seed = args.seed if args.seed is not None else random.SystemRandom().randrange(2**31)
+    budgets = sorted(set(args.iterations))
+    print("Running",number_of_chains,"chain(s) per setting, with seeds starting from",first_seed)
+    
+    # chains run in worker processes, unless there is only one at a time
+    if processes > 1:
+        context = multiprocessing.get_context('spawn')
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=context)
+    else:
+        executor = None
+    
+    # create directories for results
+    os.makedirs("../heuristic-results/chains", exist_ok=args.resume)
+    for iterations in budgets:
+        os.makedirs("../heuristic-results/"+str(iterations)+"-iterations", exist_ok=args.resume) 
+    
+    # run all settings
+    for state in state_codes.keys():
         
-        for iterations in iteration_options:
+        # parameters            
+        k = congressional_districts[state]
+        deviation = 0.01
+        code = state_codes[state]
         
-            # run GerryChain 
-            start = time.time()
-            (districts,heur_obj) = run_GerryChain_heuristic(G,deviation,k,iterations)
-            stop = time.time()
+        for level in levels:
             
-            # filename for outputs
-            fn = "../heuristic-results/"+str(iterations)+"-iterations/heur_"+state+"_"+level
+            # read input graph
+            graph_filename = "../data/"+level+"/dual_graphs/"+level+code+".json"
+            if not os.path.exists(graph_filename):
+                print("Skipping",state,level,": no dual graph")
+                continue
+            G = Graph.from_json(graph_filename)
             
-            # draw the solution on a map
-            png_fn = fn + ".png"
-            export_to_png(G, df, districts, png_fn)
+            # skip (state,level) pairs that are trivial or infeasible
+            reason = skip_reason(G, k, deviation)
+            if reason is not None:
+                print("Skipping",state,level,":",reason)
+                continue
             
-            # dump the solution info to json file
-            json_fn = fn + ".json"
-            with open(json_fn, 'w') as outfile:
-                data = {}
-                data['obj'] = heur_obj
-                data['time'] = '{0:.2f}'.format(stop-start)
-                data['iterations'] = iterations
-                data['nodes'] = list()
-        
-                for j in range(k):
-                    for i in districts[j]:
-                        data['nodes'].append({
-                                'name': G.nodes[i]["NAME10"],
-                                'index': i,
-                                'district': j
-                                })
-                json.dump(data, outfile)
+            # read shapefile df (if any; else no maps are drawn)
+            graph = data_cache.load_graph(graph_filename) # compact copy of G, for export
+            shape_filename = "../data/"+level+"/shape_files/"+state+"_"+level+".shp"
+            df = data_cache.load_shapes(shape_filename) if os.path.exists(shape_filename) else None
+            
+            # give each edge a "length" of one
+            for i,j in G.edges:
+                G[i][j]['edge_length'] = 1
+            
+            # run (or continue) GerryChain to the largest number of iterations, and save the chains
+            saved_chains = load_chains(state, level) if args.resume else list()
+            if saved_chains:
+                tasks = [ (saved['seed'], saved) for saved in saved_chains ]
+            else:
+                tasks = [ (first_seed + c, None) for c in range(number_of_chains) ]
+            if executor is None:
+                chains = [ run_chain(G,deviation,k,budgets,seed,saved,limits,verbose=True) for (seed,saved) in tasks ]
+            else:
+                futures = [ executor.submit(run_chain,G,deviation,k,budgets,seed,saved,limits) for (seed,saved) in tasks ]
+                chains = list()
+                for ((seed,saved), future) in zip(tasks, futures):
+                    try:
+                        chains.append(future.result())
+                    except Exception as error:
+                        print("Chain with seed",seed,"failed:",repr(error))
+                        chains.append(None)
+            chains = [ chain for chain in chains if chain is not None ]
+            if not chains:
+                print("Failed",state,level,": no chain found an initial partition.")
+                continue
+            for chain in chains:
+                with open(chain_filename(state, level, chain['seed']), 'w') as chain_file:
+                    json.dump(chain, chain_file)
+            
+            for iterations in budgets:
+                
+                # keep the best chain at this number of iterations (the first one, in case of ties)
+                snapshots = [ chain['snapshots'].get(str(iterations)) for chain in chains ]
+                if None in snapshots:
+                    print(state,level,iterations,"iterations: no results, as the saved chains are past this number of iterations.")
+                    continue
+                best = min(range(len(chains)), key=lambda c: snapshots[c]['obj'])
+                districts = snapshots[best]['districts']
+                heur_obj = snapshots[best]['obj']
+                heur_time = max(snapshot['time'] for snapshot in snapshots)
+                print(state,level,iterations,"iterations: best of",len(chains),"chain(s) has # cut edges =",heur_obj)
                 
+                # improve it by local search, keeping the population bounds of main.py
+                if args.refine:
+                    L = math.ceil((1-deviation/2)*sum(graph.pop)/k)
+                    U = math.floor((1+deviation/2)*sum(graph.pop)/k)
+                    start = time.time()
+                    (districts, refine_obj) = local_search.refine(graph, districts, L, U)
+                    refine_time = time.time() - start
+                    heur_time += refine_time
+                    print("After local search, # cut edges =",refine_obj)
+                
+                # filename for outputs
+                fn = "../heuristic-results/"+str(iterations)+"-iterations/heur_"+state+"_"+level
+                
+                # draw the solution on a map
+                if df is not None:
+                    png_fn = fn + ".png"
+                    export.submit(export.export_to_png, graph, df, districts, png_fn)
+                
+                # dump the solution info to json file. Chains run at the same time, so the time is the slowest chain's (plus local search)
+                json_fn = fn + ".json"
+                with open(json_fn, 'w') as outfile:
+                    data = {}
+                    data['obj'] = refine_obj if args.refine else heur_obj
+                    data['time'] = '{0:.2f}'.format(heur_time)
+                    data['iterations'] = iterations
+                    if args.refine:
+                        data['chain_obj'] = heur_obj
+                        data['refine_time'] = '{0:.2f}'.format(refine_time)
+                    data['seed'] = chains[best]['seed']
+                    data['chains'] = [ { 'seed' : chain['seed'], 'initial_obj' : chain['initial_obj'], 'obj' : snapshot['obj'],
+                                         'final_obj' : snapshot['current_obj'], 'best_step' : snapshot['best_step'],
+                                         'time' : '{0:.2f}'.format(snapshot['time']), 'proposals' : chain['proposals'],
+                                         'retries' : chain['retries'], 'stopped' : snapshot.get('stopped') } for (chain, snapshot) in zip(chains, snapshots) ]
+                    data['nodes'] = list()
+            
+                    for j in range(k):
+                        for i in districts[j]:
+                            data['nodes'].append({
+                                    'name': G.nodes[i]["NAME10"],
+                                    'index': i,
+                                    'district': j
+                                    })
+                    json.dump(data, outfile)
+    
+    if executor is not None:
+        executor.shutdown()
+    
+    # wait for the last maps to be drawn
+    export.wait()
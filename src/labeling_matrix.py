@@ -0,0 +1,203 @@
+import numpy as np
+from gurobipy import GRB
+
+import matrix
+from labeling import most_possible_nodes_in_one_district
+
+# Same formulations as labeling.py, built in bulk from sparse coefficient matrices. The models are identical
+#   (same variables, rows, and attributes, in the same order), but much faster to build for large graphs.
+
+def add_base_constraints(m, population, L, U, k):
+    graph = m._graph
+    n = graph.n
+    X = matrix.columns(m, m._X, (n,k))
+    p = np.array(population, dtype=float)
+
+    # Each vertex i assigned to one district
+    matrix.add_rows(m, np.repeat(np.arange(n), k), X.ravel(), np.ones(n*k), GRB.EQUAL, np.ones(n))
+
+    # Population balance: population assigned to district j should be in [L,U]
+    row = np.tile(np.arange(k), n)
+    matrix.add_rows(m, row, X.ravel(), np.repeat(p, k), GRB.LESS_EQUAL, U * np.ones(k))
+    matrix.add_rows(m, row, X.ravel(), np.repeat(p, k), GRB.GREATER_EQUAL, L * np.ones(k))
+
+
+# rows X[i,v] - X[j,v] - W[i,j,v] <= 0 for each edge {i,j} and each v, where W has shape (edges, k)
+def add_cut_edge_rows(m, graph, X, W):
+    (tail, head) = matrix.edge_arrays(graph)
+    row = np.arange(W.size)
+    col = np.concatenate((X[tail].ravel(), X[head].ravel(), W.ravel()))
+    val = np.concatenate((np.ones(len(row)), -np.ones(len(row)), -np.ones(len(row))))
+    matrix.add_rows(m, np.tile(row, 3), col, val, GRB.LESS_EQUAL, np.zeros(len(row)))
+
+
+def add_objective(m, graph, k):
+    # Y[i,j] = 1 if edge {i,j} is cut
+    m._Y = m.addVars(graph.edges, vtype=GRB.BINARY)
+    X = matrix.columns(m, m._X, (graph.n,k))
+    Y = matrix.columns(m, m._Y, (graph.m,))
+    add_cut_edge_rows(m, graph, X, np.repeat(Y, k).reshape(graph.m, k))
+    matrix.minimize_sum(m, m._Y)
+
+
+def add_extended_objective(m, graph, k):
+    # Z[i,j,v] = 1 if edge (i,j) is cut because i->v but j!->v
+    m._Z = m.addVars(graph.edges, range(k), vtype=GRB.BINARY)
+    X = matrix.columns(m, m._X, (graph.n,k))
+    Z = matrix.columns(m, m._Z, (graph.m,k))
+    add_cut_edge_rows(m, graph, X, Z)
+    matrix.minimize_sum(m, m._Z)
+
+
+def add_orbitope_extended_formulation(m, graph, k, ordering):
+    n = graph.n
+    # auxiliary variables are only used here, so no tupledicts are needed
+    s = m.addMVar((n,k), vtype=GRB.CONTINUOUS)
+    u = m.addMVar((n,k), vtype=GRB.CONTINUOUS)
+    w = m.addMVar((n,k), vtype=GRB.CONTINUOUS)
+    X = matrix.columns(m, m._X, (n,k))
+    R = matrix.columns(m, m._R, (n,k))
+    s = matrix.columns(m, s, (n,k))
+    u = matrix.columns(m, u, (n,k))
+    w = matrix.columns(m, w, (n,k))
+
+    # the same matrices, with rows in the order of the vertex ordering
+    order = np.array(ordering, dtype=np.int64)
+    (Ro, uo, wo) = (R[order], u[order], w[order])
+
+    # X[i,j] == s[i,j] - s[i,j+1], and X[i,k-1] == s[i,k-1]
+    rows = np.arange(n*(k-1))
+    matrix.add_rows(m, np.tile(rows, 3), np.concatenate((X[:,:-1].ravel(), s[:,:-1].ravel(), s[:,1:].ravel())),
+                    np.concatenate((np.ones(len(rows)), -np.ones(len(rows)), np.ones(len(rows)))), GRB.EQUAL, np.zeros(len(rows)))
+    rows = np.arange(n)
+    matrix.add_rows(m, np.tile(rows, 2), np.concatenate((X[:,-1], s[:,-1])),
+                    np.concatenate((np.ones(n), -np.ones(n))), GRB.EQUAL, np.zeros(n))
+
+    # R[ordering[0],j] == w[ordering[0],j], and R[ordering[i],j] == w[ordering[i],j] - w[ordering[i-1],j]
+    rows = np.arange(k)
+    matrix.add_rows(m, np.tile(rows, 2), np.concatenate((Ro[0], wo[0])),
+                    np.concatenate((np.ones(k), -np.ones(k))), GRB.EQUAL, np.zeros(k))
+    rows = np.arange((n-1)*k)
+    matrix.add_rows(m, np.tile(rows, 3), np.concatenate((Ro[1:].ravel(), wo[1:].ravel(), wo[:-1].ravel())),
+                    np.concatenate((np.ones(len(rows)), -np.ones(len(rows)), np.ones(len(rows)))), GRB.EQUAL, np.zeros(len(rows)))
+
+    # R[i,j] <= X[i,j], and s[i,j] <= w[i,j]
+    rows = np.arange(n*k)
+    matrix.add_rows(m, np.tile(rows, 2), np.concatenate((R.ravel(), X.ravel())),
+                    np.concatenate((np.ones(n*k), -np.ones(n*k))), GRB.LESS_EQUAL, np.zeros(n*k))
+    matrix.add_rows(m, np.tile(rows, 2), np.concatenate((s.ravel(), w.ravel())),
+                    np.concatenate((np.ones(n*k), -np.ones(n*k))), GRB.LESS_EQUAL, np.zeros(n*k))
+
+    # u[ordering[i],j] + R[ordering[i],j] == u[ordering[i+1],j] + R[ordering[i+1],j+1], for j < k-1
+    rows = np.arange((n-1)*(k-1))
+    col = np.concatenate((uo[:-1,:-1].ravel(), Ro[:-1,:-1].ravel(), uo[1:,:-1].ravel(), Ro[1:,1:].ravel()))
+    val = np.concatenate((np.ones(2*len(rows)), -np.ones(2*len(rows))))
+    matrix.add_rows(m, np.tile(rows, 4), col, val, GRB.EQUAL, np.zeros(len(rows)))
+
+    # u[ordering[i],k-1] + R[ordering[i],k-1] == u[ordering[i+1],k-1]
+    rows = np.arange(n-1)
+    col = np.concatenate((uo[:-1,-1], Ro[:-1,-1], uo[1:,-1]))
+    val = np.concatenate((np.ones(2*(n-1)), -np.ones(n-1)))
+    matrix.add_rows(m, np.tile(rows, 3), col, val, GRB.EQUAL, np.zeros(n-1))
+
+    # u[ordering[n-1],j] + R[ordering[n-1],j] == 0, for j < k-1
+    rows = np.arange(k-1)
+    matrix.add_rows(m, np.tile(rows, 2), np.concatenate((uo[-1,:-1], Ro[-1,:-1])), np.ones(2*(k-1)), GRB.EQUAL, np.zeros(k-1))
+
+    m._R[ordering[0],0].LB=1
+    matrix.add_rows(m, np.zeros(2, dtype=np.int64), [uo[-1,-1], Ro[-1,-1]], np.ones(2), GRB.EQUAL, [1])
+
+
+# sum_i R[i,j] == 1 and R[i,j] <= X[i,j]; weaker than some constraints in the orbitope EF
+def add_root_constraints(m, X, R):
+    (n, k) = X.shape
+    matrix.add_rows(m, np.tile(np.arange(k), n), R.ravel(), np.ones(n*k), GRB.EQUAL, np.ones(k))
+    rows = np.arange(n*k)
+    matrix.add_rows(m, np.tile(rows, 2), np.concatenate((R.ravel(), X.ravel())),
+                    np.concatenate((np.ones(n*k), -np.ones(n*k))), GRB.LESS_EQUAL, np.zeros(n*k))
+
+
+def add_shir_constraints(m, symmetry):
+    graph = m._graph
+    n = graph.n
+    k = m._k
+    (tail, head, reverse) = matrix.arc_arrays(graph)
+
+    # g[i,j] = amount of flow generated at node i of type j
+    g = m.addMVar((n,k), vtype=GRB.CONTINUOUS)
+
+    # f[j,u,v] = amount of flow sent across arc uv of type j
+    f = m.addMVar((k,len(tail)), vtype=GRB.CONTINUOUS)
+    X = matrix.columns(m, m._X, (n,k))
+    R = matrix.columns(m, m._R, (n,k))
+    g = matrix.columns(m, g, (n,k))
+    f = matrix.columns(m, f, (k,len(tail)))
+
+    # compute big-M
+    M = most_possible_nodes_in_one_district(m._population, m._U) - 1
+
+    # the following constraints are weaker than some in the orbitope EF
+    if symmetry != 'orbitope':
+        add_root_constraints(m, X, R)
+
+    # flow can only be generated at roots
+    rows = np.arange(n*k)
+    matrix.add_rows(m, np.tile(rows, 2), np.concatenate((g.ravel(), R.ravel())),
+                    np.concatenate((np.ones(n*k), -(M+1) * np.ones(n*k))), GRB.LESS_EQUAL, np.zeros(n*k))
+
+    # rows (i,j), where arc p=(i,u) contributes f[j,u,i] (entering i) and f[j,i,u] (leaving i)
+    arc_rows = (tail[:,None] * k + np.arange(k)[None,:]).ravel()
+    f_in = f.T[reverse].ravel()
+    f_out = f.T.ravel()
+
+    # flow balance
+    row = np.concatenate((rows, rows, arc_rows, arc_rows))
+    col = np.concatenate((g.ravel(), X.ravel(), f_out, f_in))
+    val = np.concatenate((np.ones(n*k), -np.ones(n*k), -np.ones(len(arc_rows)), np.ones(len(arc_rows))))
+    matrix.add_rows(m, row, col, val, GRB.EQUAL, np.zeros(n*k))
+
+    # flow type j can enter vertex i only if (i is assigned to district j) and (i is not root of j)
+    row = np.concatenate((arc_rows, rows, rows))
+    col = np.concatenate((f_in, X.ravel(), R.ravel()))
+    val = np.concatenate((np.ones(len(arc_rows)), -M * np.ones(n*k), M * np.ones(n*k)))
+    matrix.add_rows(m, row, col, val, GRB.LESS_EQUAL, np.zeros(n*k))
+
+
+def add_scf_constraints(m, graph, extended, symmetry):
+    n = graph.n
+    k = m._k
+    (tail, head, reverse) = matrix.arc_arrays(graph)
+    (etail, ehead) = matrix.edge_arrays(graph)
+
+    # f[u,v] = amount of flow sent across arc uv
+    f = m.addMVar(len(tail), vtype=GRB.CONTINUOUS)
+    X = matrix.columns(m, m._X, (n,k))
+    R = matrix.columns(m, m._R, (n,k))
+    f = matrix.columns(m, f, (len(tail),))
+
+    # compute big-M
+    M = most_possible_nodes_in_one_district(m._population, m._U)
+
+    # the following constraints are weaker than some in the orbitope EF
+    if symmetry != 'orbitope':
+        add_root_constraints(m, X, R)
+
+    # if not a root, consume some flow.
+    # if a root, only send out so much flow.
+    row = np.concatenate((tail, tail, np.repeat(np.arange(n), k)))
+    col = np.concatenate((f[reverse], f, R.ravel()))
+    val = np.concatenate((np.ones(len(tail)), -np.ones(len(tail)), M * np.ones(n*k)))
+    matrix.add_rows(m, row, col, val, GRB.GREATER_EQUAL, np.ones(n))
+
+    # do not send flow across cut edges
+    e = np.arange(len(etail))
+    if extended:
+        W = matrix.columns(m, m._Z, (len(etail),k))
+    else:
+        W = matrix.columns(m, m._Y, (len(etail),1))
+    forward = f[matrix.arc_positions(graph, etail, ehead)]
+    backward = f[matrix.arc_positions(graph, ehead, etail)]
+    row = np.concatenate((e, e, np.repeat(e, W.shape[1])))
+    col = np.concatenate((forward, backward, W.ravel()))
+    val = np.concatenate((np.ones(len(e)), np.ones(len(e)), (M-1) * np.ones(W.size)))
+    matrix.add_rows(m, row, col, val, GRB.LESS_EQUAL, (M-1) * np.ones(len(e)))
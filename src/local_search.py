@@ -0,0 +1,322 @@
+import math
+import time
+import heapq
+
+import csrgraph
+
+# Boundary local search for districting plans. Fiduccia-Mattheyses style passes move vertices between neighboring
+#   districts to reduce the number of cut edges, while keeping every district's population in [L,U] and every
+#   district connected. When a single move would break the population bounds, a (Kernighan-Lin style) swap with a
+#   nearby vertex of the other district is tried instead.
+
+
+class Refiner:
+
+    # label[v] is the district (in 0, 1, ..., k-1) of vertex v
+    def __init__(self, graph, label, k, L, U):
+        self.graph = graph
+        self.label = list(label)
+        self.k = k
+        self.L = L
+        self.U = U
+
+        # population of each district, and number of neighbors of each vertex in each district
+        #   (counted with their edge weights, which are 1 except on the coarse graphs of multilevel.py)
+        self.dpop = [0] * k
+        self.size = [0] * k
+        self.nbr = [ [0] * k for v in graph.nodes ]
+        for v in graph.nodes:
+            self.dpop[self.label[v]] += graph.pop[v]
+            self.size[self.label[v]] += 1
+            for (u, w) in zip(graph.adjacency[v], graph.weights[v]):
+                self.nbr[v][self.label[u]] += w
+        self.cut = sum( w for ((u,v), w) in zip(graph.edges, graph.edge_weight.tolist()) if self.label[u] != self.label[v] )
+        self.max_gain = max( (sum(weights) for weights in graph.weights), default=0 )
+
+    def gain(self, v, b):
+        return self.nbr[v][b] - self.nbr[v][self.label[v]]
+
+    def move(self, v, b):
+        a = self.label[v]
+        self.cut -= self.gain(v, b)
+        self.label[v] = b
+        self.dpop[a] -= self.graph.pop[v]
+        self.dpop[b] += self.graph.pop[v]
+        self.size[a] -= 1
+        self.size[b] += 1
+        for (u, w) in zip(self.graph.adjacency[v], self.graph.weights[v]):
+            self.nbr[u][a] -= w
+            self.nbr[u][b] += w
+
+    # is district label[v] still connected without v?
+    def can_leave(self, v):
+        adjacency = self.graph.adjacency
+        a = self.label[v]
+        inside = [ u for u in adjacency[v] if self.label[u] == a ]
+        if len(inside) <= 1:
+            return True
+
+        # quick check: the neighbors of v in the district are connected among themselves
+        remaining = set(inside)
+        stack = [ remaining.pop() ]
+        while stack:
+            x = stack.pop()
+            for y in adjacency[x]:
+                if y in remaining:
+                    remaining.remove(y)
+                    stack.append(y)
+        if not remaining:
+            return True
+
+        # else search the district (without v) from one of them, until all of them are found
+        visited = { v, inside[0] }
+        stack = [ inside[0] ]
+        remaining = set(inside[1:])
+        while stack and remaining:
+            x = stack.pop()
+            for y in adjacency[x]:
+                if y not in visited and self.label[y] == a:
+                    visited.add(y)
+                    remaining.discard(y)
+                    stack.append(y)
+        return not remaining
+
+    def population_ok(self, j, change):
+        return self.L <= self.dpop[j] + change <= self.U
+
+    # how far district j's population (after change) is outside [L,U]
+    def violation(self, j, change=0):
+        p = self.dpop[j] + change
+        return max(0, p - self.U, self.L - p)
+
+    # Moves boundary vertices out of districts with population above U and into districts below L, always the move
+    #   that reduces the total violation most (ties go to fewer cut edges), keeping districts connected and nonempty.
+    #   Stops after max_moves moves, or at the deadline. Returns True if all populations are then in [L,U].
+    def balance(self, max_moves, deadline=math.inf):
+        pop = self.graph.pop
+        districts = range(self.k)
+        for t in range(max_moves):
+            if time.time() >= deadline:
+                return False
+            violation = [ self.violation(j) for j in districts ]
+            bad = [ j for j in districts if violation[j] > 0 ]
+            if not bad:
+                return True
+
+            candidates = list()
+            for v in self.graph.nodes:
+                a = self.label[v]
+                if self.size[a] == 1:
+                    continue
+                nbr = self.nbr[v]
+                for b in (districts if violation[a] > 0 else bad):
+                    if b != a and nbr[b] > 0:
+                        change = self.violation(a, -pop[v]) + self.violation(b, pop[v]) - violation[a] - violation[b]
+                        if change < 0:
+                            candidates.append((change, -self.gain(v, b), v, b))
+            candidates.sort()
+            for (change, g, v, b) in candidates:
+                if self.can_leave(v):
+                    self.move(v, b)
+                    break
+            else:
+                return False
+        return not any( self.violation(j) > 0 for j in range(self.k) )
+
+    # vertex u of district b to swap with v (which just moved from a to b), or None.
+    #   Candidates are vertices of b within distance two of v that touch a and restore the population bounds
+    def swap_partner(self, v, a, b, locked):
+        adjacency = self.graph.adjacency
+        pop = self.graph.pop
+        candidates = set(adjacency[v])
+        for u in adjacency[v]:
+            candidates.update(adjacency[u])
+        candidates = [ u for u in candidates if self.label[u] == b and u != v and not locked[u] and self.nbr[u][a] > 0
+                       and self.population_ok(a, pop[u]) and self.population_ok(b, -pop[u]) ]
+        candidates.sort(key=lambda u: -self.gain(u, a))
+        for u in candidates:
+            if self.can_leave(u):
+                return u
+        return None
+
+    # One pass: repeatedly make the best allowed move (or swap), each vertex moving at most once, until patience
+    #   moves in a row do not improve on the best cut; then roll back to the best cut. Returns True if it improved.
+    def fm_pass(self, deadline, patience):
+        graph = self.graph
+        pop = graph.pop
+        D = self.max_gain
+        locked = [ False for v in graph.nodes ]
+
+        # moves (v,b) in buckets by gain; entries[v] lists the moves of v that are in buckets
+        buckets = [ set() for g in range(2*D+1) ]
+        entries = { v : list() for v in graph.nodes }
+        top = [-1]
+
+        def insert(v):
+            for b in { self.label[u] for u in graph.adjacency[v] }:
+                if b != self.label[v]:
+                    g = self.gain(v, b) + D
+                    buckets[g].add((v,b))
+                    entries[v].append((g,b))
+                    top[0] = max(top[0], g)
+
+        def remove(v):
+            for (g,b) in entries[v]:
+                buckets[g].discard((v,b))
+            entries[v] = list()
+
+        def moved(x):
+            locked[x] = True
+            remove(x)
+            for y in graph.adjacency[x]:
+                if not locked[y]:
+                    remove(y)
+                    insert(y)
+
+        for v in graph.nodes:
+            insert(v)
+
+        history = list()
+        best_cut = self.cut
+        best_length = 0
+        while len(history) - best_length < patience and time.time() < deadline:
+            while top[0] >= 0 and not buckets[top[0]]:
+                top[0] -= 1
+            if top[0] < 0:
+                break
+            (v,b) = buckets[top[0]].pop()
+            entries[v].remove((top[0],b))
+            a = self.label[v]
+            if not self.can_leave(v):
+                continue
+
+            if self.population_ok(a, -pop[v]) and self.population_ok(b, pop[v]):
+                self.move(v, b)
+                history.append((v,a,b))
+                moved(v)
+            else:
+                self.move(v, b)
+                u = self.swap_partner(v, a, b, locked)
+                if u is None:
+                    self.move(v, a)
+                    continue
+                self.move(u, a)
+                history.append((v,a,b))
+                history.append((u,b,a))
+                moved(v)
+                moved(u)
+
+            if self.cut < best_cut:
+                best_cut = self.cut
+                best_length = len(history)
+
+        for (v,a,b) in reversed(history[best_length:]):
+            self.move(v, a)
+        return best_length > 0
+
+    def districts(self):
+        return [ [ v for v in self.graph.nodes if self.label[v] == j ] for j in range(self.k) ]
+
+
+# Districting plan from fractional assignments, like an LP solution: weight[v][j] is how much vertex v belongs
+#   to district j. Each vertex goes to its heaviest district, and each district keeps only its heaviest connected
+#   piece; the other vertices then join neighboring districts (heaviest first), and populations are balanced.
+#   Returns the districts, or None if that fails (or balancing does not finish by the deadline).
+def repair(graph, weight, L, U, max_moves=None, deadline=math.inf):
+    k = len(weight[0])
+    label = [ max(range(k), key=lambda j: weight[v][j]) for v in graph.nodes ]
+
+    # a district that got no vertex starts from its heaviest vertex (that is not alone in its district)
+    size = [0] * k
+    for v in graph.nodes:
+        size[label[v]] += 1
+    for j in range(k):
+        if size[j] == 0:
+            v = max( (v for v in graph.nodes if size[label[v]] > 1), key=lambda v: weight[v][j] )
+            size[label[v]] -= 1
+            label[v] = j
+            size[j] = 1
+
+    for j in range(k):
+        components = csrgraph.connected_components(graph, [ v for v in graph.nodes if label[v] == j ])
+        heaviest = max(components, key=lambda component: sum( weight[v][j] for v in component ))
+        for component in components:
+            if component is not heaviest:
+                for v in component:
+                    label[v] = -1
+
+    heap = [ (-weight[u][label[v]], u, label[v]) for v in graph.nodes if label[v] >= 0 for u in graph.adjacency[v] if label[u] < 0 ]
+    heapq.heapify(heap)
+    while heap:
+        (w, v, j) = heapq.heappop(heap)
+        if label[v] >= 0:
+            continue
+        label[v] = j
+        for u in graph.adjacency[v]:
+            if label[u] < 0:
+                heapq.heappush(heap, (-weight[u][j], u, j))
+    if min(label) < 0:
+        return None # some vertex cannot reach any district
+
+    refiner = Refiner(graph, label, k, L, U)
+    if not refiner.balance(graph.n if max_moves is None else max_moves, deadline):
+        return None
+    return refiner.districts()
+
+
+# A random plan with k connected districts: district labels 0, ..., k-1 of the vertices, grown
+#   breadth-first (in random order) from k random seeds
+def random_plan(graph, k, rng):
+    label = [ -1 for v in graph.nodes ]
+    frontier = list()
+    for (j, v) in enumerate(rng.sample(list(graph.nodes), k)):
+        label[v] = j
+        frontier.append(v)
+    while frontier:
+        t = rng.randrange(len(frontier))
+        (frontier[t], frontier[-1]) = (frontier[-1], frontier[t])
+        v = frontier.pop()
+        for u in graph.adjacency[v]:
+            if label[u] == -1:
+                label[u] = label[v]
+                frontier.append(u)
+    return label
+
+
+# number of cut edges (counted with their weights) of a districting plan
+def cut_edges(graph, districts):
+    label = [ -1 for v in graph.nodes ]
+    for j in range(len(districts)):
+        for v in districts[j]:
+            label[v] = j
+    return sum( w for ((u,v), w) in zip(graph.edges, graph.edge_weight.tolist()) if label[u] != label[v] )
+
+
+# is each district connected, with population in [L,U]?
+def is_feasible(graph, districts, L, U):
+    for district in districts:
+        if not L <= sum( graph.pop[v] for v in district ) <= U:
+            return False
+        if not csrgraph.is_connected(graph, district):
+            return False
+    return True
+
+
+# Refines a districting plan (a list of districts, each a list of vertices) for at most time_limit seconds.
+#   Returns (refined districts, number of cut edges); districts keep their positions in the list.
+#   A plan that is not feasible (population in [L,U], connected districts) is returned unchanged.
+def refine(graph, districts, L, U, time_limit=60, patience=100):
+    label = [ -1 for v in graph.nodes ]
+    for j in range(len(districts)):
+        for v in districts[j]:
+            label[v] = j
+    refiner = Refiner(graph, label, len(districts), L, U)
+    if min(label) < 0 or not is_feasible(graph, districts, L, U):
+        print("Plan is not feasible, so it is not refined.")
+        return (districts, refiner.cut)
+
+    deadline = time.time() + time_limit
+    while time.time() < deadline:
+        if not refiner.fm_pass(deadline, patience):
+            break
+    return (refiner.districts(), refiner.cut)
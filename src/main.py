@@ -5,25 +5,36 @@
 import gurobipy as gp
 from gurobipy import GRB 
 
-import matplotlib.pyplot as plt
-
 from datetime import date
 import math
-import networkx as nx
 import csv
 import time
 import json
 import sys
 import os
+import argparse
+import multiprocessing
+import concurrent.futures
 
 import hess
 import labeling
 import ordering
 import fixing
 import separation
+import primal
+import callbacks
+import csrgraph
+import hess_matrix
+import labeling_matrix
+import model_cache
+import data_cache
+import export
+import local_search
+import multilevel
+import reduction
+import columns
+import profiling
 
-from gerrychain import Graph
-import geopandas as gpd
 
 
 ################################################
@@ -40,66 +51,6 @@ def append_dict_as_row(file_name, dict_of_elem, field_names):
         dict_writer.writerow(dict_of_elem)
         
         
-################################################
-# Writes districting solution to json file
-################################################ 
-
-def export_to_json(G, districts, filename):
-    with open(filename, 'w') as outfile:
-        soln = {}
-        soln['nodes'] = []
-        for j in range(len(districts)):
-            for i in districts[j]:
-                soln['nodes'].append({
-                        'name': G.nodes[i]["NAME10"],
-                        'index': i,
-                        'district': j
-                        })
-        json.dump(soln, outfile)
-               
-
-################################################
-# Draws districts and saves to png file
-################################################ 
-
-def export_to_png(G, df, districts, filename):
-    
-    assignment = [ -1 for u in G.nodes ]
-    
-    for j in range(len(districts)):
-        for i in districts[j]:
-            geoID = G.nodes[i]["GEOID10"]
-            for u in G.nodes:
-                if geoID == df['GEOID10'][u]:
-                    assignment[u] = j
-    
-    if min(assignment[v] for v in G.nodes) < 0:
-        print("Error: did not assign all nodes in district map png.")
-    else:
-        df['assignment'] = assignment
-        my_fig = df.plot(column='assignment').get_figure()
-        RESIZE_FACTOR = 3
-        my_fig.set_size_inches(my_fig.get_size_inches()*RESIZE_FACTOR)
-        plt.axis('off')
-        my_fig.savefig(filename)
-
-
-################################################
-# Draws max B set and saves to png file
-################################################ 
-
-def export_B_to_png(G, df, B, filename):
-    
-    B_geoids = [ G.nodes[i]["GEOID10"] for i in B ]
-    df['B'] = [1 if df['GEOID10'][u] in B_geoids else 0 for u in G.nodes]
-        
-    my_fig = df.plot(column='B').get_figure()
-    RESIZE_FACTOR = 3
-    my_fig.set_size_inches(my_fig.get_size_inches()*RESIZE_FACTOR)
-    plt.axis('off')
-    my_fig.savefig(filename)
-    
-
 ###########################
 # Hard-coded inputs
 ###########################  
@@ -138,73 +89,42 @@ default_config = {
     'extended' : True,
     'order' : 'B_decreasing',
     'heuristic' : True,
-    'lp': True
+    'lp': True,
+    'fractional' : False,
+    'builder' : 'quicksum',
+    'refine' : False,
+    'primal' : False,
+    'maxB_polish' : False,
+    'multilevel' : False,
+    'reduction' : False
 }
 
 available_config = {
     'state' : { key for key in state_codes.keys() },
     'level' : {'county', 'tract'},
-    'base' : {'hess', 'labeling'},
+    'base' : {'hess', 'labeling', 'columns'}, # columns: set-partitioning model with districts as columns, by branch-and-price
     'fixing' : {True, False},
     'contiguity' : {'none', 'lcut', 'scf', 'shir'},
     'symmetry' : {'default', 'aggressive', 'orbitope'},  # orbitope only for labeling
     'extended' : {True, False},
     'order' : {'none', 'decreasing', 'B_decreasing'},
     'heuristic' : {True, False},
-    'lp' : {True, False} # solve and report root LP bound? (in addition to MIP)
+    'lp' : {True, False, 'separate'}, # report root LP bound? (from the MIP solve, or from a separate LP solve)
+    'fractional' : {True, False}, # with lcut, also separate fractional LP solutions at MIPNODE as user cuts?
+    'builder' : {'quicksum', 'matrix'}, # build the model one row at a time, or in bulk from sparse matrices? (same model)
+    'refine' : {True, False}, # improve the heuristic solution by local search before using it?
+    'primal' : {True, False}, # during the MIP solve, round LP solutions into districting plans (primal heuristic)?
+    'maxB_polish' : {True, False}, # with order B_decreasing, improve the combinatorial max B solution by a MIP?
+    'multilevel' : {False, 'warm_start', 'fixing'}, # warm start from a multilevel plan (if better than the heuristic's)? Also fix vertices far from its district boundaries?
+    'reduction' : {True, False} # with contiguity, build the model on a reduced graph (small pieces hanging off a cut vertex merged into it)?
 }
 
 
 ###############################################
-# Read configs/inputs and set parameters
+# Read configs and check for errors
 ############################################### 
 
-# read configs file and load into a Python dictionary
-
-if len(sys.argv)>1:
-    # name your own config file in command line, like this: 
-    #       python main.py usethisconfig.json
-    # to keep logs of the experiments, redirect to file, like this:
-    #       python main.py usethisconfig.json 1>>log_file.txt 2>>error_file.txt
-    config_filename = sys.argv[1] 
-else:
-    config_filename = 'config.json' # default
-    
-print("Reading config from",config_filename)    
-config_filename_wo_extension = config_filename.rsplit('.',1)[0]
-configs_file = open(config_filename,'r')
-batch_configs = json.load(configs_file)
-configs_file.close()
-
-# create directory for results
-path = os.path.join("..", "results_for_" + config_filename_wo_extension) 
-os.mkdir(path) 
-
-# print results to csv file
-today = date.today()
-today_string = today.strftime("%Y_%b_%d") # Year_Month_Day, like 2019_Sept_16
-results_filename = "../results_for_" + config_filename_wo_extension + "/results_" + config_filename_wo_extension + "_" + today_string + ".csv" 
-
-# prepare csv file by writing column headers
-with open(results_filename,'w',newline='') as csvfile:   
-    my_fieldnames = ['run','state','level','base','fixing','contiguity','symmetry','extended','order','heuristic','lp'] # configs
-    my_fieldnames += ['k','L','U','n','m'] # params
-    my_fieldnames += ['heur_obj', 'heur_time', 'heur_iter'] # heuristic info
-    my_fieldnames += ['B_q', 'B_size', 'B_time', 'B_timelimit'] # max B info
-    my_fieldnames += ['DFixings', 'LFixings', 'UFixings_X', 'UFixings_R', 'ZFixings'] # fixing info
-    my_fieldnames += ['LP_obj', 'LP_time'] # root LP info
-    my_fieldnames += ['MIP_obj','MIP_bound','MIP_time', 'MIP_timelimit', 'MIP_status', 'MIP_nodes', 'callbacks', 'lazy_cuts', 'connected'] # MIP info
-    writer = csv.DictWriter(csvfile, fieldnames = my_fieldnames)
-    writer.writeheader()
-    
-############################################################
-# Run experiments for each config in batch_config file
-############################################################
-
-for key in batch_configs.keys(): 
-      
-    # get config and check for errors
-    config = batch_configs[key]
+def check_config(key, config):
     print("In run",key,"using config:",config,end='.')
     for ckey in config.keys():
         if config[ckey] not in available_config[ckey]:
@@ -217,73 +137,68 @@ for key in batch_configs.keys():
         if ckey not in config.keys():
             print("Using default value",ckey,"=",default_config[ckey],"since no option was selected.")
             config[ckey] = default_config[ckey]
-        
-    # initialize dictionary to store this run's results
-    result = config
-    result['run'] = key            
-                   
-    # read input data
-    state = config['state']
-    code = state_codes[state]
-    level = config['level']
-    G = Graph.from_json("../data/"+level+"/dual_graphs/"+level+code+".json")
-    DG = nx.DiGraph(G) # bidirected version of G
-    df = gpd.read_file("../data/"+level+"/shape_files/"+state+"_"+level+".shp")      
+            
 
-    # set parameters
-    k = number_of_congressional_districts[state]        
-    population = [G.nodes[i]['TOTPOP'] for i in G.nodes()]    
-    deviation = 0.01
-    L = math.ceil((1-deviation/2)*sum(population)/k)
-    U = math.floor((1+deviation/2)*sum(population)/k)
-    print("L =",L,", U =",U,", k =",k)
-    result['k'] = k
-    result['L'] = L
-    result['U'] = U
-    result['n'] = G.number_of_nodes()
-    result['m'] = G.number_of_edges()
-    
-    # abort early for trivial or overtly infeasible instances
-    maxp = max(population[i] for i in G.nodes)
-    if k==1 or maxp>U:
-        print("k=",k,", max{ p_v | v in V } =",maxp,", U =",U,end='.')
-        sys.exit("Aborting early, either due to trivial instance or overtly infeasible instance.")
-           
-    # read heuristic solution from external file (?)
-    heuristic = config['heuristic']
-    if heuristic:
-        heuristic_file = open('../data/'+level+"/heuristic/heur_"+state+"_"+level+".json",'r')
-        heuristic_dict = json.load(heuristic_file)       
-        heuristic_districts = [ [node['index'] for node in heuristic_dict['nodes'] if node['district']==j ] for j in range(k) ]
-        result['heur_obj'] = heuristic_dict['obj']
-        result['heur_time'] = heuristic_dict['time']
-        result['heur_iter'] = heuristic_dict['iterations']
-    else:
-        heuristic_districts = None
-        result['heur_obj'] = 'n/a'
-        result['heur_time'] = 'n/a'
-        result['heur_iter'] = 'n/a'
-        
-           
-    ############################
-    # Build base model
-    ############################   
+my_fieldnames = ['run','state','level','base','fixing','contiguity','symmetry','extended','order','heuristic','lp','fractional','builder','refine','primal','maxB_polish','multilevel','reduction'] # configs
+my_fieldnames += ['k','L','U','n','m'] # params
+my_fieldnames += ['reduced_n','reduced_m'] + profiling.columns('reduction') # graph reduction info
+my_fieldnames += profiling.columns('load') # reading input data
+my_fieldnames += ['heur_obj', 'heur_time', 'heur_iter'] # heuristic info
+my_fieldnames += ['refine_obj'] + profiling.columns('refine') # local search info
+my_fieldnames += ['multilevel_obj', 'multilevel_levels', 'multilevel_fixings'] + profiling.columns('multilevel', 'multilevel_fixing') # multilevel info
+my_fieldnames += ['B_q', 'B_size', 'B_timelimit'] + profiling.columns('B') # max B info
+my_fieldnames += ['DFixings', 'LFixings', 'UFixings_X', 'UFixings_R', 'ZFixings'] # fixing info
+my_fieldnames += profiling.columns('DFixing', 'LFixing', 'UFixing', 'ZFixing') # fixing stages
+my_fieldnames += profiling.columns('base', 'objective', 'contiguity', 'orbitope') # model build info
+my_fieldnames += ['cache', 'cache_time'] # model cache info
+my_fieldnames += ['LP_obj'] + profiling.columns('LP') # root LP info
+my_fieldnames += profiling.columns('warm_start') # heuristic warm start
+my_fieldnames += ['MIP_obj','MIP_bound'] + profiling.columns('MIP') + ['MIP_timelimit', 'MIP_status', 'MIP_nodes', 'callbacks', 'lazy_cuts', 'user_cuts', 'primal_solutions', 'primal_time', 'connected'] # MIP info
+my_fieldnames += ['num_columns', 'heuristic_columns', 'mip_columns'] # column generation info (base columns)
+my_fieldnames += profiling.columns('export') # writing json and png files
+
+# results of build_model, which are kept with a cached model
+built_fieldnames = ['B_q', 'B_size', 'B_timelimit', 'DFixings', 'LFixings', 'UFixings_X', 'UFixings_R', 'ZFixings']
+built_stages = ['B', 'DFixing', 'LFixing', 'UFixing', 'ZFixing', 'base', 'objective', 'contiguity', 'orbitope']
+built_fieldnames += profiling.columns(*built_stages)
+
+
+############################################################
+# Build the model for one config, with vertex ordering and variable fixing.
+#   Results of the build (like fixing counts) go into result.
+############################################################
+
+def build_model(config, graph, population, L, U, k, result):
     
     m = gp.Model()
-    m._DG = DG
+    m._graph = graph
+    m._population = population
+    m._U = U
+    m._k = k
     base = config['base']
     
-    if base == 'hess':
-        # X[i,j]=1 if vertex i is assigned to (district centered at) vertex j
-        m._X = m.addVars(DG.nodes, DG.nodes, vtype=GRB.BINARY)
-        hess.add_base_constraints(m, population, L, U, k)
+    # build the formulations one row at a time with quicksum, or in bulk from sparse coefficient matrices?
+    if config['builder'] == 'matrix':
+        (hess_builder, labeling_builder) = (hess_matrix, labeling_matrix)
+    else:
+        (hess_builder, labeling_builder) = (hess, labeling)
+    
+    # each component of the model is a stage, including the m.update() that finishes building it
+    with profiling.stage(result, 'base'):
     
-    if base == 'labeling':        
-        # X[i,j]=1 if vertex i is assigned to district j in {0,1,2,...,k-1}
-        m._X = m.addVars(DG.nodes, range(k), vtype=GRB.BINARY)
-        if config['symmetry']=='orbitope' or config['contiguity'] in {'scf', 'shir', 'lcut'}:
-            m._R = m.addVars(DG.nodes, range(k), vtype=GRB.BINARY)
-        labeling.add_base_constraints(m, population, L, U, k)
+        if base == 'hess':
+            # X[i,j]=1 if vertex i is assigned to (district centered at) vertex j
+            m._X = m.addVars(graph.nodes, graph.nodes, vtype=GRB.BINARY)
+            hess_builder.add_base_constraints(m, population, L, U, k)
+        
+        if base == 'labeling':        
+            # X[i,j]=1 if vertex i is assigned to district j in {0,1,2,...,k-1}
+            m._X = m.addVars(graph.nodes, range(k), vtype=GRB.BINARY)
+            if config['symmetry']=='orbitope' or config['contiguity'] in {'scf', 'shir', 'lcut'}:
+                m._R = m.addVars(graph.nodes, range(k), vtype=GRB.BINARY)
+            labeling_builder.add_base_constraints(m, population, L, U, k)
+            
+        m.update()
 
                 
     ############################################      
@@ -291,18 +206,21 @@ for key in batch_configs.keys():
     ############################################         
     
     extended = config['extended']
+    with profiling.stage(result, 'objective'):
     
-    if base == 'hess':
-        if extended:
-            hess.add_extended_objective(m, G)
-        else:
-            hess.add_objective(m, G)
-               
-    if base == 'labeling':
-        if extended:
-            labeling.add_extended_objective(m, G, k)
-        else:
-            labeling.add_objective(m, G, k)
+        if base == 'hess':
+            if extended:
+                hess_builder.add_extended_objective(m, graph)
+            else:
+                hess_builder.add_objective(m, graph)
+                   
+        if base == 'labeling':
+            if extended:
+                labeling_builder.add_extended_objective(m, graph, k)
+            else:
+                labeling_builder.add_objective(m, graph, k)
+                
+        m.update()
             
     
     ####################################   
@@ -310,33 +228,21 @@ for key in batch_configs.keys():
     ####################################      
             
     contiguity = config['contiguity']
-    m._callback = None
-    m._population = population
-    m._U = U
-    m._k = k
-    m._base = base
-    m._numLazyCuts = 0
-    m._numCallbacks = 0
+    with profiling.stage(result, 'contiguity'):
     
-    if base == 'hess':
-        if contiguity == 'shir':
-            hess.add_shir_constraints(m)
-        elif contiguity == 'scf':
-            hess.add_scf_constraints(m, G, extended)
-        elif contiguity == 'lcut':
-            m.Params.lazyConstraints = 1
-            m._callback = separation.lcut_separation_generic
-                    
-    if base == 'labeling':
-        if contiguity == 'shir':
-            labeling.add_shir_constraints(m, config['symmetry'])
-        elif contiguity == 'scf':
-            labeling.add_scf_constraints(m, G, extended, config['symmetry'])
-        elif contiguity == 'lcut':
-            m.Params.lazyConstraints = 1
-            m._callback = separation.lcut_separation_generic 
-         
-    m.update()
+        if base == 'hess':
+            if contiguity == 'shir':
+                hess_builder.add_shir_constraints(m)
+            elif contiguity == 'scf':
+                hess_builder.add_scf_constraints(m, graph, extended)
+                        
+        if base == 'labeling':
+            if contiguity == 'shir':
+                labeling_builder.add_shir_constraints(m, config['symmetry'])
+            elif contiguity == 'scf':
+                labeling_builder.add_scf_constraints(m, graph, extended, config['symmetry'])
+             
+        m.update()
     
     
     ############################################
@@ -346,17 +252,15 @@ for key in batch_configs.keys():
     order = config['order']
     
     if order == 'B_decreasing':
-        (B, result['B_q'], result['B_time'], result['B_timelimit']) = ordering.solve_maxB_problem(DG, population, L, k, heuristic_districts)
-        
-        # draw set B on map and save
-        fn_B = "../" + "results_for_" + config_filename_wo_extension + "/" + result['state'] + "-" + result['level'] + "-maxB.png"       
-        export_B_to_png(G, df, B, fn_B)
+        with profiling.stage(result, 'B'):
+            (B, result['B_q'], result['B_timelimit']) = ordering.solve_maxB_problem(graph, population, L, k, config['maxB_polish'])
     else:
-        (B, result['B_q'], result['B_time'], result['B_timelimit']) = (list(),'n/a','n/a', 'n/a')
+        (B, result['B_q'], result['B_timelimit']) = (list(),'n/a', 'n/a')
+        profiling.skip(result, 'B')
         
     result['B_size'] = len(B)
     
-    vertex_ordering = ordering.find_ordering(order, B, DG, population)
+    vertex_ordering = ordering.find_ordering(order, B, graph, population)
     position = ordering.construct_position(vertex_ordering)
     
     print("Vertex ordering =", vertex_ordering)  
@@ -369,11 +273,13 @@ for key in batch_configs.keys():
     
     symmetry = config['symmetry']
     
-    if symmetry == 'aggressive':
-        m.Params.symmetry = 2
-    elif symmetry == 'orbitope':
+    profiling.skip(result, 'orbitope')
+    
+    if symmetry == 'orbitope':
         if base == 'labeling':
-            labeling.add_orbitope_extended_formulation(m, G, k, vertex_ordering)
+            with profiling.stage(result, 'orbitope'):
+                labeling_builder.add_orbitope_extended_formulation(m, graph, k, vertex_ordering)
+                m.update()
         else:
             sys.exit("Error: orbitope only available for labeling base model.")     
             
@@ -383,39 +289,51 @@ for key in batch_configs.keys():
     ####################################    
     
     do_fixing = config['fixing']
+    profiling.skip(result, 'DFixing', 'LFixing', 'UFixing', 'ZFixing')
     
     if do_fixing and base == 'hess':
-        result['DFixings'] = fixing.do_Hess_DFixing(m, G, position)
+        with profiling.stage(result, 'DFixing'):
+            result['DFixings'] = fixing.do_Hess_DFixing(m, graph, position)
         result['UFixings_R'] = 'n/a'
         
         if contiguity == 'none':
-            result['LFixings'] = fixing.do_Hess_LFixing_without_Contiguity(m, G, population, L, vertex_ordering)
-            result['UFixings_X'] = fixing.do_Hess_UFixing_without_Contiguity(m, G, population, U)
+            with profiling.stage(result, 'LFixing'):
+                result['LFixings'] = fixing.do_Hess_LFixing_without_Contiguity(m, graph, population, L, vertex_ordering)
+            with profiling.stage(result, 'UFixing'):
+                result['UFixings_X'] = fixing.do_Hess_UFixing_without_Contiguity(m, graph, population, U)
         else:
-            result['LFixings'] = fixing.do_Hess_LFixing(m, G, population, L, vertex_ordering)
-            result['UFixings_X'] = fixing.do_Hess_UFixing(m, DG, population, U, vertex_ordering)         
+            with profiling.stage(result, 'LFixing'):
+                result['LFixings'] = fixing.do_Hess_LFixing(m, graph, population, L, vertex_ordering)
+            with profiling.stage(result, 'UFixing'):
+                result['UFixings_X'] = fixing.do_Hess_UFixing(m, graph, population, U, vertex_ordering)         
         
         if extended:
-            result['ZFixings'] = fixing.do_Hess_ZFixing(m, G)
+            with profiling.stage(result, 'ZFixing'):
+                result['ZFixings'] = fixing.do_Hess_ZFixing(m, graph)
         else:
             result['ZFixings'] = 0
                 
     
     if do_fixing and base == 'labeling':
-        result['DFixings'] = fixing.do_Labeling_DFixing(m, G, vertex_ordering, k)
+        with profiling.stage(result, 'DFixing'):
+            result['DFixings'] = fixing.do_Labeling_DFixing(m, graph, vertex_ordering, k)
         
         if contiguity == 'none':
             if symmetry == 'orbitope':
-                result['LFixings'] = fixing.do_Labeling_LFixing_without_Contiguity(m, G, population, L, vertex_ordering, k)
+                with profiling.stage(result, 'LFixing'):
+                    result['LFixings'] = fixing.do_Labeling_LFixing_without_Contiguity(m, graph, population, L, vertex_ordering, k)
             else:
                 result['LFixings'] = 0
             (result['UFixings_X'], result['UFixings_R']) = fixing.do_labeling_UFixing_without_Contiguity()
         else:
-            result['LFixings'] = fixing.do_Labeling_LFixing(m, G, population, L, vertex_ordering, k)
-            (result['UFixings_X'], result['UFixings_R']) = fixing.do_Labeling_UFixing(m, DG, population, U, vertex_ordering, k)
+            with profiling.stage(result, 'LFixing'):
+                result['LFixings'] = fixing.do_Labeling_LFixing(m, graph, population, L, vertex_ordering, k)
+            with profiling.stage(result, 'UFixing'):
+                (result['UFixings_X'], result['UFixings_R']) = fixing.do_Labeling_UFixing(m, graph, population, U, vertex_ordering, k)
         
         if extended:
-            result['ZFixings'] = fixing.do_Labeling_ZFixing(m, G, k)
+            with profiling.stage(result, 'ZFixing'):
+                result['ZFixings'] = fixing.do_Labeling_ZFixing(m, graph, k)
         else:
             result['ZFixings'] = 0
             
@@ -425,22 +343,220 @@ for key in batch_configs.keys():
         result['LFixings'] = 0
         result['UFixings_X'] = 0
         result['ZFixings'] = 0
+        
+    return (m, B, vertex_ordering)
+
+
+############################################################
+# Run the experiment for one config; results go to results_dir
+############################################################
+
+def run(key, config, results_dir, cache=None, progress_interval=0):
+    
+    # initialize dictionary to store this run's results
+    result = config
+    result['run'] = key            
+                   
+    # read input data
+    state = config['state']
+    code = state_codes[state]
+    level = config['level']
+    graph_filename = "../data/"+level+"/dual_graphs/"+level+code+".json"
+    with profiling.stage(result, 'load'):
+        graph = data_cache.load_graph(graph_filename) # read-only compact graph, shared by all modules
+        df = data_cache.load_shapes("../data/"+level+"/shape_files/"+state+"_"+level+".shp")      
+
+    # set parameters
+    k = number_of_congressional_districts[state]        
+    population = list(graph.pop)
+    deviation = 0.01
+    L = math.ceil((1-deviation/2)*sum(population)/k)
+    U = math.floor((1+deviation/2)*sum(population)/k)
+    print("L =",L,", U =",U,", k =",k)
+    result['k'] = k
+    result['L'] = L
+    result['U'] = U
+    result['n'] = graph.number_of_nodes()
+    result['m'] = graph.number_of_edges()
+    
+    # abort early for trivial or overtly infeasible instances
+    maxp = max(population[i] for i in graph.nodes)
+    if k==1 or maxp>U:
+        print("k=",k,", max{ p_v | v in V } =",maxp,", U =",U,end='.')
+        sys.exit("Aborting early, either due to trivial instance or overtly infeasible instance.")
+           
+    # read heuristic solution from external file (?)
+    heuristic = config['heuristic']
+    if heuristic:
+        heuristic_file = open('../data/'+level+"/heuristic/heur_"+state+"_"+level+".json",'r')
+        heuristic_dict = json.load(heuristic_file)       
+        heuristic_districts = [ [node['index'] for node in heuristic_dict['nodes'] if node['district']==j ] for j in range(k) ]
+        result['heur_obj'] = heuristic_dict['obj']
+        result['heur_time'] = heuristic_dict['time']
+        result['heur_iter'] = heuristic_dict['iterations']
+    else:
+        heuristic_districts = None
+        result['heur_obj'] = 'n/a'
+        result['heur_time'] = 'n/a'
+        result['heur_iter'] = 'n/a'
+        
+    # improve heuristic solution by local search
+    if heuristic and config['refine']:
+        with profiling.stage(result, 'refine'):
+            (heuristic_districts, result['refine_obj']) = local_search.refine(graph, heuristic_districts, L, U)
+        print("Local search: heuristic solution has",result['heur_obj'],"cut edges, refined solution has",result['refine_obj'])
+    else:
+        result['refine_obj'] = 'n/a'
+        profiling.skip(result, 'refine')
+        
+    # multilevel plan (coarsen, solve, project back), used as warm start if it has fewer cut edges than the heuristic's.
+    #   With multilevel = fixing, it is always the warm start, as the plan that fixes the vertices.
+    multilevel_districts = None
+    if config['multilevel']:
+        with profiling.stage(result, 'multilevel'):
+            (multilevel_districts, result['multilevel_levels']) = multilevel.solve(graph, k, L, U)
+        if multilevel_districts is None:
+            result['multilevel_obj'] = 'no_solution_found'
+        else:
+            result['multilevel_obj'] = local_search.cut_edges(graph, multilevel_districts)
+            print("Multilevel solution has",result['multilevel_obj'],"cut edges")
+            if heuristic_districts is None or config['multilevel'] == 'fixing' or result['multilevel_obj'] < local_search.cut_edges(graph, heuristic_districts):
+                heuristic_districts = multilevel_districts
+    else:
+        result['multilevel_obj'] = 'n/a'
+        result['multilevel_levels'] = 'n/a'
+        profiling.skip(result, 'multilevel')
+        
+    # safe graph reduction (see reduction.py). The model is built on the reduced graph, and plans on the original
+    #   graph are mapped to it. Solutions are expanded back to the original graph for export. Without contiguity,
+    #   the reduction is not safe (a piece could be assigned elsewhere), so it is not done.
+    original_graph = graph
+    if config['reduction'] and config['contiguity'] != 'none':
+        with profiling.stage(result, 'reduction'):
+            (graph, parent) = reduction.reduce(original_graph, L)
+        population = list(graph.pop)
+        print("Reduced graph has",graph.n,"vertices and",graph.m,"edges")
+        if heuristic_districts is not None:
+            heuristic_districts = reduction.contract(parent, heuristic_districts)
+        if multilevel_districts is not None:
+            multilevel_districts = reduction.contract(parent, multilevel_districts)
+    else:
+        parent = list(graph.nodes)
+        profiling.skip(result, 'reduction')
+    result['reduced_n'] = graph.number_of_nodes()
+    result['reduced_m'] = graph.number_of_edges()
+    
+    
+    ############################
+    # Set-partitioning model (no assignment model to build)
+    ############################
+    
+    if config['base'] == 'columns':
+        districts = solve_columns(config, graph, L, U, k, heuristic_districts, result)
+        if districts is not None:
+            districts = reduction.expand(parent, districts)
+        export_solution(result, original_graph, df, districts, results_dir)
+        return result
+    
+    result['num_columns'] = 'n/a'
+    result['heuristic_columns'] = 'n/a'
+    result['mip_columns'] = 'n/a'
+        
+           
+    ############################
+    # Build model (or load it from the model cache)
+    ############################   
+    
+    base = config['base']
+    m = None
+    result['cache'] = 'off'
+    result['cache_time'] = 'n/a'
+    
+    if cache is not None:
+        (cache_dir, cache_bytes) = cache
+        start = time.time()
+        cache_key = model_cache.cache_key(graph_filename, config, k, L, U)
+        loaded = model_cache.load(cache_dir, cache_key, graph, k)
+        if loaded is not None:
+            (m, B, vertex_ordering, built) = loaded
+            result.update(built)
+            profiling.skip(result, *built_stages) # this run did not pay for the build; cache_time is the cost of loading it
+            result['cache'] = 'hit'
+            print("Loaded model from cache",cache_dir,"with key",cache_key)
+        else:
+            result['cache'] = 'miss'
+        end = time.time()
+        result['cache_time'] = '{0:.2f}'.format(end-start)
+        
+    if m is None:
+        (m, B, vertex_ordering) = build_model(config, graph, population, L, U, k, result)
+        if cache is not None:
+            start = time.time()
+            built = { rkey : result[rkey] for rkey in built_fieldnames }
+            model_cache.save(cache_dir, cache_key, m, base, B, vertex_ordering, built, cache_bytes)
+            end = time.time()
+            result['cache_time'] = '{0:.2f}'.format(float(result['cache_time'])+end-start)
+        
+    position = ordering.construct_position(vertex_ordering)
+    
+    # draw set B on map and save
+    if config['order'] == 'B_decreasing':
+        fn_B = results_dir + "/" + result['state'] + "-" + result['level'] + "-maxB.png"       
+        export.submit(export.export_B_to_png, original_graph, df, reduction.expand(parent, [B])[0], fn_B)
+    
+    
+    ####################################   
+    # Callbacks and parameters (not part of a cached model)
+    ####################################  
+    
+    contiguity = config['contiguity']
+    m._graph = graph
+    m._callbacks = list()
+    m._population = population
+    m._L = L
+    m._U = U
+    m._k = k
+    m._base = base
+    m._numLazyCuts = 0
+    m._numCallbacks = 0
+    m._fractional = config['fractional'] and contiguity == 'lcut'
+    m._numUserCuts = 0
+    m._cutNode = -1 # branch-and-bound node where user cuts were last added
+    m._cutsAtNode = 0
+    m._position = position
+    m._numPrimalSolutions = 0
+    m._primalNode = 0 # run the primal heuristic at the first node with at least this node count
+    m._primalTime = 0
+    
+    if contiguity == 'lcut':
+        m.Params.lazyConstraints = 1
+        m._callbacks.append(separation.lcut_separation_generic)
+        
+    if config['primal']:
+        m._callbacks.append(primal.primal_heuristic)
             
+    if m._fractional:
+        m.Params.PreCrush = 1 # needed for user cuts
+    
+    if config['symmetry'] == 'aggressive':
+        m.Params.symmetry = 2
+    
     
     ######################################################################################
-    # Solve root LP? Used only for reporting purposes. Not used for MIP solve.
+    # Root LP bound? Used only for reporting purposes. With lp=True, it is the first relaxation solved at the 
+    # root node of the MIP solve (recorded by a callback). With lp=separate, a separate LP model is solved,
+    # which gives the bound of the formulation itself (without MIP presolve).
     ######################################################################################  
     
-    if config['lp']:
+    if config['lp'] == 'separate':
         r = m.relax() # LP relaxation of MIP model m
         #r.Params.LogToConsole = 0 # keep log to a minimum
         r.Params.Method = 3 # use concurrent LP solver
         r.Params.TimeLimit = 3600 # one-hour time limit for solving LP
         print("To get the root LP bound, now solving a (separate) LP model.")
         
-        lp_start = time.time()
-        r.optimize()
-        lp_end = time.time()
+        with profiling.stage(result, 'LP'):
+            r.optimize()
         
         if r.status == GRB.OPTIMAL:
             result['LP_obj'] = '{0:.2f}'.format(r.objVal)
@@ -448,96 +564,303 @@ for key in batch_configs.keys():
             result['LP_obj'] = 'TL'
         else:
             result['LP_obj'] = '?'
-        result['LP_time'] = '{0:.2f}'.format(lp_end - lp_start)
+        
+    elif config['lp']:
+        variables = m.getVars()
+        m._objective = [ (var, coef) for (var, coef) in zip(variables, m.getAttr('Obj', variables)) if coef != 0 ]
+        m._rootLP = None
+        m._callbacks.insert(0, callbacks.root_relaxation)
+        result['LP_rss'] = 'n/a'
         
     else:
         result['LP_obj'] = 'n/a'
-        result['LP_time'] = 'n/a'
+        profiling.skip(result, 'LP')
         
     
     ####################################   
     # Inject heuristic warm start
     ####################################    
     
-    if heuristic and base == 'hess':
-        for district in heuristic_districts:    
-            p = min([position[v] for v in district])
-            j = vertex_ordering[p]
-            for i in district:
-                m._X[i,j].start = 1
+    if heuristic_districts is not None and base == 'hess':
+        with profiling.stage(result, 'warm_start'):
+            for district in heuristic_districts:    
+                p = min([position[v] for v in district])
+                j = vertex_ordering[p]
+                for i in district:
+                    m._X[i,j].start = 1
                     
-    if heuristic and base == 'labeling':
-        center_positions = [ min( position[v] for v in heuristic_districts[j] ) for j in range(k) ] 
-        cplabel = { center_positions[j] : j for j in range(k) }
-    
-        # what node r will root the new district j? The one with earliest position.
-        for j in range(k):
-            min_cp = min(center_positions)
-            r = vertex_ordering[min_cp]
-            old_j = cplabel[min_cp]
-            
-            for i in heuristic_districts[old_j]:
-                m._X[i,j].start = 1
+    if heuristic_districts is not None and base == 'labeling':
+        with profiling.stage(result, 'warm_start'):
+            center_positions = [ min( position[v] for v in heuristic_districts[j] ) for j in range(k) ] 
+            cplabel = { center_positions[j] : j for j in range(k) }
+        
+            # what node r will root the new district j? The one with earliest position.
+            for j in range(k):
+                min_cp = min(center_positions)
+                r = vertex_ordering[min_cp]
+                old_j = cplabel[min_cp]
                 
-            center_positions.remove(min_cp)
+                for i in heuristic_districts[old_j]:
+                    m._X[i,j].start = 1
+                    
+                center_positions.remove(min_cp)
+    
+    if heuristic_districts is None:
+        profiling.skip(result, 'warm_start')
+        
+    # heuristic fixings from the multilevel plan (after the model cache, like the warm start)
+    if config['multilevel'] == 'fixing' and multilevel_districts is not None:
+        with profiling.stage(result, 'multilevel_fixing'):
+            result['multilevel_fixings'] = multilevel.fix_interior(m, graph, multilevel_districts, position, base)
+    else:
+        result['multilevel_fixings'] = 'n/a' if config['multilevel'] != 'fixing' else 0
+        profiling.skip(result, 'multilevel_fixing')
                 
     
     ####################################   
     # Solve MIP
     ####################################  
     
+    # record the progress of the solve?
+    if progress_interval > 0:
+        callbacks.start_progress(m, results_dir + "/" + key + "-progress.jsonl", progress_interval)
+    
     result['MIP_timelimit'] = 3600 # set a one hour time limit
     m.Params.TimeLimit = result['MIP_timelimit']
     m.Params.Method = 3 # use concurrent method for root LP. Useful for degenerate models
     
-    start = time.time()
-    m.optimize(m._callback)
-    end = time.time()
-    result['MIP_time'] = '{0:.2f}'.format(end-start)
+    with profiling.stage(result, 'MIP'):
+        m.optimize(callbacks.dispatcher if m._callbacks else None)
+    if progress_interval > 0:
+        callbacks.finish_progress(m)
     
     result['MIP_status'] = int(m.status)
     result['MIP_nodes'] = int(m.NodeCount)
     result['MIP_bound'] = m.objBound
     result['callbacks'] = m._numCallbacks
     result['lazy_cuts'] = m._numLazyCuts
+    result['user_cuts'] = m._numUserCuts
+    if config['lp'] is True:
+        if m._rootLP is not None:
+            result['LP_obj'] = '{0:.2f}'.format(m._rootLP[0])
+            result['LP_time'] = '{0:.2f}'.format(m._rootLP[1])
+        else:
+            result['LP_obj'] = '?'
+            result['LP_time'] = 'n/a'
+    result['primal_solutions'] = m._numPrimalSolutions if config['primal'] else 'n/a'
+    result['primal_time'] = '{0:.2f}'.format(m._primalTime) if config['primal'] else 'n/a'
     
     # report best solution found
     if m.SolCount > 0:
         result['MIP_obj'] = int(m.objVal)
 
         if base == 'hess':
-            labels = [ j for j in DG.nodes if m._X[j,j].x > 0.5 ]
+            labels = [ j for j in graph.nodes if m._X[j,j].x > 0.5 ]
         else: # base == 'labeling'
             labels = [ j for j in range(k) ]
             
-        districts = [ [ i for i in DG.nodes if m._X[i,j].x > 0.5 ] for j in labels]
-        print("best solution (found) =",districts)
+        districts = reduction.expand(parent, [ [ i for i in graph.nodes if m._X[i,j].x > 0.5 ] for j in labels])
+    else:
+        result['MIP_obj'] = 'no_solution_found'
+        districts = None
+    
+    export_solution(result, original_graph, df, districts, results_dir)
+    return result
+
+
+############################################################
+# Export the best solution (districts of the original graph, or None)
+#   to .json and .png files, and check that its districts are connected
+############################################################
+
+def export_solution(result, graph, df, districts, results_dir):
+    
+    if districts is None:
+        result['connected'] = 'n/a'
+        profiling.skip(result, 'export')
+        return
+    
+    print("best solution (found) =",districts)
+    fn = results_dir + "/" + result['state'] + "-" + result['level'] + "-" + result['base'] + "-" + result['contiguity']
+    
+    # export solution to .json file and .png file (districting map), in the background. The export
+    #   stage only times handing them to the worker, so that the next solve still overlaps with drawing
+    with profiling.stage(result, 'export'):
+        export.submit(export.export_to_json, graph, districts, fn + ".json")
+        export.submit(export.export_to_png, graph, df, districts, fn + ".png")
+    
+    # is solution connected?
+    connected = True
+    for district in districts:
+        if not csrgraph.is_connected(graph, district):
+            connected = False
+    result['connected'] = connected
+
+
+############################################################
+# Solve the set-partitioning model (base = columns) by branch-and-price, in place of the
+#   assignment models. Columns are connected unless contiguity is none. The ordering, fixing,
+#   and symmetry options do not apply. Returns the districts of the best plan, or None.
+############################################################
+
+def solve_columns(config, graph, L, U, k, heuristic_districts, result):
+    
+    if config['symmetry'] == 'orbitope':
+        sys.exit("Error: orbitope only available for labeling base model.")
         
-        fn = "../" + "results_for_" + config_filename_wo_extension + "/" + result['state'] + "-" + result['level'] + "-" + result['base'] + "-" + result['contiguity']
+    for rkey in built_fieldnames + ['cache_time', 'multilevel_fixings', 'callbacks', 'lazy_cuts', 'user_cuts', 'primal_solutions', 'primal_time']:
+        result[rkey] = 'n/a'
+    result['cache'] = 'off'
+    profiling.skip(result, 'warm_start', 'multilevel_fixing')
+    
+    # the heuristic plan (if any) gives the first columns, like a warm start
+    plans = [ heuristic_districts ] if heuristic_districts is not None else list()
+    result['MIP_timelimit'] = 3600 # set a one hour time limit
+    with profiling.stage(result, 'MIP'):
+        bp = columns.solve(graph, k, L, U, config['contiguity'] != 'none', plans, result['MIP_timelimit'])
+    
+    if bp.closed:
+        result['MIP_status'] = GRB.OPTIMAL if bp.incumbent is not None else GRB.INFEASIBLE
+    else:
+        result['MIP_status'] = GRB.TIME_LIMIT
+    result['MIP_nodes'] = bp.nodes
+    result['MIP_bound'] = bp.bound
+    result['num_columns'] = len(bp.columns)
+    result['heuristic_columns'] = bp.heuristic_columns
+    result['mip_columns'] = bp.mip_columns
+    
+    # the root LP bound is that of the set-partitioning LP (with lp=separate too, since it is the same LP),
+    #   if column generation converged at the root by the time limit
+    if config['lp']:
+        result['LP_obj'] = '{0:.2f}'.format(bp.root_bound) if bp.root_bound is not None else '?'
+        result['LP_time'] = '{0:.2f}'.format(bp.root_time) if bp.root_bound is not None else 'n/a'
+        result['LP_rss'] = 'n/a'
+    else:
+        result['LP_obj'] = 'n/a'
+        profiling.skip(result, 'LP')
+    
+    if bp.incumbent is None:
+        result['MIP_obj'] = 'no_solution_found'
+        return None
+    result['MIP_obj'] = bp.incumbent[0]
+    return bp.incumbent[1]
+
+
+
+############################################################
+# Run one config in a worker process, with a log of its own
+############################################################
+
+def run_with_log(key, config, results_dir, threads, cache, progress_interval, profile_dir):
+    profiling.profile_dir = profile_dir # module state is not inherited by spawned processes
+    if threads > 0:
+        gp.setParam('Threads', threads) # applies to every model this process creates
+    
+    # send everything written to stdout/stderr (also by Gurobi) to this run's log file
+    log_filename = results_dir + "/" + key + ".log"
+    with open(log_filename, 'w') as log_file:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(log_file.fileno(), 1)
+        os.dup2(log_file.fileno(), 2)
+        try:
+            result = run(key, config, results_dir, cache, progress_interval)
+            export.wait() # so that this run's exports also write to its log
+            return result
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+
+
+############################################################
+# Run experiments for each config in batch_config file
+############################################################
+
+if __name__ == '__main__':
+    
+    # name your own config file in command line, like this: 
+    #       python main.py usethisconfig.json
+    # to keep logs of the experiments, redirect to file, like this:
+    #       python main.py usethisconfig.json 1>>log_file.txt 2>>error_file.txt
+    # to run 8 experiments at a time, sharing 64 threads (8 per Gurobi model), like this:
+    #       python main.py usethisconfig.json --processes 8 --threads 64
+    #   then each run keeps its own log file in the results directory.
+    # to reuse built and fixed models across runs (and batches), keep them in a model cache of at most 20 GB, like this:
+    #       python main.py usethisconfig.json --cache-dir ../model_cache --cache-size 20000
+    # to record the progress of each MIP solve (incumbent, bound, gap, nodes, ...) every 10 seconds, like this:
+    #       python main.py usethisconfig.json --progress-interval 10
+    #   then each run writes <run>-progress.jsonl in the results directory.
+    # to also profile (cProfile) each stage of each run, like this:
+    #       python main.py usethisconfig.json --profile-dir ../profiles
+    #   then each stage writes <run>-<stage>.prof in that directory.
+    parser = argparse.ArgumentParser()
+    parser.add_argument('config_filename', nargs='?', default='config.json')
+    parser.add_argument('--processes', type=int, default=1, help='number of runs to solve at the same time')
+    parser.add_argument('--threads', type=int, default=0, help='total number of threads, split evenly between runs (0 = Gurobi default)')
+    parser.add_argument('--cache-dir', default=None, help='directory of the model cache (default: no cache)')
+    parser.add_argument('--cache-size', type=int, default=10000, help='size limit of the model cache, in MB')
+    parser.add_argument('--progress-interval', type=float, default=0, help='seconds between records of the MIP progress (0 = no records)')
+    parser.add_argument('--profile-dir', default=None, help='directory for cProfile files of each stage of each run (default: none)')
+    args = parser.parse_args()
+    
+    config_filename = args.config_filename
+    print("Reading config from",config_filename)    
+    config_filename_wo_extension = config_filename.rsplit('.',1)[0]
+    configs_file = open(config_filename,'r')
+    batch_configs = json.load(configs_file)
+    configs_file.close()
+    
+    # check all configs before solving anything
+    for key in batch_configs.keys():
+        check_config(key, batch_configs[key])
+    
+    # create directory for results
+    results_dir = os.path.join("..", "results_for_" + config_filename_wo_extension) 
+    os.mkdir(results_dir) 
+    
+    # print results to csv file
+    today = date.today()
+    today_string = today.strftime("%Y_%b_%d") # Year_Month_Day, like 2019_Sept_16
+    results_filename = results_dir + "/results_" + config_filename_wo_extension + "_" + today_string + ".csv" 
+    
+    # prepare csv file by writing column headers
+    with open(results_filename,'w',newline='') as csvfile:   
+        writer = csv.DictWriter(csvfile, fieldnames = my_fieldnames)
+        writer.writeheader()
         
-        # export solution to .json file
-        json_fn = fn + ".json"
-        export_to_json(G, districts, json_fn)
+    if args.profile_dir is not None:
+        os.makedirs(args.profile_dir, exist_ok=True)
+        profiling.profile_dir = args.profile_dir
         
-        # export solution to .png file (districting map)
-        png_fn = fn + ".png"
-        export_to_png(G, df, districts, png_fn)
+    if args.cache_dir is not None:
+        cache = (args.cache_dir, args.cache_size * 1000000)
+    else:
+        cache = None
         
-        # is solution connected?
-        connected = True
-        for district in districts:
-            if not nx.is_connected(G.subgraph(district)):
-                connected = False
-        result['connected'] = connected
+    # threads per Gurobi model
+    threads = args.threads // args.processes
+    if args.threads > 0 and threads == 0:
+        threads = 1
         
+    if args.processes == 1:
+        if threads > 0:
+            gp.setParam('Threads', threads)
+        for key in batch_configs.keys():
+            result = run(key, batch_configs[key], results_dir, cache, args.progress_interval)
+            append_dict_as_row(results_filename,result,my_fieldnames)
+        export.wait()
     else:
-        result['MIP_obj'] = 'no_solution_found'
-        result['connected'] = 'n/a'
-        
-            
-    ####################################   
-    # Summarize results of this run to csv file
-    ####################################  
-    
-    append_dict_as_row(results_filename,result,my_fieldnames)
+        # only this (parent) process writes to the csv file, one row as each run finishes
+        context = multiprocessing.get_context('spawn')
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.processes, mp_context=context) as executor:
+            futures = { executor.submit(run_with_log, key, batch_configs[key], results_dir, threads, cache, args.progress_interval, args.profile_dir) : key for key in batch_configs.keys() }
+            for future in concurrent.futures.as_completed(futures):
+                key = futures[future]
+                try:
+                    result = future.result()
+                except BaseException as error: # like sys.exit for an infeasible instance, or a Gurobi error
+                    print("Failed run",key,":",repr(error),"; log in",results_dir + "/" + key + ".log")
+                    continue
+                print("Finished run",key,"; log in",results_dir + "/" + key + ".log")
+                append_dict_as_row(results_filename,result,my_fieldnames)
     
@@ -0,0 +1,55 @@
+import numpy as np
+import scipy.sparse
+import gurobipy as gp
+
+# Helpers to build constraints in bulk from sparse coefficient matrices (addMConstr), instead of one row at a time.
+
+
+# columns (indices in m) of the variables created by a single call to m.addVars (or m.addMVar), as a NumPy array of the given shape.
+#   addVars creates variables in the (row-major) order of its keys, e.g., for X = m.addVars(V, V) the column of X[i,j] is first + i*n + j
+def columns(m, variables, shape):
+    m.update()
+    if isinstance(variables, gp.MVar):
+        first = variables.reshape(-1)[0].item().index
+    else:
+        first = next(iter(variables.values())).index
+    return first + np.arange(int(np.prod(shape)), dtype=np.int64).reshape(shape)
+
+
+# add the constraints A x (sense) rhs, where x is the vector of all variables of m, and A[row[t],col[t]] = val[t].
+#   Duplicate entries are summed. Rows are added in order 0, 1, ..., len(rhs)-1.
+def add_rows(m, row, col, val, sense, rhs):
+    rhs = np.asarray(rhs, dtype=float)
+    m.update()
+    A = scipy.sparse.csr_matrix((np.asarray(val, dtype=float), (row, col)), shape=(len(rhs), m.NumVars))
+    return m.addMConstr(A, None, sense, rhs)
+
+
+# arcs (u,v) of the bidirected graph, in the same order as graph.arcs: returns arrays tail, head, and
+#   reverse, where reverse[p] is the position of arc (v,u) when arc p is (u,v)
+def arc_arrays(graph):
+    tail = np.repeat(np.arange(graph.n, dtype=np.int64), np.diff(graph.indptr))
+    head = np.array(graph.indices, dtype=np.int64)
+    reverse = arc_positions(graph, head, tail)
+    return (tail, head, reverse)
+
+
+# positions (in graph.arcs) of the arcs (tail[t], head[t])
+def arc_positions(graph, tail, head):
+    arc_tail = np.repeat(np.arange(graph.n, dtype=np.int64), np.diff(graph.indptr))
+    key = arc_tail * graph.n + np.array(graph.indices, dtype=np.int64)
+    order = np.argsort(key, kind='stable')
+    return order[np.searchsorted(key[order], tail * graph.n + head)]
+
+
+# edges {u,v} in the same order (and orientation) as graph.edges: returns arrays tail, head
+def edge_arrays(graph):
+    edges = np.array(graph.edges, dtype=np.int64).reshape(-1, 2)
+    return (edges[:,0], edges[:,1])
+
+
+# set the objective to minimize the sum of the given variables
+def minimize_sum(m, variables):
+    variables = list(variables.values())
+    m.setAttr('Obj', variables, [1.0] * len(variables))
+    m.ModelSense = 1 # minimize
@@ -0,0 +1,177 @@
+import time
+import random
+
+# Combinatorial solver for the max B problem: find a large vertex subset B that can be put into q bins, each with
+#   population at most capacity, so that vertices in different bins are not adjacent (each component of G[B]
+#   lies in one bin). A greedy construction adds vertices by increasing population. A local search then takes
+#   one vertex out of B at a time and re-adds the vertices around it, keeping changes that make B larger, or
+#   keep its size and lower its population (leaving more room in the bins).
+
+
+class Bins:
+
+    def __init__(self, graph, q, capacity):
+        self.graph = graph
+        self.q = q
+        self.capacity = capacity
+        self.bin = [ -1 for v in graph.nodes ] # bin of each vertex, or -1 if it is not in B
+        self.load = [0] * q
+        self.size = 0
+        self.journal = list() # changes (v, old bin) since the last commit, so that they can be undone
+
+    def set_bin(self, v, b, record=True):
+        old = self.bin[v]
+        if old == b:
+            return
+        if record:
+            self.journal.append((v, old))
+        p = self.graph.pop[v]
+        if old >= 0:
+            self.load[old] -= p
+        else:
+            self.size += 1
+        if b >= 0:
+            self.load[b] += p
+        else:
+            self.size -= 1
+        self.bin[v] = b
+
+    def commit(self):
+        self.journal = list()
+
+    def undo(self):
+        while self.journal:
+            (v, old) = self.journal.pop()
+            self.set_bin(v, old, record=False)
+
+    # vertices of the components of G[B] that contain the given vertices of B
+    def components_of(self, vertices):
+        found = set(vertices)
+        stack = list(vertices)
+        while stack:
+            u = stack.pop()
+            for w in self.graph.adjacency[u]:
+                if self.bin[w] >= 0 and w not in found:
+                    found.add(w)
+                    stack.append(w)
+        return found
+
+    # Adds v to B, in a bin that can take v together with the components of G[B] that v joins
+    #   (those in other bins move along). Returns True if there is such a bin.
+    def add(self, v):
+        pop = self.graph.pop
+        touching = [ u for u in self.graph.adjacency[v] if self.bin[u] >= 0 ]
+        if not touching:
+            b = min(range(self.q), key=lambda b: self.load[b])
+            if self.load[b] + pop[v] > self.capacity:
+                return False
+            self.set_bin(v, b)
+            return True
+
+        joined = self.components_of(touching)
+        amount = [0] * self.q
+        for u in joined:
+            amount[self.bin[u]] += pop[u]
+        total = sum(amount) + pop[v]
+        fits = [ b for b in range(self.q) if self.load[b] - amount[b] + total <= self.capacity ]
+        if not fits:
+            return False
+        b = max(fits, key=lambda b: amount[b]) # move as little as possible
+        for u in joined:
+            self.set_bin(u, b)
+        self.set_bin(v, b)
+        return True
+
+    def add_all(self, vertices):
+        pop = self.graph.pop
+        for v in sorted(vertices, key=lambda v: (pop[v], v)):
+            if self.bin[v] < 0:
+                self.add(v)
+        self.commit()
+
+    # One round of local search over the given vertices of B (default: all). Returns True if B changed
+    def improve(self, deadline, vertices=None):
+        graph = self.graph
+        pop = graph.pop
+        changed = False
+        if vertices is None:
+            vertices = graph.nodes
+        for v in sorted(( v for v in vertices if self.bin[v] >= 0 ), key=lambda v: (-pop[v], v)):
+            if time.time() >= deadline:
+                break
+            if self.bin[v] < 0:
+                continue
+            (size, total) = (self.size, sum(self.load))
+            self.set_bin(v, -1)
+
+            # vertices within distance two of v
+            near = set(graph.adjacency[v])
+            for u in graph.adjacency[v]:
+                near.update(graph.adjacency[u])
+            near.discard(v)
+            for u in sorted(near, key=lambda u: (pop[u], u)):
+                if self.bin[u] < 0:
+                    self.add(u)
+
+            if self.size > size or (self.size == size and sum(self.load) < total):
+                self.commit()
+                changed = True
+            else:
+                self.undo()
+        return changed
+
+
+    # Perturbation: takes v and its neighbors out of B, then adds them back in random order (where they fit),
+    #   followed by local search near v
+    def kick(self, v, rng, deadline):
+        adjacency = self.graph.adjacency
+        ball = [v] + list(adjacency[v])
+        for u in ball:
+            self.set_bin(u, -1)
+        rng.shuffle(ball)
+        for u in ball:
+            self.add(u)
+        self.add_all(self.graph.nodes)
+        near = set(ball)
+        for u in ball:
+            near.update(adjacency[u])
+        while time.time() < deadline and self.improve(deadline, near):
+            self.add_all(self.graph.nodes)
+
+    def local_search(self, deadline):
+        self.add_all(self.graph.nodes)
+        while time.time() < deadline and self.improve(deadline):
+            self.add_all(self.graph.nodes)
+
+    def snapshot(self):
+        return (list(self.bin), list(self.load), self.size)
+
+    def restore(self, snapshot):
+        (bin, load, size) = snapshot
+        (self.bin, self.load, self.size) = (list(bin), list(load), size)
+        self.commit()
+
+
+max_kicks = 100 # perturbations in all
+
+# Bin of each vertex in a large feasible B (-1 if the vertex is not in B). After the greedy construction and local
+#   search, random perturbations (each followed by local search) are tried, keeping solutions that are not smaller,
+#   for max_kicks perturbations. So B depends only on the instance and the seed, not on the machine. time_limit
+#   is only a safety cap.
+def solve(graph, q, capacity, time_limit=600, seed=0):
+    deadline = time.time() + time_limit
+    rng = random.Random(seed)
+    bins = Bins(graph, q, capacity)
+    bins.local_search(deadline)
+    best = bins.snapshot()
+    kicks = 0
+    while time.time() < deadline and kicks < max_kicks:
+        bins.kick(rng.choice(graph.nodes), rng, deadline)
+        kicks += 1
+        if bins.size >= best[2]:
+            best = bins.snapshot()
+        else:
+            bins.restore(best)
+    if time.time() >= deadline:
+        print("Warning: max B search stopped at its time limit of",time_limit,"seconds, so B depends on the machine.")
+    return best[0]
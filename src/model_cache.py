@@ -0,0 +1,166 @@
+import gurobipy as gp
+
+import os
+import json
+import hashlib
+import itertools
+
+# On-disk cache of fully built (and fixed) models, so that repeated runs with the same instance and
+#   model-relevant config can skip building, vertex ordering (max B), and fixing. Each entry has files
+#       <key>.mps.gz      the model (variables, bounds after fixing, rows, objective)
+#       <key>.json        sidecar: variable index map, Lazy and BranchPriority attributes, B, vertex ordering, and results of the build
+#   The sidecar is written last, so an entry exists once its sidecar does.
+#   When the cache is larger than its size limit, least recently used entries are deleted.
+
+cache_version = 2 # change whenever the formulations (or the results kept with them) change, so that old entries are not used
+
+# config keys that determine the model. Others (like heuristic, lp, builder) do not change it.
+#   (maxB_polish may change B, and with it the vertex ordering and fixings.)
+model_config_keys = ['state', 'level', 'base', 'contiguity', 'symmetry', 'extended', 'fixing', 'order', 'maxB_polish', 'reduction']
+
+
+def cache_key(graph_filename, config, k, L, U):
+    h = hashlib.sha256()
+    with open(graph_filename, 'rb') as graph_file:
+        for chunk in iter(lambda: graph_file.read(1<<20), b''):
+            h.update(chunk)
+    model_config = { ckey : config[ckey] for ckey in model_config_keys }
+    h.update(json.dumps([cache_version, model_config, k, L, U], sort_keys=True).encode())
+    return h.hexdigest()[:32]
+
+
+# keys of the tupledicts m._X, m._R, m._Y, m._Z, as created by m.addVars in main.py
+def variable_dimensions(base):
+    districts = 'nodes' if base == 'hess' else 'districts'
+    return { '_X' : ['nodes', districts], '_R' : ['nodes', 'districts'], '_Y' : ['edges'], '_Z' : ['edges', districts] }
+
+
+def variable_keys(dimensions, graph, k):
+    keys_of = {
+        'nodes' : [ (i,) for i in graph.nodes ],
+        'districts' : [ (j,) for j in range(k) ],
+        'edges' : [ (u,v) for u,v in graph.edges ]
+    }
+    return [ sum(key, ()) for key in itertools.product(*(keys_of[d] for d in dimensions)) ]
+
+
+# nonzero values of a list, as runs [start, stop, value]
+def runs(values):
+    result = list()
+    for (t, value) in enumerate(values):
+        if value == 0:
+            continue
+        if result and result[-1][1] == t and result[-1][2] == value:
+            result[-1][1] = t+1
+        else:
+            result.append([t, t+1, value])
+    return result
+
+
+def entry_files(cache_dir, key):
+    return [ os.path.join(cache_dir, key + ext) for ext in ('.mps.gz', '.json') ]
+
+
+# save model m (with base config['base']) and what the build found, like B, vertex ordering, and fixing counts (in built)
+def save(cache_dir, key, m, base, B, vertex_ordering, built, max_bytes):
+    os.makedirs(cache_dir, exist_ok=True)
+    (mps_filename, json_filename) = entry_files(cache_dir, key)
+    m.update()
+
+    variables = dict()
+    for (name, dimensions) in variable_dimensions(base).items():
+        if hasattr(m, name):
+            variables[name] = { 'first' : next(iter(getattr(m, name).values())).index, 'dimensions' : dimensions }
+
+    # MPS files move lazy constraints (and user cuts) to the end, which would change the row order.
+    #   So, write the rows without Lazy attributes, and keep them in the sidecar instead
+    constrs = m.getConstrs()
+    lazy = m.getAttr('Lazy', constrs)
+    lazy_runs = runs(lazy)
+    if lazy_runs:
+        m.setAttr('Lazy', constrs, [0] * len(constrs))
+        m.update()
+
+    # MPS files do not keep branching priorities either
+    priority_runs = runs(m.getAttr('BranchPriority', m.getVars()))
+
+    # write to temporary files first, so that other processes never read a partial entry
+    tmp = '.' + str(os.getpid()) + '.tmp'
+    try:
+        m.write(mps_filename + tmp + '.mps.gz')
+        os.replace(mps_filename + tmp + '.mps.gz', mps_filename)
+    finally:
+        if os.path.exists(mps_filename + tmp + '.mps.gz'):
+            os.remove(mps_filename + tmp + '.mps.gz')
+        if lazy_runs:
+            m.setAttr('Lazy', constrs, lazy)
+            m.update()
+
+    sidecar = { 'version' : cache_version, 'variables' : variables, 'lazy' : lazy_runs, 'priority' : priority_runs,
+                'B' : B, 'ordering' : vertex_ordering, 'built' : built }
+    with open(json_filename + tmp, 'w') as json_file:
+        json.dump(sidecar, json_file)
+    os.replace(json_filename + tmp, json_filename)
+
+    evict(cache_dir, max_bytes)
+
+
+# load a cached model, or return None if there is no (complete) entry for key.
+#   Returns (m, B, vertex_ordering, built); m has tupledicts m._X, etc. like a freshly built model
+def load(cache_dir, key, graph, k):
+    (mps_filename, json_filename) = entry_files(cache_dir, key)
+    try:
+        with open(json_filename, 'r') as json_file:
+            sidecar = json.load(json_file)
+        if sidecar['version'] != cache_version:
+            return None
+        m = gp.read(mps_filename)
+    except (OSError, ValueError, gp.GurobiError):
+        return None # missing, partial, or just-evicted entry
+
+    constrs = m.getConstrs()
+    for (start, stop, value) in sidecar['lazy']:
+        m.setAttr('Lazy', constrs[start:stop], [value] * (stop-start))
+
+    variables = m.getVars()
+    for (start, stop, value) in sidecar['priority']:
+        m.setAttr('BranchPriority', variables[start:stop], [value] * (stop-start))
+
+    for (name, info) in sidecar['variables'].items():
+        keys = variable_keys(info['dimensions'], graph, k)
+        first = info['first']
+        setattr(m, name, gp.tupledict(zip(keys, variables[first:first+len(keys)])))
+    m.update()
+
+    # mark entry as recently used
+    os.utime(json_filename)
+    return (m, sidecar['B'], sidecar['ordering'], sidecar['built'])
+
+
+# delete least recently used entries until the cache takes at most max_bytes
+def evict(cache_dir, max_bytes):
+    entries = list()
+    total = 0
+    for filename in os.listdir(cache_dir):
+        if not filename.endswith('.json'):
+            continue
+        key = filename[:-len('.json')]
+        try:
+            last_used = os.path.getmtime(os.path.join(cache_dir, filename))
+            size = sum( os.path.getsize(f) for f in entry_files(cache_dir, key) if os.path.exists(f) )
+        except OSError:
+            continue # evicted by another process
+        entries.append((last_used, key, size))
+        total += size
+
+    entries.sort()
+    for (last_used, key, size) in entries:
+        if total <= max_bytes:
+            break
+        # delete the sidecar first, so the entry stops being loadable
+        for f in reversed(entry_files(cache_dir, key)):
+            try:
+                os.remove(f)
+            except OSError:
+                pass
+        total -= size
@@ -0,0 +1,283 @@
+import gurobipy as gp
+from gurobipy import GRB
+
+import math
+import time
+import random
+import argparse
+import numpy as np
+
+import csrgraph
+import labeling
+import local_search
+
+# Multilevel districting, for instances (like tracts) that are too large for the exact models:
+#   1. Coarsen: heavy-edge matching merges adjacent vertices into super-nodes of at most max_share*L people, level
+#      after level, until there are at most coarse_nodes_per_district*k super-nodes (or a level hardly shrinks).
+#      A coarse edge stands for all the edges between its super-nodes, and has their number as weight.
+#   2. Solve the coarsest instance with the labeling model (coarse_solver = 'labeling', with SCF contiguity) or the
+#      GerryChain heuristic ('heuristic'). Its population bounds are widened by its largest super-node population.
+#   3. Project the plan back, one level at a time, balancing populations (to the bounds of that level) and then
+#      refining the district boundaries by local search (see local_search.py).
+#   main.py uses the plan as a warm start (config multilevel) and to fix the assignments of vertices far from the
+#   plan's district boundaries (multilevel = fixing).
+
+coarse_solver = 'labeling'
+coarse_nodes_per_district = 20
+max_share = 0.1 # largest super-node population, as a fraction of L
+min_shrink = 0.05 # stop coarsening when a level has fewer than this fraction of vertices less than the one before
+coarse_time_limit = 60 # seconds for solving the coarsest instance
+initial_tries = 10 # random plans grown on the coarsest instance (the best one is the MIP warm start)
+heuristic_iterations = 1000 # recom steps of the GerryChain heuristic, when it is the coarse solver
+refine_time_limit = 10 # seconds of local search per level
+cycles = 10 # V-cycles (the first solves the coarsest instance, the others refine the best plan on new coarse levels)
+fixing_depth = 3 # with multilevel = fixing, fix the vertices at least this many edges away from other districts
+
+
+# One level of coarsening. Visits the vertices in random order, and merges each unmatched vertex with the unmatched
+#   neighbor across its heaviest edge (ties go to smaller population), if together they have at most max_population
+#   people (and, if label is given, the same label). Returns (coarse graph, parent), where parent[v] is the
+#   super-node of vertex v.
+def coarsen(graph, max_population, rng, label=None):
+    pop = graph.pop
+    match = [ -1 for v in graph.nodes ]
+    order = list(graph.nodes)
+    rng.shuffle(order)
+    for v in order:
+        if match[v] >= 0:
+            continue
+        match[v] = v
+        best = None
+        for (u, w) in zip(graph.adjacency[v], graph.weights[v]):
+            if match[u] < 0 and pop[u] + pop[v] <= max_population and (label is None or label[u] == label[v]):
+                if best is None or (w, -pop[u]) > best[0]:
+                    best = ((w, -pop[u]), u)
+        if best is not None:
+            u = best[1]
+            match[v] = u
+            match[u] = v
+
+    parent = [ -1 for v in graph.nodes ]
+    n = 0
+    for v in graph.nodes:
+        if parent[v] < 0:
+            parent[v] = n
+            parent[match[v]] = n
+            n += 1
+
+    return (csrgraph.contract(graph, parent), parent)
+
+
+# Random plans grown from random seeds, balanced to [L,U] and refined; returns the labels of the best one
+#   (with fewest cut edges), or None if no plan could be balanced. Refinement stops at the deadline, if given
+def initial_plan(graph, k, L, U, rng, tries, deadline=math.inf):
+    best = None
+    for t in range(tries):
+        refiner = local_search.Refiner(graph, local_search.random_plan(graph, k, rng), k, L, U)
+        if min(refiner.size) == 0 or not refiner.balance(graph.n):
+            continue
+        refine_deadline = min(time.time() + refine_time_limit, deadline)
+        while time.time() < refine_deadline and refiner.fm_pass(refine_deadline, 100):
+            pass
+        if best is None or refiner.cut < best.cut:
+            best = refiner
+    return None if best is None else best.label
+
+
+# Solves the coarse instance with the labeling model (extended objective, with edge weights, and SCF contiguity),
+#   warm started from start (if given). Returns the labels of the best plan found, or None.
+def solve_labeling(graph, k, L, U, start, time_limit):
+    m = gp.Model()
+    m._graph = graph
+    m._population = list(graph.pop)
+    m._U = U
+    m._k = k
+    m._X = m.addVars(graph.nodes, range(k), vtype=GRB.BINARY)
+    m._R = m.addVars(graph.nodes, range(k), vtype=GRB.BINARY)
+    labeling.add_base_constraints(m, m._population, L, U, k)
+    labeling.add_extended_objective(m, graph, k)
+    labeling.add_scf_constraints(m, graph, True, 'default')
+    m.update()
+
+    # a coarse edge is cut as many times as its weight
+    Z = [ m._Z[u,v,j] for (u,v) in graph.edges for j in range(k) ]
+    m.setAttr(GRB.Attr.Obj, Z, [ w for w in graph.edge_weight.tolist() for j in range(k) ])
+
+    if start is not None:
+        for v in graph.nodes:
+            m._X[v,start[v]].start = 1
+
+    m.Params.TimeLimit = time_limit
+    m.Params.LogToConsole = 0
+    m.optimize()
+    if m.SolCount == 0:
+        return None
+    return [ max(range(k), key=lambda j: m._X[v,j].x) for v in graph.nodes ]
+
+
+# Solves the coarse instance with the GerryChain heuristic (see heuristic.py), where each edge has its weight as
+#   length. Returns the labels of the best plan found, or None.
+def solve_heuristic(graph, k, L, U, time_limit, seed):
+    import heuristic
+    G = heuristic.Graph() # GerryChain's graph
+    for v in graph.nodes:
+        G.add_node(v, TOTPOP=graph.pop[v])
+    for ((u,v), w) in zip(graph.edges, graph.edge_weight.tolist()):
+        G.add_edge(u, v, edge_length=w)
+
+    # GerryChain's population bounds are symmetric around the ideal population
+    ideal = sum(graph.pop) / k
+    deviation = 2 * min(U - ideal, ideal - L) / ideal
+    limits = { 'time' : time_limit, 'proposal_time' : heuristic.proposal_time_limit,
+               'rejections' : heuristic.max_rejections, 'retries' : heuristic.max_retries }
+    saved = heuristic.run_chain(G, deviation, k, [heuristic_iterations], seed, limits=limits)
+    if saved is None or saved['best_assignment'] is None:
+        return None
+    return saved['best_assignment']
+
+
+# Coarsens graph until it has at most coarse_nodes_per_district*k super-nodes (or a level hardly shrinks), keeping
+#   the districts of label (if given) intact. Returns the graphs of all levels (the first is graph), and the parents
+#   of the vertices of each level but the last
+def coarsen_levels(graph, k, L, rng, label=None):
+    levels = [ graph ]
+    parents = list()
+    while levels[-1].n > coarse_nodes_per_district * k:
+        (coarse, parent) = coarsen(levels[-1], max_share * L, rng, label)
+        if coarse.n > (1 - min_shrink) * levels[-1].n:
+            break
+        levels.append(coarse)
+        parents.append(parent)
+        if label is not None:
+            coarse_label = [ -1 for c in coarse.nodes ]
+            for v in range(len(label)):
+                coarse_label[parent[v]] = label[v]
+            label = coarse_label
+    return (levels, parents)
+
+
+# Projects the labels of the coarsest level back to graph (levels[0]), balancing populations and refining at each level.
+#   The population bounds of a level are widened by its largest super-node population (but not on graph itself).
+#   Returns (labels, cut edges), or None if the populations could not be balanced.
+def uncoarsen(levels, parents, label, k, L, U):
+    for t in range(len(levels)-1, -1, -1):
+        level = levels[t]
+        if t < len(levels)-1:
+            label = [ label[parents[t][v]] for v in level.nodes ]
+        slack = max(level.pop) if t > 0 else 0
+        refiner = local_search.Refiner(level, label, k, L - slack, U + slack)
+        if not refiner.balance(level.n):
+            if t == 0:
+                return None
+            continue
+        deadline = time.time() + refine_time_limit
+        while time.time() < deadline and refiner.fm_pass(deadline, 100):
+            pass
+        label = refiner.label
+    return (label, refiner.cut)
+
+
+# Plan with k districts of population in [L,U]: coarsens the graph, solves the coarsest instance, and projects the
+#   plan back. Then, for each of cycles-1 more V-cycles, coarsens again (keeping the districts of the best plan intact,
+#   so that its labels carry over to the coarsest level) and projects back, keeping the better plan.
+#   Returns (districts, number of levels of the first cycle), where districts is None if no plan was found.
+def solve(graph, k, L, U, seed=0):
+    rng = random.Random(seed)
+    (levels, parents) = coarsen_levels(graph, k, L, rng)
+    coarsest = levels[-1]
+    print("Multilevel:",len(levels),"levels, the coarsest with",coarsest.n,"super-nodes and",coarsest.m,"edges")
+
+    slack = max(coarsest.pop) if len(levels) > 1 else 0
+    (coarse_L, coarse_U) = (L - slack, U + slack)
+    label = initial_plan(coarsest, k, coarse_L, coarse_U, rng, initial_tries)
+    if coarse_solver == 'labeling':
+        label = solve_labeling(coarsest, k, coarse_L, coarse_U, label, coarse_time_limit)
+    elif coarse_solver == 'heuristic':
+        label = solve_heuristic(coarsest, k, coarse_L, coarse_U, coarse_time_limit, seed) or label
+    if label is None:
+        print("Multilevel: no plan found for the coarsest instance.")
+        return (None, len(levels))
+
+    best = uncoarsen(levels, parents, label, k, L, U)
+    if best is None:
+        print("Multilevel: could not balance the populations of the projected plan.")
+        return (None, len(levels))
+    print("Multilevel: cycle 1 plan has",best[1],"cut edges")
+
+    for cycle in range(2, cycles+1):
+        if len(levels) == 1:
+            break # the graph was solved as a whole
+        (cycle_levels, cycle_parents) = coarsen_levels(graph, k, L, rng, best[0])
+        label = [ -1 for c in cycle_levels[-1].nodes ]
+        for v in graph.nodes:
+            c = v
+            for parent in cycle_parents:
+                c = parent[c]
+            label[c] = best[0][v]
+        plan = uncoarsen(cycle_levels, cycle_parents, label, k, L, U)
+        if plan is not None and plan[1] < best[1]:
+            best = plan
+        print("Multilevel: cycle",cycle,"plan has",best[1],"cut edges")
+
+    label = best[0]
+    return ([ [ v for v in graph.nodes if label[v] == j ] for j in range(k) ], len(levels))
+
+
+# Fixes each vertex at least depth edges away from other districts (of the plan) to its district, labeled like the
+#   warm start in main.py: hess centers each district at its vertex of earliest position, and labeling numbers the
+#   districts by that position. Unlike those of fixing.py, these fixings are not safe: the MIP then only
+#   searches near the plan. Returns the number of fixings.
+def fix_interior(m, graph, districts, position, base, depth=fixing_depth):
+    label = [ -1 for v in graph.nodes ]
+    for j in range(len(districts)):
+        for v in districts[j]:
+            label[v] = j
+
+    # distance (in edges) to the nearest vertex that has a neighbor in another district
+    dist = [ -1 for v in graph.nodes ]
+    boundary = [ v for v in graph.nodes if any( label[u] != label[v] for u in graph.adjacency[v] ) ]
+    for v in boundary:
+        dist[v] = 0
+    for v in boundary: # grows while we scan it
+        if dist[v] >= depth:
+            break
+        for u in graph.adjacency[v]:
+            if dist[u] < 0:
+                dist[u] = dist[v] + 1
+                boundary.append(u)
+
+    roots = sorted( (min(district, key=lambda v: position[v]) for district in districts), key=lambda r: position[r] )
+    variables = list()
+    for district in districts:
+        r = min(district, key=lambda v: position[v])
+        j = r if base == 'hess' else roots.index(r)
+        variables.extend( m._X[v,j] for v in district if dist[v] < 0 or dist[v] >= depth )
+    variables = [ var for (var, lb, ub) in zip(variables, m.getAttr(GRB.Attr.LB, variables), m.getAttr(GRB.Attr.UB, variables)) if lb < 0.5 and ub > 0.5 ]
+    m.setAttr(GRB.Attr.LB, variables, [1] * len(variables))
+    m.update()
+    return len(variables)
+
+
+if __name__ == '__main__':
+    import main
+    import data_cache
+    parser = argparse.ArgumentParser(description="Find a districting plan by multilevel coarsening and refinement.")
+    parser.add_argument('state', help="2-letter state code")
+    parser.add_argument('--level', default='tract', choices=['county', 'tract'], help="land units (default: tract)")
+    parser.add_argument('--solver', default=coarse_solver, choices=['labeling', 'heuristic'], help="solver for the coarsest instance (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the coarsening and initial plans (default: 0)")
+    args = parser.parse_args()
+
+    coarse_solver = args.solver
+    graph = data_cache.load_graph("../data/"+args.level+"/dual_graphs/"+args.level+main.state_codes[args.state]+".json")
+    k = main.number_of_congressional_districts[args.state]
+    deviation = 0.01
+    L = int(np.ceil((1-deviation/2)*sum(graph.pop)/k))
+    U = int(np.floor((1+deviation/2)*sum(graph.pop)/k))
+    start = time.time()
+    (districts, levels) = solve(graph, k, L, U, args.seed)
+    if districts is None:
+        print("No plan found.")
+    else:
+        print("Plan with",local_search.cut_edges(graph, districts),"cut edges, feasible =",local_search.is_feasible(graph, districts, L, U),
+              ", levels =",levels,", time =",'{0:.2f}'.format(time.time()-start))
@@ -1,6 +1,7 @@
 import gurobipy as gp
 from gurobipy import GRB 
-import time
+
+import maxB
 
 def sort_by_second(val):
     return val[1]
@@ -14,65 +15,71 @@ def construct_position(ordering):
     return position
 
 
-def find_ordering(order, B, DG, population):
+def find_ordering(order, B, graph, population):
     if order == 'decreasing':
-        nodes_with_population = [(i,population[i]) for i in DG.nodes]
+        nodes_with_population = [(i,population[i]) for i in graph.nodes]
         nodes_with_population.sort(key=sort_by_second,reverse=True)
         return [v for (v,p) in nodes_with_population]
     elif order == 'B_decreasing':
-        V_B_with_population = [(i,population[i]) for i in DG.nodes if i not in B]
+        V_B_with_population = [(i,population[i]) for i in graph.nodes if i not in B]
         V_B_with_population.sort(key=sort_by_second,reverse=True)
         return [v for (v,p) in V_B_with_population] + B
     else:
-        return [v for v in DG.nodes]
+        return [v for v in graph.nodes]
+    
+
+# Max B problem: find a large vertex subset B whose components (in G[B]) fit into q=k bins of population at most L-1,
+#   using the combinatorial solver in maxB.py. If polish, its solution warm-starts a MIP that tries to improve on it.
+def solve_maxB_problem(graph, population, L, k, polish=False):
+    q = k
+    bins = maxB.solve(graph, q, L-1)
+    B_sol = [i for i in graph.nodes if bins[i] >= 0 ]
+    print("max B (combinatorial) =",len(B_sol))
     
+    if polish:
+        B_timelimit = 60
+        B_sol = polish_maxB_problem(graph, population, L, q, bins, B_timelimit)
+    else:
+        B_timelimit = 'n/a'
+        
+    return (B_sol, q, B_timelimit)  
 
-def solve_maxB_problem(DG, population, L, k, heuristic_districts):
+
+def polish_maxB_problem(graph, population, L, q, bins, B_timelimit):
     m = gp.Model()
     m.params.LogToConsole = 0 # keep log to a minimum
-    q = k
     
     # X[i,j]=1 if vertex i is assigned to bin j
-    X = m.addVars(DG.nodes, range(q), vtype=GRB.BINARY)
+    X = m.addVars(graph.nodes, range(q), vtype=GRB.BINARY)
     
     # B[i]=1 if vertex i is selected in set B
-    B = m.addVars(DG.nodes, vtype=GRB.BINARY)
+    B = m.addVars(graph.nodes, vtype=GRB.BINARY)
    
     # assignment constraints            
-    m.addConstrs( gp.quicksum(X[i,j] for j in range(q)) == B[i] for i in DG.nodes )
+    m.addConstrs( gp.quicksum(X[i,j] for j in range(q)) == B[i] for i in graph.nodes )
                 
     # bin population should be less than L
-    m.addConstrs( gp.quicksum(population[i] * X[i,j] for i in DG.nodes) <= L-1 for j in range(q) )
+    m.addConstrs( gp.quicksum(population[i] * X[i,j] for i in graph.nodes) <= L-1 for j in range(q) )
     
     # bins shouldn't touch each other
-    m.addConstrs( X[u,j] + B[v] <= 1 + X[v,j] for u,v in DG.edges for j in range(q) )
+    m.addConstrs( X[u,j] + B[v] <= 1 + X[v,j] for u,v in graph.arcs for j in range(q) )
     
     # objective is to maximize size of set B
     m.setObjective( gp.quicksum( B ), GRB.MAXIMIZE )
     
     m.Params.MIPFocus = 1 # turn on MIPFocus
-    B_timelimit = 60
-    m.Params.timeLimit = B_timelimit # 60-second time limit
+    m.Params.timeLimit = B_timelimit
     
-    # suggest a (partial) warm start
-    if heuristic_districts is not None:
-        for j in range(k):
-            for i in heuristic_districts[j]:
-                for t in range(q):
-                    if t != j:
-                        X[i,t].start = 0.0
+    # warm start with the combinatorial solution
+    for i in graph.nodes:
+        B[i].start = 1 if bins[i] >= 0 else 0
+        for j in range(q):
+            X[i,j].start = 1 if bins[i] == j else 0
     
-    start = time.time()
     m.optimize()
-    end = time.time()
-    B_time = '{0:.2f}'.format(end-start)
-    
     
-    if m.status in { GRB.OPTIMAL, GRB.TIME_LIMIT }:
-        B_sol = [i for i in DG.nodes if B[i].x > 0.5 ]
+    if m.SolCount > 0 and m.status in { GRB.OPTIMAL, GRB.TIME_LIMIT }:
         print("max B obj val =",m.objVal)
+        return [i for i in graph.nodes if B[i].x > 0.5 ]
     else:
-        B_sol = list()
-        
-    return (B_sol, q, B_time, B_timelimit)  
-
+        return [i for i in graph.nodes if bins[i] >= 0 ]
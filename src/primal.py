@@ -0,0 +1,80 @@
+from gurobipy import GRB
+
+import time
+
+import local_search
+
+# Primal heuristic, called at MIPNODE: rounds the node's LP solution X into a districting plan (connected districts,
+#   population in [L,U]), improves it by local search, and gives it to Gurobi if it beats the incumbent.
+#   Gurobi completes the solution (e.g., flow variables) from the values of X, R, Y, Z.
+
+# when to run: at the root node, then every node_interval nodes, while the heuristic has taken
+#   at most time_share of the running time
+node_interval = 100
+time_share = 0.1
+refine_time_limit = 1 # seconds of local search per rounded plan, and at most as long to balance it first
+
+
+# weight[v][j] = LP value of assigning vertex v to district j. For hess, the districts are
+#   centered at the k vertices with largest X[j,j]
+def district_weights(m, xval):
+    graph = m._graph
+    if m._base == 'hess':
+        centers = sorted(graph.nodes, key=lambda j: -xval[j,j])[:m._k]
+        return [ [ xval[v,c] for c in centers ] for v in graph.nodes ]
+    else: # base == 'labeling'
+        return [ [ xval[v,j] for j in range(m._k) ] for v in graph.nodes ]
+
+
+# values of X (and R, Y, Z, if the model has them) for the plan, labeled like the heuristic warm start in main.py:
+#   hess centers each district at its vertex of earliest position; labeling numbers the districts by that position
+def solution_values(m, districts):
+    graph = m._graph
+    position = m._position
+    roots = sorted( (min(district, key=lambda v: position[v]) for district in districts), key=lambda r: position[r] )
+    label = [ -1 for v in graph.nodes ]
+    for district in districts:
+        r = min(district, key=lambda v: position[v])
+        j = r if m._base == 'hess' else roots.index(r)
+        for v in district:
+            label[v] = j
+
+    variables = list()
+    values = list()
+    for ((i,j), var) in m._X.items():
+        variables.append(var)
+        values.append(1 if label[i] == j else 0)
+    if hasattr(m, '_R'):
+        for ((i,j), var) in m._R.items():
+            variables.append(var)
+            values.append(1 if i == roots[j] else 0)
+    if hasattr(m, '_Y'):
+        for ((u,v), var) in m._Y.items():
+            variables.append(var)
+            values.append(1 if label[u] != label[v] else 0)
+    if hasattr(m, '_Z'):
+        for ((u,v,j), var) in m._Z.items():
+            variables.append(var)
+            values.append(1 if label[u] == j and label[v] != j else 0)
+    return (variables, values)
+
+
+def primal_heuristic(m, where):
+    if where != GRB.Callback.MIPNODE or m.cbGet(GRB.Callback.MIPNODE_STATUS) != GRB.OPTIMAL:
+        return
+    node = m.cbGet(GRB.Callback.MIPNODE_NODCNT)
+    if node < m._primalNode or m._primalTime > time_share * m.cbGet(GRB.Callback.RUNTIME):
+        return
+    m._primalNode = node + node_interval
+
+    start = time.time()
+    xval = m.cbGetNodeRel(m._X)
+    districts = local_search.repair(m._graph, district_weights(m, xval), m._L, m._U, deadline=start+refine_time_limit)
+    if districts is not None:
+        (districts, cut) = local_search.refine(m._graph, districts, m._L, m._U, time_limit=refine_time_limit)
+        if cut < m.cbGet(GRB.Callback.MIPNODE_OBJBST) - 0.5:
+            (variables, values) = solution_values(m, districts)
+            m.cbSetSolution(variables, values)
+            if m.cbUseSolution() < GRB.INFINITY:
+                m._numPrimalSolutions += 1
+    m._primalTime += time.time() - start
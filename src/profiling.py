@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+import cProfile
+import contextlib
+
+# Stage profiling of a run. Each stage adds two columns to the results:
+#   <stage>_time    wall time of the stage, in seconds
+#   <stage>_rss     peak resident set size during the stage, in MB (on Linux, the peak is reset when a stage
+#                   starts; elsewhere it is the peak of the process so far)
+# If profile_dir is set, each stage also dumps a cProfile file <profile_dir>/<run>-<stage>.prof of the calling
+#   thread (view it with pstats or snakeviz).
+
+profile_dir = None
+
+
+# the two columns of each stage, like columns('base', 'objective')
+def columns(*stages):
+    return [ stage_name + suffix for stage_name in stages for suffix in ['_time', '_rss'] ]
+
+
+# stages that do not run (in this config) get 'n/a' columns
+def skip(result, *stages):
+    for column in columns(*stages):
+        result[column] = 'n/a'
+
+
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+# peak RSS in MB, or None if it is not known (like on Windows)
+def peak_rss():
+    try:
+        with open('/proc/self/status', 'r') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 2**20 if sys.platform == 'darwin' else maxrss / 1024 # bytes on macOS, else KB
+
+
+# with stage(result, 'base'): ... sets result['base_time'] and result['base_rss']
+@contextlib.contextmanager
+def stage(result, stage_name):
+    reset_peak_rss()
+    profiler = None
+    if profile_dir is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = time.time()
+    try:
+        yield
+    finally:
+        end = time.time()
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(profile_dir, str(result['run']) + "-" + stage_name + ".prof"))
+        rss = peak_rss()
+        result[stage_name + '_time'] = '{0:.2f}'.format(end-start)
+        result[stage_name + '_rss'] = 'n/a' if rss is None else '{0:.1f}'.format(rss)
@@ -0,0 +1,114 @@
+import csrgraph
+
+# Safe reduction of the dual graph, for models that impose contiguity. If c is a cut vertex and H is a component of
+#   G-c with population less than L, then in every plan with connected districts, H lies in the district of c (a
+#   district that meets H but not c lies inside H, so it has too few people). So H and c can be merged into one
+#   vertex, with their total population, without changing the optimal plans: the edges inside it are never cut.
+#   This catches pendant vertices, and small 2-connected pieces hanging off a single cut vertex. It is repeated on
+#   the merged graph (where the merged vertices can be cut vertices themselves) until nothing changes.
+#   H touches the rest of the graph only through c, so no parallel edges arise: all edge weights of the reduced
+#   graph are 1, and the models count its cut edges like those of the original graph.
+
+
+# The small pieces of the graph: pairs (c, H) where c is a cut vertex and H is (the list of vertices of) a component
+#   of G-c with population less than L. Uses a depth-first search (Hopcroft-Tarjan), without recursion.
+def small_pieces(graph, L):
+    adjacency = graph.adjacency
+    pop = graph.pop
+    disc = [ -1 for v in graph.nodes ] # preorder number; the subtree of v is order[disc[v]:disc[v]+size[v]]
+    low = [ 0 for v in graph.nodes ]
+    size = [ 1 for v in graph.nodes ]
+    subtree_population = list(pop)
+    separated_population = [ 0 for v in graph.nodes ] # population of the subtrees of children that G-v separates
+    order = list()
+    pieces = list()
+
+    for root in graph.nodes:
+        if disc[root] >= 0:
+            continue
+        start = len(order)
+        disc[root] = low[root] = len(order)
+        order.append(root)
+        stack = [ (root, -1, 0) ]
+        while stack:
+            (v, parent, t) = stack.pop()
+            if t < len(adjacency[v]):
+                stack.append((v, parent, t+1))
+                w = adjacency[v][t]
+                if disc[w] < 0:
+                    disc[w] = low[w] = len(order)
+                    order.append(w)
+                    stack.append((w, v, 0))
+                elif w != parent:
+                    low[v] = min(low[v], disc[w])
+                continue
+
+            # v is finished; the subtree of v is a component of G-parent if nothing in it reaches above parent
+            if parent >= 0:
+                low[parent] = min(low[parent], low[v])
+                size[parent] += size[v]
+                subtree_population[parent] += subtree_population[v]
+                if low[v] >= disc[parent]:
+                    separated_population[parent] += subtree_population[v]
+                    if subtree_population[v] < L:
+                        pieces.append( (parent, order[disc[v]:disc[v]+size[v]]) )
+
+        # the rest of the component, for cut vertices c other than the root: all but c and its separated subtrees
+        component = order[start:]
+        total = subtree_population[root]
+        for c in component:
+            if c != root and separated_population[c] > 0 and total - pop[c] - separated_population[c] < L:
+                inside = set(order[disc[c]:disc[c]+size[c]])
+                rest = [ v for v in component if v not in inside ]
+                for w in adjacency[c]:
+                    if disc[w] > disc[c] and low[w] < disc[c]: # child subtree that reaches above c
+                        rest.extend(order[disc[w]:disc[w]+size[w]])
+                pieces.append( (c, rest) )
+    return pieces
+
+
+# The reduced graph, after merging small pieces into their cut vertices until there are none.
+#   Returns (reduced graph, parent), where parent[v] is the vertex of the reduced graph that vertex v belongs to.
+def reduce(graph, L):
+    parent = list(graph.nodes)
+    reduced = graph
+    while True:
+        pieces = small_pieces(reduced, L)
+        if not pieces:
+            return (reduced, parent)
+
+        # union-find over the vertices of the current graph
+        root = list(reduced.nodes)
+        def find(v):
+            while root[v] != v:
+                root[v] = root[root[v]]
+                v = root[v]
+            return v
+        for (c, piece) in pieces:
+            for v in piece:
+                (a, b) = (find(v), find(c))
+                if a != b:
+                    root[a] = b
+
+        # number the merged vertices in order of their first vertex
+        number = dict()
+        merged = [ number.setdefault(find(v), len(number)) for v in reduced.nodes ]
+        reduced = csrgraph.contract(reduced, merged)
+        parent = [ merged[parent[v]] for v in graph.nodes ]
+
+
+# districts (lists of vertices) of the original graph for districts of the reduced graph, and vice versa
+def expand(parent, districts):
+    label = dict()
+    for j in range(len(districts)):
+        for c in districts[j]:
+            label[c] = j
+    expanded = [ list() for district in districts ]
+    for v in range(len(parent)):
+        if parent[v] in label:
+            expanded[label[parent[v]]].append(v)
+    return expanded
+
+
+def contract(parent, districts):
+    return [ sorted({ parent[v] for v in district }) for district in districts ]
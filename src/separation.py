@@ -1,115 +1,309 @@
 import gurobipy as gp
-from gurobipy import GRB 
+from gurobipy import GRB
 
-import networkx as nx
+import heapq
+import collections
 
-def find_fischetti_separator(DG, component, b):
-    neighbors_component = [False for i in DG.nodes]
-    for i in nx.node_boundary(DG, component, None):
-        neighbors_component[i] = True
-    
-    visited = [False for i in DG.nodes]
+import csrgraph
+
+# limits for separating fractional solutions at MIPNODE (user cuts)
+max_cuts_per_round = 10 # cuts added per callback
+max_cuts_per_node = 30 # cuts added over all rounds at the same branch-and-bound node
+max_roots_per_round = 10 # hess: centers (largest X[j,j] first) tried per callback
+min_violation = 0.01 # only add cuts that are violated by at least this much
+
+def find_fischetti_separator(graph, component, b):
+    in_component = set(component)
+
+    neighbors_component = set()
+    for i in component:
+        for j in graph.neighbors(i):
+            if j not in in_component:
+                neighbors_component.add(j)
+
+    visited = [False for i in graph.nodes]
     child = [b]
     visited[b] = True
-    
+
     while child:
         parent = child
         child = []
         for i in parent:
-            if not neighbors_component[i]:
-                for j in DG.neighbors(i):
+            if i not in neighbors_component:
+                for j in graph.neighbors(i):
                     if not visited[j]:
                         child.append(j)
                         visited[j] = True
-    
-    C = [ i for i in DG.nodes if neighbors_component[i] and visited[i] ]
+
+    C = sorted( i for i in neighbors_component if visited[i] )
     return C
 
 
+# components of every district, found in one sweep over the graph using array-based labeling.
+# district[v] is the district label of vertex v (or None if unassigned).
+# Returns { j : list of components of district j }, each component a list of vertices
+def district_components(graph, district):
+    adjacency = graph.adjacency
+    labeled = [False for i in graph.nodes]
+    components = dict()
+    for v in graph.nodes:
+        j = district[v]
+        if j is None or labeled[v]:
+            continue
+        labeled[v] = True
+        component = [v]
+        for i in component: # component grows while we scan it
+            for u in adjacency[i]:
+                if not labeled[u] and district[u] == j:
+                    labeled[u] = True
+                    component.append(u)
+        components.setdefault(j, []).append(component)
+    return components
+
+
+# continue a population-weighted Dijkstra search: dist[v] is the population of a shortest path from the source
+#   to v (counting both ends), and heap holds (dist[v],v) for vertices that still need to be expanded.
+#   Vertices with blocked[v] get a distance but are not expanded. Distances above U are not kept.
+def expand_distances(graph, dist, heap, blocked, U):
+    adjacency = graph.adjacency
+    pop = graph.pop
+    while heap:
+        (d, v) = heapq.heappop(heap)
+        if d > dist[v] or blocked[v]:
+            continue
+        for u in adjacency[v]:
+            du = d + pop[u]
+            if du <= U and du < dist.get(u, du+1):
+                dist[u] = du
+                heapq.heappush(heap, (du, u))
+
+
+# find violated length-U a,b-separator inequalities for the integer solution xval.
+# Returns list of (a,b,j,C), meaning district j should not contain both a and b unless it contains a vertex from C
+def find_lcuts(graph, population, U, base, k, xval):
+    if base == 'labeling':
+        district_labels = [j for j in range(k)]
+    elif base == 'hess':
+        district_labels = [j for j in graph.nodes if xval[j,j] > 0.5]
+
+    district = [None for i in graph.nodes]
+    for j in district_labels:
+        for v in graph.nodes:
+            if xval[v,j] > 0.5:
+                district[v] = j
+    components = district_components(graph, district)
+
+    in_C = [False for i in graph.nodes] # local buffer: which vertices are "removed" from the graph
+    cuts = list()
+
+    for j in district_labels:
+
+        # nothing to separate if the district is connected
+        if len(components.get(j, [])) <= 1:
+            continue
+
+        # what shall we deem as the "root" of this district? call it b
+        if base == 'hess':
+            b = j
+        elif base == 'labeling':
+            max_cp = 0
+            max_component = []
+
+            for component in components[j]:
+                cp = sum(population[v] for v in component)
+                if max_cp < cp:
+                    max_cp = cp
+                    max_component = component
+
+            # find some vertex "b" that has largest population in this component (ties go to smallest index)
+            maxpb = max(population[v] for v in max_component)
+            b = min( v for v in max_component if population[v] == maxpb )
+
+        for component in components[j]:
+
+            if b in component:
+                continue
+
+            # find some vertex "a" that has largest population in this component (ties go to smallest index)
+            maxp = max(population[v] for v in component)
+            a = min( v for v in component if population[v] == maxp )
+
+            # get minimal a,b-separator
+            C = find_fischetti_separator(graph, component, b)
+
+            # make it a minimal *length-U* a,b-separator. "remove" C from graph
+            for c in C:
+                in_C[c] = True
+            
+            # distances from a and from b in G-C. Vertices of C are reached but not passed through
+            dist_a = { a : population[a] }
+            heap_a = [ (population[a], a) ]
+            expand_distances(graph, dist_a, heap_a, in_C, U)
+            dist_b = { b : population[b] }
+            heap_b = [ (population[b], b) ]
+            expand_distances(graph, dist_b, heap_b, in_C, U)
+            
+            # is C\{c} a length-U a,b-separator still? If so, remove c from C.
+            # G-C has no a,b-path with population at most U, so any such path in G-(C\{c}) goes through c.
+            minC = []
+            for c in C:
+                
+                if c in dist_a and c in dist_b and dist_a[c] + dist_b[c] - population[c] <= U:
+                    # keep c in C
+                    minC.append(c)
+                else:
+                    # c was not needed in the cut C. Add c back to graph, and update distances through it
+                    in_C[c] = False
+                    if c in dist_a:
+                        heapq.heappush(heap_a, (dist_a[c], c))
+                        expand_distances(graph, dist_a, heap_a, in_C, U)
+                    if c in dist_b:
+                        heapq.heappush(heap_b, (dist_b[c], c))
+                        expand_distances(graph, dist_b, heap_b, in_C, U)
+            
+            # reset the buffer for the next component
+            for c in minC:
+                in_C[c] = False
+            
+            cuts.append( (a,b,j,minC) )
+
+    return cuts
+
+
+# minimum weight vertex cut between a and b in G[H], where H is a set of vertices containing a and b.
+#   Uses max flow (Edmonds-Karp) on the split graph: vertex v becomes arc (v,'in')->(v,'out') of capacity weight[v].
+#   Stops early, returning None, once the flow reaches limit. Otherwise returns the vertices of a minimum cut.
+def min_weight_vertex_cut(graph, H, weight, a, b, limit):
+    infinity = float('inf')
+    capacity = collections.defaultdict(dict)
+    for v in H:
+        capacity[(v,'in')][(v,'out')] = infinity if v in (a,b) else weight[v]
+        capacity[(v,'out')][(v,'in')] = 0
+        for u in graph.neighbors(v):
+            if u in H:
+                capacity[(v,'out')][(u,'in')] = infinity
+                capacity[(u,'in')].setdefault((v,'out'), 0)
+
+    source = (a,'out')
+    sink = (b,'in')
+    flow = 0
+    while True:
+        # find shortest augmenting path with BFS
+        previous = { source : None }
+        queue = collections.deque([source])
+        while queue and sink not in previous:
+            x = queue.popleft()
+            for (y, cap) in capacity[x].items():
+                if cap > 1e-9 and y not in previous:
+                    previous[y] = x
+                    queue.append(y)
+        if sink not in previous:
+            break
+        
+        path = [sink]
+        while previous[path[-1]] is not None:
+            path.append(previous[path[-1]])
+        path.reverse()
+        bottleneck = min( capacity[path[t]][path[t+1]] for t in range(len(path)-1) )
+        for t in range(len(path)-1):
+            capacity[path[t]][path[t+1]] -= bottleneck
+            capacity[path[t+1]][path[t]] += bottleneck
+        flow += bottleneck
+        if flow >= limit:
+            return None
+    
+    # cut vertices: those whose 'in' copy is reachable from source in residual graph, but 'out' copy is not
+    return sorted( v for v in H if (v,'in') in previous and (v,'out') not in previous )
+
+
+# find length-U a,b-separator inequalities violated by the fractional solution xval, at most max_cuts of them.
+# Returns list of (a,b,j,C), meaning district j should not contain both a and b unless it contains a vertex from C
+def find_fractional_lcuts(graph, population, U, base, k, xval, max_cuts):
+    if base == 'labeling':
+        # root each district j at the vertex b with largest X[b,j]
+        roots = list()
+        for j in range(k):
+            maxx = max( xval[v,j] for v in graph.nodes )
+            roots.append( (j, min( v for v in graph.nodes if xval[v,j] == maxx )) )
+    elif base == 'hess':
+        # district j is rooted at its center b=j; only the likeliest centers are tried
+        roots = [ (j, j) for j in graph.nodes if xval[j,j] > min_violation ]
+        roots.sort(key=lambda jb: -xval[jb[0],jb[0]])
+        roots = roots[:max_roots_per_round]
+    
+    cuts = list()
+    for (j, b) in roots:
+        
+        # the inequality for a is violated by xval[a,j] + offset - (weight of C)
+        offset = xval[b,j] - 1 if base == 'labeling' else 0
+        candidates = [ a for a in graph.nodes if a != b and xval[a,j] + offset > min_violation ]
+        candidates.sort(key=lambda a: -xval[a,j])
+        
+        dist_b = csrgraph.dijkstra(graph, b, U-population[b])
+        neighbors_b = set(graph.neighbors(b))
+        weight = { v : xval[v,j] for v in dist_b }
+        
+        for a in candidates[:max_cuts]:
+            if a in neighbors_b:
+                continue
+            
+            # H = vertices on some a,b-path with population at most U.
+            # Any a,b-vertex cut in G[H] is a length-U a,b-separator
+            dist_a = csrgraph.dijkstra(graph, a, U-population[a])
+            H = { v for v in dist_a if v in dist_b and population[a] + dist_a[v] + dist_b[v] + population[b] - population[v] <= U }
+            if b not in H:
+                C = []
+            else:
+                C = min_weight_vertex_cut(graph, H, weight, a, b, xval[a,j] + offset - min_violation)
+                if C is None:
+                    continue
+            
+            cuts.append( (a,b,j,C) )
+            if len(cuts) >= max_cuts:
+                return cuts
+    
+    return cuts
+
+
 def lcut_separation_generic(m, where):
     if where == GRB.Callback.MIPSOL:
         m._numCallbacks += 1
         xval = m.cbGetSolution(m._X)
-        DG = m._DG
-        U = m._U
         base = m._base
-        population = m._population
-        k = m._k
+
+        for (a,b,j,minC) in find_lcuts(m._graph, m._population, m._U, base, m._k, xval):
+            # add lazy cut
+            if base == 'hess':
+                m.cbLazy( m._X[a,b] <= gp.quicksum(m._X[c,b] for c in minC) )
+            elif base == 'labeling':
+                m.cbLazy( m._X[a,j] + m._X[b,j] <= 1 + gp.quicksum(m._X[c,j] for c in minC) )
+            m._numLazyCuts += 1
+
+    elif where == GRB.Callback.MIPNODE and m._fractional:
+        if m.cbGet(GRB.Callback.MIPNODE_STATUS) != GRB.OPTIMAL:
+            return
         
-        if base == 'labeling':
-            district_labels = [j for j in range(k)]
-        elif base == 'hess':
-            district_labels = [j for j in DG.nodes if xval[j,j] > 0.5]
-               
-        for j in district_labels:
-            
-            # vertices assigned to this district (label j)
-            S = [v for v in DG.nodes if xval[v,j] > 0.5]
-            
-            # what shall we deem as the "root" of this district? call it b
+        # limit the number of cuts per round and per branch-and-bound node
+        node = m.cbGet(GRB.Callback.MIPNODE_NODCNT)
+        if node != m._cutNode:
+            m._cutNode = node
+            m._cutsAtNode = 0
+        max_cuts = min(max_cuts_per_round, max_cuts_per_node - m._cutsAtNode)
+        if max_cuts <= 0:
+            return
+        
+        xval = m.cbGetNodeRel(m._X)
+        base = m._base
+
+        cuts = find_fractional_lcuts(m._graph, m._population, m._U, base, m._k, xval, max_cuts)
+        if not cuts:
+            # nothing violated: skip the later rounds at this node
+            m._cutsAtNode = max_cuts_per_node
+        for (a,b,j,C) in cuts:
+            # add user cut
             if base == 'hess':
-                b = j
+                m.cbCut( m._X[a,b] <= gp.quicksum(m._X[c,b] for c in C) )
             elif base == 'labeling':
-                max_cp = 0
-                max_component = []
-                
-                for component in nx.strongly_connected_components(DG.subgraph(S)):
-                    if max_cp < sum(population[v] for v in component):
-                        max_cp = sum(population[v] for v in component)
-                        max_component = component
-                    
-                # find some vertex "b" that has largest population in this component
-                maxpb = max(population[v] for v in max_component)
-                maxpb_vertices = [ v for v in max_component if population[v] == maxpb ]
-                b = maxpb_vertices[0]  
-            
-            for component in nx.strongly_connected_components(DG.subgraph(S)):
-                
-                if b in component: 
-                    continue
-                
-                # find some vertex "a" that has largest population in this component
-                maxp = max(population[v] for v in component)
-                maxp_vertices = [ v for v in component if population[v] == maxp ]
-                a = maxp_vertices[0]  
-                    
-                # get minimal a,b-separator
-                C = find_fischetti_separator(DG, component, b)
-                
-                # make it a minimal *length-U* a,b-separator
-                for (u,v) in DG.edges():
-                    DG[u][v]['lcutweight'] = population[u]   
-                    
-                # "remove" C from graph
-                for c in C:
-                    for node in DG.neighbors(c):
-                        DG[c][node]['lcutweight'] = U+1
-                
-                # is C\{c} a length-U a,b-separator still? If so, remove c from C
-                drop_from_C = []
-                for c in C:
-                    
-                    # temporarily add c back to graph (i.e., "remove" c from cut C)
-                    for node in DG.neighbors(c):
-                        DG[c][node]['lcutweight'] = population[c]
-                    
-                    # what is distance from a to b in G-C ?
-                    distance_from_a = nx.single_source_dijkstra_path_length(DG, a, weight='lcutweight')
-                    
-                    if distance_from_a[b] + population[b] > U:
-                        # c was not needed in the cut C. delete c from C
-                        drop_from_C.append(c)
-                    else:
-                        # keep c in C. revert arc weights back to "infinity"
-                        for node in DG.neighbors(c):
-                            DG[c][node]['lcutweight'] = U+1
-                    
-                # add lazy cut
-                minC = [c for c in C if c not in drop_from_C ]
-                if base == 'hess':
-                    m.cbLazy( m._X[a,b] <= gp.quicksum(m._X[c,b] for c in minC) )    
-                elif base == 'labeling':
-                    m.cbLazy( m._X[a,j] + m._X[b,j] <= 1 + gp.quicksum(m._X[c,j] for c in minC) )
-                m._numLazyCuts += 1
-
-        
\ No newline at end of file
+                m.cbCut( m._X[a,j] + m._X[b,j] <= 1 + gp.quicksum(m._X[c,j] for c in C) )
+            m._numUserCuts += 1
+            m._cutsAtNode += 1
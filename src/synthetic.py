@@ -0,0 +1,68 @@
+import math
+import random
+import numpy as np
+
+import csrgraph
+
+# Synthetic instances for benchmarks: planar dual graphs with populations, from county scale (~100 vertices)
+#   to tract scale (~5000 vertices), and random districting plans on them.
+#   grid            rows x cols grid graph (each land unit touches the units above, below, left, and right)
+#   triangulated    the grid plus one diagonal per cell, in a random direction (a planar triangulation)
+#   Populations are lognormal around mean_population. Everything depends only on the seed.
+#   Random plans on these graphs come from local_search.random_plan.
+
+kinds = ['grid', 'triangulated']
+
+
+# the edges of the instance of the given kind with about n vertices, and its number of vertices
+def grid_edges(kind, n, rng):
+    rows = max(2, round(math.sqrt(n)))
+    cols = max(2, n // rows)
+    vertex = lambda r, c: r * cols + c
+    edges = list()
+    for r in range(rows):
+        for c in range(cols):
+            if c + 1 < cols:
+                edges.append( (vertex(r,c), vertex(r,c+1)) )
+            if r + 1 < rows:
+                edges.append( (vertex(r,c), vertex(r+1,c)) )
+            if kind == 'triangulated' and r + 1 < rows and c + 1 < cols:
+                if rng.random() < 0.5:
+                    edges.append( (vertex(r,c), vertex(r+1,c+1)) )
+                else:
+                    edges.append( (vertex(r,c+1), vertex(r+1,c)) )
+    return (edges, rows * cols)
+
+
+# read-only graph (csrgraph.CSRGraph) of the given kind, with about n vertices and lognormal populations
+def generate(kind, n, seed=0, mean_population=4000, sigma=0.5):
+    if kind not in kinds:
+        raise ValueError("unknown kind of synthetic graph: " + str(kind))
+    rng = random.Random(seed)
+    (edges, n) = grid_edges(kind, n, rng)
+
+    neighbors = [ list() for i in range(n) ]
+    for (u,v) in edges:
+        neighbors[u].append(v)
+        neighbors[v].append(u)
+    indptr = [0]
+    indices = list()
+    for i in range(n):
+        indices.extend(sorted(neighbors[i]))
+        indptr.append(len(indices))
+
+    # lognormal with mean mean_population; every unit has at least one person
+    mu = math.log(mean_population) - sigma**2 / 2
+    population = [ max(1, round(rng.lognormvariate(mu, sigma))) for i in range(n) ]
+    geoid = [ kind + str(i) for i in range(n) ]
+    return csrgraph.CSRGraph.from_arrays(np.array(indptr), np.array(indices), np.array(population),
+                                         np.array(geoid, dtype=str), np.array(geoid, dtype=str), np.array(edges).reshape(-1,2))
+
+
+# The plan with a fraction of its vertices moved to random other districts, leaving most districts
+#   disconnected (like the integer solutions that lcut separation sees before contiguity is imposed)
+def scatter(label, k, fraction, rng):
+    label = list(label)
+    for v in rng.sample(range(len(label)), round(fraction * len(label))):
+        label[v] = (label[v] + rng.randrange(1, k)) % k
+    return label
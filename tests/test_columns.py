@@ -0,0 +1,93 @@
+import itertools
+import math
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import columns
+import csrgraph
+import local_search
+import synthetic
+
+# Branch-and-price (columns.py) on small synthetic grids, checked against brute force, and with time limits
+#   so short that column generation cannot converge
+
+
+def instance(n, k, deviation, seed=0):
+    graph = synthetic.generate('grid', n, seed)
+    total = sum(graph.pop)
+    return (graph, k, math.ceil((1-deviation/2)*total/k), math.floor((1+deviation/2)*total/k))
+
+
+# fewest cut edges of a plan with two districts, by enumerating the district of vertex 0
+def brute_force(graph, L, U, connected):
+    best = None
+    others = list(graph.nodes)[1:]
+    for size in range(len(others)):
+        for rest in itertools.combinations(others, size):
+            D = [0] + list(rest)
+            complement = [ v for v in graph.nodes if v not in D ]
+            plan = [ D, complement ]
+            if any( not L <= sum(graph.pop[v] for v in district) <= U for district in plan ):
+                continue
+            if connected and not all( csrgraph.is_connected(graph, district) for district in plan ):
+                continue
+            cut = local_search.cut_edges(graph, plan)
+            if best is None or cut < best:
+                best = cut
+    return best
+
+
+def check_plan(bp, graph, k, L, U, connected):
+    (obj, districts) = bp.incumbent
+    assert sorted( v for district in districts for v in district ) == list(graph.nodes)
+    assert len(districts) == k
+    for district in districts:
+        assert L <= sum(graph.pop[v] for v in district) <= U
+        assert not connected or csrgraph.is_connected(graph, district)
+    assert local_search.cut_edges(graph, districts) == obj
+
+
+@pytest.mark.parametrize('connected', [True, False])
+def test_optimal_on_small_grid(connected):
+    (graph, k, L, U) = instance(12, 2, 0.2)
+    optimum = brute_force(graph, L, U, connected)
+    assert optimum is not None
+    bp = columns.solve(graph, k, L, U, connected, [], 60)
+    assert bp.closed
+    check_plan(bp, graph, k, L, U, connected)
+    assert bp.incumbent[0] == optimum
+    assert bp.bound == optimum
+    assert bp.root_bound <= optimum + columns.tolerance
+
+
+# a pricing MIP stopped at its time limit is not a proof that no column is left
+def test_pricing_time_limit(monkeypatch):
+    monkeypatch.setattr(columns, 'pricing_seeds', 0)
+    monkeypatch.setattr(columns, 'pricing_time_limit', 0)
+    (graph, k, L, U) = instance(12, 2, 0.2)
+    optimum = brute_force(graph, L, U, True)
+    bp = columns.solve(graph, k, L, U, True, [], 60)
+    assert bp.closed
+    assert bp.incumbent[0] == optimum
+    assert bp.bound == optimum
+
+
+# stopped at the deadline (before or within the root), with valid bounds
+@pytest.mark.parametrize('time_limit', [0, 0.2, 1])
+def test_deadline(time_limit):
+    (graph, k, L, U) = instance(100, 4, 0.1)
+    bp = columns.solve(graph, k, L, U, True, [], time_limit)
+    if time_limit == 0:
+        assert not bp.closed and bp.root_bound is None
+    assert bp.bound >= 0
+    if bp.root_bound is not None:
+        assert bp.root_bound <= bp.bound + columns.tolerance
+    if bp.incumbent is not None:
+        check_plan(bp, graph, k, L, U, True)
+        assert bp.bound <= bp.incumbent[0]
+    if bp.closed:
+        assert bp.bound == bp.incumbent[0]